@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+ldtpd cold start benchmark: import time of the daemon modules and
+XMLRPCLdtpd instantiation, each run in a fresh interpreter.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See "COPYING" in the source distribution for more information.
+
+Headers in this file shall remain intact.
+
+Usage:
+
+    python3 benchmarks/bench_startup.py --repeat 10
+    # Another checkout, eg: before a change
+    python3 benchmarks/bench_startup.py --tree /tmp/ldtp-old
+
+Without a desktop session, pass --synthetic to use the memory
+accessibility backend and placeholder gi modules, as benchmarks/run.py
+does. Placeholder modules import instantly, so Gtk / Wnck load time
+is not part of the synthetic numbers.
+"""
+
+import os
+import sys
+import json
+import subprocess
+from optparse import OptionParser
+
+_path = os.path.dirname(os.path.abspath(__file__))
+
+# Child process, prints the measured milliseconds as JSON
+_child = '''
+import sys, time
+sys.path[:0] = [%(tree)r, %(bench)r]
+if %(synthetic)r:
+    import synthetic
+    synthetic.install_gi_stubs()
+    from ldtpd.backends import set_backend
+    set_backend('memory')
+results = {}
+start = time.perf_counter()
+import ldtpd.core
+results['import ldtpd.core'] = time.perf_counter() - start
+start = time.perf_counter()
+import ldtpd.xmlrpc_daemon
+results['import ldtpd.xmlrpc_daemon'] = time.perf_counter() - start
+start = time.perf_counter()
+ldtpd.xmlrpc_daemon.XMLRPCLdtpd()
+results['first XMLRPCLdtpd()'] = time.perf_counter() - start
+start = time.perf_counter()
+for i in range(10):
+    ldtpd.xmlrpc_daemon.XMLRPCLdtpd()
+results['next XMLRPCLdtpd()'] = (time.perf_counter() - start) / 10
+start = time.perf_counter()
+from ldtpd.keypress_actions import KeyComboAction
+KeyComboAction('<ctrl>s')
+results['first key name'] = time.perf_counter() - start
+print(json.dumps(dict((name, value * 1000)
+                      for name, value in results.items())))
+'''
+
+def _run(tree, synthetic):
+    code = 'import json\n' + _child % {'tree' : tree, 'bench' : _path,
+                                      'synthetic' : synthetic}
+    output = subprocess.check_output([sys.executable, '-c', code],
+                                     cwd='/')
+    return json.loads(output.decode('utf-8').strip().split('\n')[-1])
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--tree', default=os.path.dirname(_path),
+                      help='ldtp source tree to measure [%default]')
+    parser.add_option('--repeat', type='int', default=10,
+                      help='Fresh interpreters to run [%default]')
+    parser.add_option('--synthetic', action='store_true', default=False,
+                      help='Use the memory backend and placeholder gi modules')
+    (options, args) = parser.parse_args()
+
+    samples = {}
+    for i in range(options.repeat):
+        for name, value in _run(options.tree, options.synthetic).items():
+            samples.setdefault(name, []).append(value)
+    for name, values in samples.items():
+        values.sort()
+        print('%-28s %10.3f ms median %10.3f ms min' % \
+                  (name, values[len(values) // 2], values[0]))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+ldtpd hot path benchmarks, against a synthetic tree served by the
+memory accessibility backend. No desktop session is needed, twisted
+must be installed.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See "COPYING" in the source distribution for more information.
+
+Headers in this file shall remain intact.
+
+Usage:
+
+    python3 benchmarks/run.py --sizes 1000,10000 --save baseline.json
+    # ... change code ...
+    python3 benchmarks/run.py --sizes 1000,10000 --compare baseline.json
+
+With --compare, exit status is 1 if any benchmark median is slower
+than the baseline by more than --tolerance (default 25%). Compare
+runs on the same machine only.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import platform
+from optparse import OptionParser
+
+_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_path))
+sys.path.insert(0, _path)
+
+import synthetic
+
+synthetic.install_gi_stubs()
+
+from ldtpd.backends import set_backend
+backend = set_backend('memory')
+
+from ldtpd.core import Ldtpd
+from ldtpd.utils import Utils
+
+def _engine(apps):
+    """
+    New Ldtpd instance, on a fresh desktop
+    """
+    backend.load(apps)
+    # Application cache is class level
+    Utils.cached_apps = None
+    engine = Ldtpd()
+    # Don't sleep on lookup failures
+    engine._gui_timeout = 1
+    engine._obj_timeout = 1
+    return engine
+
+def _measure(func, repeat):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {'min' : samples[0],
+            'median' : samples[len(samples) // 2],
+            'mean' : sum(samples) / len(samples),
+            'runs' : repeat}
+
+def _cases(shapes, sizes, windows):
+    """
+    Generate (benchmark name, setup function) pairs, setup returns
+    the function to be timed
+    """
+    for shape in shapes:
+        for size in sizes:
+            def appmap(shape=shape, size=size):
+                apps, names = synthetic.desktop(shape, size)
+                engine = _engine(apps)
+                gui, name = engine._get_window_handle(names['window'])
+                return lambda: engine._appmap_pairs(gui, name, True)
+            yield 'appmap/%s/%d' % (shape, size), appmap
+
+            def get_object(shape=shape, size=size):
+                apps, names = synthetic.desktop(shape, size)
+                engine = _engine(apps)
+                # Warm up the appmap cache
+                engine._get_object(names['window'], names['object'], False)
+                return lambda: engine._get_object(names['window'],
+                                                  names['object'], False)
+            yield 'get_object/%s/%d' % (shape, size), get_object
+
+            def getobjectlist(shape=shape, size=size):
+                apps, names = synthetic.desktop(shape, size)
+                engine = _engine(apps)
+                engine.getobjectlist(names['window'])
+                return lambda: engine.getobjectlist(names['window'])
+            yield 'getobjectlist/%s/%d' % (shape, size), getobjectlist
+
+            if shape == 'table':
+                def selectrow(size=size):
+                    apps, names = synthetic.desktop('table', size)
+                    engine = _engine(apps)
+                    engine.getrowcount(names['window'], names['object'])
+                    return lambda: engine.selectrow(names['window'],
+                                                    names['object'],
+                                                    names['row'])
+                yield 'selectrow/table/%d' % size, selectrow
+
+            if shape == 'menu':
+                def menu(size=size):
+                    apps, names = synthetic.desktop('menu', size)
+                    engine = _engine(apps)
+                    engine._get_menu_hierarchy(names['window'], names['menu'])
+                    return lambda: engine._get_menu_hierarchy(names['window'],
+                                                              names['menu'])
+                yield 'menu_hierarchy/menu/%d' % size, menu
+
+    def window(windows=windows):
+        apps, names = synthetic.desktop('wide', 10, windows)
+        engine = _engine(apps)
+        return lambda: engine._get_window_handle(names['window'])
+    yield 'window/%d' % windows, window
+
+def _compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        old = baseline[name]['median']
+        new = result['median']
+        ratio = new / old if old else 1.0
+        status = 'ok'
+        if ratio > 1 + tolerance:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            status = 'improved'
+        print('%-32s %10.3f %10.3f %7.2fx %s' % (name, old, new, ratio, status))
+    return regressions
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--shapes', default=','.join(synthetic.SHAPES),
+                      help='Comma separated tree shapes [%default]')
+    parser.add_option('--sizes', default='1000,10000',
+                      help='Comma separated node counts [%default]')
+    parser.add_option('--windows', type='int', default=300,
+                      help='Windows on the desktop, for window lookup '
+                      '[%default]')
+    parser.add_option('--repeat', type='int', default=5,
+                      help='Runs per benchmark [%default]')
+    parser.add_option('--filter', default=None,
+                      help='Run benchmarks matching this regex')
+    parser.add_option('--save', default=None,
+                      help='Write results as JSON to file')
+    parser.add_option('--compare', default=None,
+                      help='Compare against a JSON file written by --save')
+    parser.add_option('--tolerance', type='float', default=0.25,
+                      help='Allowed slow down ratio with --compare '
+                      '[%default]')
+    (options, args) = parser.parse_args()
+
+    shapes = options.shapes.split(',')
+    sizes = [int(size) for size in options.sizes.split(',')]
+    results = {}
+    for name, setup in _cases(shapes, sizes, options.windows):
+        if options.filter and not re.search(options.filter, name):
+            continue
+        results[name] = _measure(setup(), options.repeat)
+        print('%-32s %10.3f ms' % (name, results[name]['median']))
+
+    if options.save:
+        with open(options.save, 'w') as fp:
+            json.dump({'python' : platform.python_version(),
+                       'platform' : platform.platform(),
+                       'date' : time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'results' : results}, fp, indent=1, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as fp:
+            baseline = json.load(fp)['results']
+        print('\n%-32s %10s %10s %8s' % ('benchmark', 'base ms',
+                                         'new ms', 'ratio'))
+        if _compare(results, baseline, options.tolerance):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
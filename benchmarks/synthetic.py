@@ -0,0 +1,204 @@
+"""
+Synthetic accessibility tree generator, for the ldtpd benchmarks.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See "COPYING" in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import sys
+import types
+
+SHAPES = ('wide', 'deep', 'table', 'menu')
+
+# Nesting depth of the deep shape, kept well under the recursion limit
+_deep_levels = 100
+# Columns of the table shape
+_table_columns = 5
+# Widgets per panel in the wide shape
+_panel_size = 100
+# Items per menu in the menu shape
+_menu_size = 20
+
+def _node(role, name='', children=None, **kwargs):
+    node = {'role' : role, 'name' : name}
+    if children:
+        node['children'] = children
+    node.update(kwargs)
+    return node
+
+def _button(name):
+    return _node('push_button', name, actions=['click'])
+
+def _wide(nodes):
+    panels = []
+    count = 0
+    index = 0
+    while count < nodes:
+        size = max(1, min(_panel_size, nodes - count - 1))
+        panels.append(_node('panel', '', [_button('Button %d' % (index + i)) \
+                                              for i in range(size)]))
+        count += size + 1
+        index += size
+    return panels, {'object' : 'btnButton%d' % (index - 1)}
+
+def _deep(nodes):
+    per_level = max(1, nodes // _deep_levels - 1)
+    level = None
+    for depth in range(_deep_levels - 1, -1, -1):
+        children = [_node('label', 'Label %d-%d' % (depth, i)) \
+                        for i in range(per_level)]
+        if level:
+            children.append(level)
+        level = _node('filler', '', children)
+    # Deepest node is the last label of the last level
+    return [level], {'object' : 'lblLabel%d-%d' % (_deep_levels - 1,
+                                                   per_level - 1)}
+
+def _table(nodes):
+    rows = max(1, nodes // _table_columns)
+    cells = [_node('table_cell', 'Row %d Col %d' % (row, column),
+                   actions=['activate'],
+                   states=['enabled', 'visible', 'showing', 'selectable'])
+             for row in range(rows) for column in range(_table_columns)]
+    table = _node('table', 'Data', cells, columns=_table_columns)
+    return [_node('scroll_pane', '', [table])], \
+        {'object' : 'tblData',
+         'row' : 'Row %d Col %d' % (rows - 1, _table_columns - 1)}
+
+def _menu(nodes):
+    menus = []
+    count = 0
+    index = 0
+    while count < nodes:
+        items = [_node('menu_item', 'Item %d-%d' % (index, i),
+                       actions=['click']) for i in range(_menu_size - 2)]
+        # One sub menu per menu
+        items.append(_node('menu', 'More %d' % index,
+                           [_node('menu_item', 'Sub %d' % index,
+                                  actions=['click'])], actions=['click']))
+        menus.append(_node('menu', 'Menu %d' % index, items,
+                           actions=['click']))
+        count += _menu_size + 1
+        index += 1
+    last = index - 1
+    return [_node('menu_bar', '', menus)], \
+        {'object' : 'mnuItem%d-%d' % (last, _menu_size - 3),
+         'menu' : 'mnuMenu%d;mnuMore%d;mnuSub%d' % (last, last, last)}
+
+def desktop(shape, nodes, windows=1):
+    """
+    Generate a desktop, as list of application trees
+
+    @param shape: wide, deep, table or menu
+    @type shape: string
+    @param nodes: Approximate number of accessible in the target window
+    @type nodes: integer
+    @param windows: Total number of windows on the desktop, the target
+    window being the last one
+    @type windows: integer
+
+    @return: applications, names of the target window and objects
+    @rtype: list, dictionary
+    """
+    children, names = globals()['_%s' % shape](nodes)
+    apps = []
+    for i in range(windows - 1):
+        # Small windows, in separate applications
+        apps.append(_node('application', 'app%d' % i, [
+                    _node('frame', 'Window %d' % i, [
+                            _node('panel', '', [_button('OK'),
+                                                _button('Cancel'),
+                                                _node('text', 'Entry',
+                                                      text='')])])]))
+    apps.append(_node('application', 'bench', [
+                _node('frame', 'Window %d' % (windows - 1), children)]))
+    names['window'] = 'frmWindow%d' % (windows - 1)
+    return apps, names
+
+class _Stub:
+    """
+    Accepts any attribute access or call
+    """
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return _Stub()
+
+    def __call__(self, *args, **kwargs):
+        return _Stub()
+
+    def __iter__(self):
+        return iter(())
+
+    def __bool__(self):
+        return False
+
+class _GObject:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def emit(self, *args):
+        pass
+
+    def connect(self, *args):
+        return 0
+
+class _RootWindow:
+    def get_geometry(self):
+        return (0, 0, 1920, 1080)
+
+def _stub_module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__getattr__ = lambda attr: _Stub()
+    for key, value in attrs.items():
+        setattr(module, key, value)
+    return module
+
+def install_gi_stubs():
+    """
+    Install placeholder gi modules, only if GTK / Wnck introspection
+    is not available
+
+    @return: True if stubs were installed
+    @rtype: boolean
+    """
+    try:
+        import gi
+        gi.require_version('Gtk', '3.0')
+        gi.require_version('Gdk', '3.0')
+        gi.require_version('Wnck', '3.0')
+        from gi.repository import Gtk, Gdk, Wnck, GLib, GObject
+        return False
+    except Exception:
+        pass
+    repository = _stub_module('gi.repository')
+    repository.Gtk = _stub_module('gi.repository.Gtk', _version='3.0')
+    repository.Gdk = _stub_module('gi.repository.Gdk',
+                                  get_default_root_window=_RootWindow)
+    repository.Wnck = _stub_module('gi.repository.Wnck')
+    repository.GLib = _stub_module('gi.repository.GLib',
+                                   timeout_add=lambda *args: 0,
+                                   idle_add=lambda *args: 0)
+    repository.GObject = _stub_module('gi.repository.GObject',
+                                      GObject=_GObject,
+                                      SIGNAL_RUN_FIRST=1,
+                                      TYPE_NONE=None,
+                                      timeout_add=lambda *args: 0)
+    gi = _stub_module('gi', require_version=lambda *args: None,
+                      repository=repository)
+    sys.modules['gi'] = gi
+    sys.modules['gi.repository'] = repository
+    for name in ('Gtk', 'Gdk', 'Wnck', 'GLib', 'GObject'):
+        sys.modules['gi.repository.%s' % name] = getattr(repository, name)
+    return True
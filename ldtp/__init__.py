@@ -24,14 +24,16 @@ import re
 import sys
 import time
 import atexit
+import types
 import socket
 import logging
 import datetime
 import tempfile
 import warnings
+import functools
 import threading
 import traceback
-from base64 import b64decode
+from xmlrpc.client import Binary
 from fnmatch import translate as glob_trans
 
 path=path = os.path.dirname(__file__)
@@ -44,7 +46,10 @@ import client
 from client_exception import LdtpExecutionError
 
 _t = None
+_pollLogs = None
 _pollEvents = None
+_connected = False
+_connect_lock = threading.Lock()
 _file_logger = None
 _ldtp_debug = client._ldtp_debug
 _ldtp_windows_env = client._ldtp_windows_env
@@ -58,6 +63,24 @@ def setHost(host):
 def whoismyhost():
     return client._client._ServerProxy__host
 
+def cluster(hosts, concurrency=1, timeout=None):
+    """
+    Fan-out client, to run calls on several daemons concurrently
+
+    @param hosts: Host names, as host or host:port
+    @type hosts: list
+    @param concurrency: Maximum in-flight requests per host
+    @type concurrency: integer
+    @param timeout: Per call timeout in seconds, None to wait forever
+    @type timeout: float
+
+    @return: Cluster instance, eg: cluster(['vm1', 'vm2']).guiexist('*gedit*')
+    returns host to HostResult (result, fault, latency)
+    @rtype: object
+    """
+    from ldtp.fanout import Cluster
+    return Cluster(hosts, concurrency, timeout)
+
 LDTP_LOG_MEMINFO = 60
 LDTP_LOG_CPUINFO = 61
 logging.addLevelName(LDTP_LOG_MEMINFO, 'MEMINFO')
@@ -361,8 +384,11 @@ class PollEvents(threading.Thread):
                 break
         return True
 
+# imagecapture file name suffix, by format
+_capture_suffix = {'png' : '.png', 'jpeg' : '.jpg', 'raw' : '.ppm'}
+
 def imagecapture(window_name = None, out_file = None, x = 0, y = 0,
-                 width = None, height = None):
+                 width = None, height = None, format = 'png', quality = -1):
     """
     Captures screenshot of the whole desktop or given window
 
@@ -377,12 +403,18 @@ def imagecapture(window_name = None, out_file = None, x = 0, y = 0,
     @type width: integer
     @param height: height co-ordinate value
     @type height: integer
+    @param format: png, jpeg, or raw for uncompressed PPM
+    @type format: string
+    @param quality: png compression level, 0 - 9, 0 is the fastest,
+    or jpeg quality, 0 - 100, -1 for the default
+    @type quality: integer
 
     @return: screenshot filename
     @rtype: string
     """
     if not out_file:
-        out_file = tempfile.mktemp('.png', 'ldtp_')
+        out_file = tempfile.mktemp(_capture_suffix.get(format, '.png'),
+                                   'ldtp_')
     else:
         out_file = os.path.expanduser(out_file)
 
@@ -392,16 +424,103 @@ def imagecapture(window_name = None, out_file = None, x = 0, y = 0,
         height = -1
     if window_name == None:
         window_name = ''
-    data = _remote_imagecapture(window_name, x, y, width, height)
+    data = _remote_imagecapture(window_name, x, y, width, height,
+                                format, quality, True)
     f = open(out_file, 'wb')
-    try:
-        f.write(b64decode(data)) # Python 2
-    except TypeError:
-        f.write(b64decode(bytes(data,'utf-8'))) # Python 3
+    # xmlrpc Binary, image bytes in data
+    f.write(getattr(data, 'data', data))
     f.close()
 
     return out_file
 
+def uploadbaseline(baseline_id, image):
+    """
+    Store a baseline image in the daemon, for comparecapture. Upload
+    once, compare as often as needed.
+
+    @param baseline_id: Baseline name, an existing baseline is replaced
+    @type baseline_id: string
+    @param image: Image file name, eg: from imagecapture, or image bytes
+    @type image: string
+
+    @return: 1 on success.
+    @rtype: integer
+    """
+    if isinstance(image, str):
+        f = open(os.path.expanduser(image), 'rb')
+        image = f.read()
+        f.close()
+    return _remote_uploadbaseline(baseline_id, Binary(image))
+
+def comparecapture(window_name, baseline_id, region = None, tolerance = 0,
+                   mask = None, diff_image = None):
+    """
+    Capture the desktop, or a window, and compare it with a baseline
+    in the daemon, only the result is transferred
+
+    @param window_name: Window name to look for, either full name,
+    LDTP's name convention, or a Unix glob. None for the desktop.
+    @type window_name: string
+    @param baseline_id: Baseline name, from uploadbaseline
+    @type baseline_id: string
+    @param region: (x, y, width, height) captured, relative to the
+    window, None for the whole window
+    @type region: tuple
+    @param tolerance: Largest channel difference ignored, 0 - 255,
+    or (red, green, blue)
+    @type tolerance: integer
+    @param mask: (x, y, width, height) regions to ignore, relative to
+    the captured region
+    @type mask: list
+    @param diff_image: File name, written with a scaled down png of
+    the differences
+    @type diff_image: string
+
+    @return: percent of the pixels that differ, boxes of the
+    differing regions as [x, y, width, height], size of the capture,
+    and the diff_image file name in image, if requested. If the
+    capture and baseline sizes differ, percent is 100, with
+    size_mismatch and baseline_size, and no image.
+    @rtype: dict
+    """
+    result = _remote_comparecapture(window_name or '', baseline_id,
+                                    list(region or []), tolerance,
+                                    list(mask or []), bool(diff_image))
+    if diff_image and 'image' in result:
+        diff_image = os.path.expanduser(diff_image)
+        f = open(diff_image, 'wb')
+        f.write(getattr(result['image'], 'data', result['image']))
+        f.close()
+        result['image'] = diff_image
+    return result
+
+# dumpscreenrecording file name suffix, by format
+_recording_suffix = {'apng' : '.png', 'frames' : '.zip'}
+
+def dumpscreenrecording(out_file = None, format = 'apng'):
+    """
+    Save the screen recording, see startscreenrecorder
+
+    @param out_file: File name, default a temporary file
+    @type out_file: string
+    @param format: apng, an animated png, or frames, a zip of png
+    files and an index.json with the frame times
+    @type format: string
+
+    @return: recording filename
+    @rtype: string
+    """
+    if not out_file:
+        out_file = tempfile.mktemp(_recording_suffix.get(format, '.png'),
+                                   'ldtp_')
+    else:
+        out_file = os.path.expanduser(out_file)
+    data = _remote_dumpscreenrecording(format)
+    f = open(out_file, 'wb')
+    f.write(getattr(data, 'data', data))
+    f.close()
+    return out_file
+
 def wait(timeout=5):
     return _remote_wait(timeout)
 def waittillguiexist(window_name, object_name = '',
@@ -428,8 +547,9 @@ def doesrowexist(window_name, object_name, row_text, partial_match = False):
     return _remote_doesrowexist(window_name, object_name, row_text, partial_match)
 def getchild(window_name, child_name = '', role = '', parent = ''):
     return _remote_getchild(window_name, child_name, role, parent)
-def enterstring(window_name, object_name = '', data = ''):
-    return _remote_enterstring(window_name, object_name, data)
+def enterstring(window_name, object_name = '', data = '', mode = 'keys',
+                verify = False):
+    return _remote_enterstring(window_name, object_name, data, mode, verify)
 def setvalue(window_name, object_name, data):
     return _remote_setvalue(window_name, object_name, float(data))
 def grabfocus(window_name, object_name = ''):
@@ -446,11 +566,48 @@ def startprocessmonitor(process_name, interval = 2):
     return _remote_startprocessmonitor(process_name, interval)
 def gettextvalue(window_name, object_name, startPosition = 0, endPosition = 0):
     return unicode(_remote_gettextvalue(window_name, object_name, startPosition, endPosition))
+def gettextchunks(window_name, object_name, chunk_size = 65536):
+    """
+    Iterate over the text of an object, chunk_size characters at a
+    time, without holding the whole text
+
+    @param window_name: Window name to look for, either full name,
+    LDTP's name convention, or a Unix glob.
+    @type window_name: string
+    @param object_name: Object name to look for, either full name,
+    LDTP's name convention, or a Unix glob.
+    @type object_name: string
+    @param chunk_size: Characters per request
+    @type chunk_size: integer
+
+    @return: text chunks
+    @rtype: generator
+    """
+    length = gettextlength(window_name, object_name)
+    offset = 0
+    while offset < length:
+        chunk = gettextchunk(window_name, object_name, offset, chunk_size)
+        if not chunk:
+            # Text shrunk meanwhile
+            break
+        yield chunk
+        offset += len(chunk)
 def getcellvalue(window_name, object_name, row_index, column = 0):
     return _remote_getcellvalue(window_name, object_name, row_index, column)
 def getcellsize(window_name, object_name, row_index, column = 0):
     return _remote_getcellsize(window_name, object_name, row_index, column)
 def getobjectnameatcoords(waitTime = 0):
+    """
+    Get object name at the mouse pointer coordinates
+
+    @param waitTime: Wait time in seconds, before the lookup
+    @type waitTime: double
+
+    @return: window name and object name, or (None, None) if no
+    object. NOTE: the object name is a single name, the list of
+    candidate object names is no longer returned
+    @rtype: (string, string)
+    """
     return _remote_getobjectnameatcoords(waitTime)
 def maximizewindow(window_name = ''):
     return _remote_maximizewindow(window_name)
@@ -590,15 +747,6 @@ def windowuptime(window_name):
         return _start_time, _end_time
     return None
 
-_populateNamespace(globals())
-_pollEvents = PollEvents()
-_pollEvents.daemon = True
-_pollEvents.start()
-_pollLogs = PollLogs()
-_pollLogs.daemon = True
-_pollLogs.start()
-
-@atexit.register
 def _stop_thread():
    try:
       _pollLogs.stop()
@@ -606,4 +754,57 @@ def _stop_thread():
    except:
       pass
 
-atexit.register(client._client.kill_daemon)
+def _connect():
+    """
+    Populate the remote methods and start polling, on first use, so
+    that ldtp.aio and ldtp.fanout import this package without a call
+    to the daemon. NOTE: *NOT* for external use
+    """
+    global _connected, _pollEvents, _pollLogs
+    with _connect_lock:
+        if _connected:
+            return
+        _populateNamespace(globals())
+        _pollEvents = PollEvents()
+        _pollEvents.daemon = True
+        _pollEvents.start()
+        _pollLogs = PollLogs()
+        _pollLogs.daemon = True
+        _pollLogs.start()
+        atexit.register(_stop_thread)
+        atexit.register(client._client.kill_daemon)
+        _connected = True
+
+def _connecting(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _connected:
+            _connect()
+        return func(*args, **kwargs)
+    return wrapper
+
+# Functions, that don't need the remote methods
+_local_functions = frozenset(['setHost', 'whoismyhost', 'cluster',
+                              'addloghandler', 'removeloghandler', 'log',
+                              'startlog', 'stoplog', 'logFailures'])
+
+for _name, _value in list(globals().items()):
+    if not _name.startswith('_') and _name not in _local_functions and \
+            isinstance(_value, types.FunctionType) and \
+            _value.__module__ == __name__:
+        globals()[_name] = _connecting(_value)
+
+def __getattr__(name):
+    # Remote methods, and __all__ for 'from ldtp import *', are
+    # available once connected
+    if name.startswith('__') and name != '__all__':
+        raise AttributeError("module '%s' has no attribute '%s'" % \
+                                 (__name__, name))
+    _connect()
+    if name == '__all__':
+        return [key for key in globals().keys() if not key.startswith('_')]
+    try:
+        return globals()[name]
+    except KeyError:
+        raise AttributeError("module '%s' has no attribute '%s'" % \
+                                 (__name__, name))
@@ -0,0 +1,300 @@
+"""
+LDTP v2 asyncio client
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+
+Example:
+
+    import asyncio
+    from ldtp.aio import AsyncLdtpClient
+
+    async def main():
+        async with AsyncLdtpClient('desktop1') as d1, \\
+                AsyncLdtpClient('desktop2') as d2:
+            print(await asyncio.gather(d1.getwindowlist(),
+                                       d2.getwindowlist()))
+            await d1.onwindowcreate('*gedit*')
+            async for event_type, data in d1.events():
+                print(event_type, data)
+
+    asyncio.run(main())
+
+NOTE: importing ldtp.aio doesn't connect to the default daemon
+(LDTP_SERVER_ADDR), the ldtp package connects on first use.
+"""
+
+import os
+import asyncio
+import xmlrpc.client
+from ldtp.log import logger
+from ldtp.client_exception import LdtpExecutionError, ERROR_CODE
+
+_ldtp_debug = os.environ.get('LDTP_DEBUG', None)
+_ldtp_server_addr = os.environ.get('LDTP_SERVER_ADDR', 'localhost')
+_ldtp_server_port = os.environ.get('LDTP_SERVER_PORT', '4118')
+
+class _Method:
+    """
+    Awaitable remote method, returned by the AsyncLdtpClient
+    magic method dispatcher
+    """
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, name):
+        # Nested names, eg: system.listMethods
+        return _Method(self._client, '%s.%s' % (self._name, name))
+
+    def __call__(self, *args):
+        if _ldtp_debug:
+            logger.debug('%s(%s)' % (self._name, ', '.join(map(repr, args))))
+        return self._client._request(self._name, args)
+
+class _Connection:
+    """
+    Keep-alive HTTP/1.1 connection to ldtpd, NOTE: *NOT* for external use
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+        self.keep_alive = True
+
+    def close(self):
+        self.keep_alive = False
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+    async def post(self, host, handler, body):
+        self.writer.write(('POST %s HTTP/1.1\r\n'
+                           'Host: %s\r\n'
+                           'User-Agent: ldtp.aio\r\n'
+                           'Content-Type: text/xml\r\n'
+                           'Content-Length: %d\r\n'
+                           '\r\n' % (handler, host, len(body))).encode('latin-1')
+                          + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            # Server closed the idle connection
+            raise ConnectionResetError('Connection closed by ldtpd')
+        status_line = status_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        status = int(status_line[1])
+        reason = status_line[2] if len(status_line) > 2 else ''
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        if headers.get('connection', '').lower() == 'close':
+            self.keep_alive = False
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # Skip trailer headers
+                    while (await self.reader.readline()) not in \
+                            (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            payload = b''.join(chunks)
+        elif 'content-length' in headers:
+            payload = await self.reader.readexactly(
+                int(headers['content-length']))
+        else:
+            # Body delimited by end of connection
+            payload = await self.reader.read()
+            self.keep_alive = False
+        return status, reason, headers, payload
+
+class AsyncLdtpClient:
+    """
+    asyncio client for ldtpd. Every daemon method is available as
+    an awaitable, eg: await client.click('frmCalculator', 'btn1')
+
+    Requests are sent over a pool of keep-alive connections, so
+    several requests can be in flight against the same daemon.
+    Use one instance per daemon to drive multiple desktops from
+    a single event loop.
+    """
+    def __init__(self, host=None, port=None, max_connections=4,
+                 timeout=None):
+        """
+        @param host: ldtpd host name, default LDTP_SERVER_ADDR or localhost
+        @type host: string
+        @param port: ldtpd port, default LDTP_SERVER_PORT or 4118
+        @type port: integer
+        @param max_connections: Maximum concurrent connections to the daemon
+        @type max_connections: integer
+        @param timeout: Per request timeout in seconds, None to wait forever
+        @type timeout: float
+        """
+        self._host = host or _ldtp_server_addr
+        self._port = int(port or _ldtp_server_port)
+        self._max_connections = max_connections
+        self._timeout = timeout
+        self._handler = '/RPC2'
+        self._idle = []
+        self._slots = None
+        self._closed = False
+
+    def __repr__(self):
+        return '<AsyncLdtpClient %s:%d>' % (self._host, self._port)
+
+    def __getattr__(self, name):
+        # magic method dispatcher
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return _Method(self, name)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def whoismyhost(self):
+        return '%s:%d' % (self._host, self._port)
+
+    async def close(self):
+        """
+        Close all the idle connections
+        """
+        self._closed = True
+        while self._idle:
+            conn = self._idle.pop()
+            conn.close()
+            try:
+                await conn.writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _acquire(self):
+        while self._idle:
+            conn = self._idle.pop()
+            if conn.reader.at_eof():
+                conn.close()
+                continue
+            conn.reused = True
+            return conn
+        reader, writer = await asyncio.open_connection(self._host, self._port)
+        return _Connection(reader, writer)
+
+    def _release(self, conn):
+        if conn.keep_alive and not self._closed:
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    async def _send(self, body):
+        host = '%s:%d' % (self._host, self._port)
+        while True:
+            conn = await self._acquire()
+            try:
+                response = await conn.post(host, self._handler, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn.close()
+                if conn.reused:
+                    # Stale keep-alive connection, retry on a fresh one
+                    continue
+                raise
+            except BaseException:
+                # Timeout / cancellation, response state is unknown
+                conn.close()
+                raise
+            self._release(conn)
+            return response
+
+    async def _request(self, method, args):
+        if self._closed:
+            raise RuntimeError('%r is closed' % self)
+        if self._slots is None:
+            # Created lazily, so that it binds to the running loop
+            self._slots = asyncio.Semaphore(self._max_connections)
+        body = xmlrpc.client.dumps(tuple(args), method,
+                                   allow_none=True).encode('utf-8')
+        async with self._slots:
+            status, reason, headers, payload = \
+                await asyncio.wait_for(self._send(body), self._timeout)
+        if status != 200:
+            raise xmlrpc.client.ProtocolError(
+                '%s:%d%s' % (self._host, self._port, self._handler),
+                status, reason, headers)
+        try:
+            result = xmlrpc.client.loads(payload, use_builtin_types=True)[0]
+        except xmlrpc.client.Fault as e:
+            if e.faultCode == ERROR_CODE:
+                raise LdtpExecutionError(e.faultString)
+            raise
+        return result[0]
+
+    async def textchunks(self, window_name, object_name, chunk_size=65536):
+        """
+        Asynchronous iterator over the text of an object, chunk_size
+        characters at a time, without holding the whole text
+
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to look for, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type object_name: string
+        @param chunk_size: Characters per request
+        @type chunk_size: integer
+
+        @return: text chunk
+        @rtype: string
+        """
+        length = await self.gettextlength(window_name, object_name)
+        offset = 0
+        while offset < length:
+            chunk = await self.gettextchunk(window_name, object_name,
+                                            offset, chunk_size)
+            if not chunk:
+                # Text shrunk meanwhile
+                break
+            yield chunk
+            offset += len(chunk)
+
+    async def events(self, interval=1.0):
+        """
+        Asynchronous iterator over the registered callback events,
+        replaces PollEvents callbacks. Register with onwindowcreate,
+        registerevent or registerkbevent first.
+
+        @param interval: Sleep time in seconds when the event queue is empty
+        @type interval: float
+
+        @return: (event type, event data), eg:
+        ('onwindowcreate', '*gedit*'), ('window:activate', 'frmgedit')
+        @rtype: tuple
+        """
+        while True:
+            event = await self.poll_events()
+            if not event:
+                # No event in queue, sleep before polling again
+                await asyncio.sleep(interval)
+                continue
+            # Event format:
+            # window:create-Untitled Document 1 - gedit
+            event_type, _, data = event.partition('-')
+            yield event_type, data
@@ -0,0 +1,158 @@
+"""
+LDTP v2 fan-out client, runs calls on several daemons concurrently
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+
+Example:
+
+    import ldtp
+    c = ldtp.cluster(['vm1', 'vm2:4119'], timeout=30)
+    for host, r in c.launchapp('gedit').items():
+        print(host, r.ok, r.result, r.fault, r.latency)
+    c.map({'vm1': ('guiexist', '*gedit*'),
+           'vm2:4119': ('guiexist', '*gedit*', 'btnOpen')})
+    c.close()
+"""
+
+import time
+import asyncio
+from ldtp.aio import AsyncLdtpClient
+
+class HostResult:
+    """
+    Outcome of one call on one daemon
+    """
+    def __init__(self, host, result=None, fault=None, latency=0.0):
+        self.host = host
+        # Return value of the call, None on fault
+        self.result = result
+        # Exception raised by the call: LdtpExecutionError,
+        # xmlrpc.client.Fault, connection error or asyncio.TimeoutError
+        self.fault = fault
+        # Wall clock time of the call in seconds
+        self.latency = latency
+
+    @property
+    def ok(self):
+        return self.fault is None
+
+    def __repr__(self):
+        if self.fault is None:
+            return '<HostResult %s ok %r %.3fs>' % (self.host, self.result,
+                                                   self.latency)
+        return '<HostResult %s fault %r %.3fs>' % (self.host, self.fault,
+                                                  self.latency)
+
+def _parse_host(spec):
+    host, sep, port = spec.rpartition(':')
+    if not sep or not port.isdigit():
+        return spec, None
+    return host, int(port)
+
+class Cluster:
+    """
+    Issue the same call, or per-host calls, to many daemons
+    concurrently. Every call returns a dictionary of host to
+    HostResult, faults are collected, never raised.
+    """
+    def __init__(self, hosts, concurrency=1, timeout=None):
+        """
+        @param hosts: Host names, as host or host:port
+        @type hosts: list
+        @param concurrency: Maximum in-flight requests per host
+        @type concurrency: integer
+        @param timeout: Per call timeout in seconds, None to wait forever
+        @type timeout: float
+        """
+        self._timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._clients = {}
+        for spec in hosts:
+            host, port = _parse_host(spec)
+            self._clients[spec] = AsyncLdtpClient(host, port,
+                                                  max_connections=concurrency)
+
+    def __getattr__(self, name):
+        # magic method dispatcher, same call on all hosts
+        if name.startswith('_'):
+            raise AttributeError(name)
+        def _call(*args):
+            return self.call(name, *args)
+        _call.__name__ = name
+        return _call
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def hosts(self):
+        return list(self._clients)
+
+    async def _invoke(self, host, method, args):
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                getattr(self._clients[host], method)(*args), self._timeout)
+        except Exception as e:
+            return HostResult(host, fault=e,
+                              latency=time.perf_counter() - start)
+        return HostResult(host, result, latency=time.perf_counter() - start)
+
+    async def _gather(self, calls):
+        results = await asyncio.gather(*[self._invoke(host, call[0], call[1:])
+                                         for host, call in calls])
+        return dict((r.host, r) for r in results)
+
+    def call(self, method, *args):
+        """
+        Call method with the same arguments on all hosts
+
+        @param method: Daemon method name, eg: guiexist
+        @type method: string
+
+        @return: host to HostResult
+        @rtype: dictionary
+        """
+        return self._loop.run_until_complete(
+            self._gather([(host, (method,) + args) for host in self._clients]))
+
+    def map(self, calls):
+        """
+        Call a different method / arguments per host
+
+        @param calls: host to (method, arg1, arg2, ...)
+        @type calls: dictionary
+
+        @return: host to HostResult
+        @rtype: dictionary
+        """
+        for host in calls:
+            if host not in self._clients:
+                raise ValueError('Unknown host %s' % host)
+        return self._loop.run_until_complete(self._gather(calls.items()))
+
+    def close(self):
+        """
+        Close connections to all the hosts
+        """
+        if self._loop.is_closed():
+            return
+        self._loop.run_until_complete(self._close())
+        self._loop.close()
+
+    async def _close(self):
+        await asyncio.gather(*[c.close() for c in self._clients.values()])
@@ -35,8 +35,9 @@ class SignalParent:
         os.kill(int(self.parentpid), signal.SIGUSR1)
 
 
-from .xmlrpc_daemon import XMLRPCLdtpd
-def main(port=4118, parentpid=None, XMLRPCLdtpdFactory=lambda: XMLRPCLdtpd()):
+from .metrics import metrics, ENV_METRICS_FILE, ENV_METRICS_INTERVAL
+from .profiler import profiler, ENV_PROFILE, ENV_PROFILE_INTERVAL
+def main(port=4118, parentpid=None, XMLRPCLdtpdFactory=None):
     import os
     os.environ['NO_GAIL'] = '1'
     os.environ['NO_AT_BRIDGE'] = '1'
@@ -67,19 +68,49 @@ def main(port=4118, parentpid=None, XMLRPCLdtpdFactory=lambda: XMLRPCLdtpd()):
     from twisted.web import server, xmlrpc
     import twisted.internet
     import socket
-    import pyatspi
+    from .backends import atspi
     import traceback
 
     _ldtp_debug = os.environ.get('LDTP_DEBUG', None)
     _ldtp_debug_file = os.environ.get('LDTP_DEBUG_FILE', None)
 
+    if XMLRPCLdtpdFactory is None:
+        # Imported here, so that the accessibility backend can be
+        # selected after importing ldtpd
+        from .xmlrpc_daemon import XMLRPCLdtpd
+        XMLRPCLdtpdFactory = XMLRPCLdtpd
+
     try:
-        pyatspi.setCacheLevel(pyatspi.CACHE_PROPERTIES)
+        atspi.setCacheLevel(atspi.CACHE_PROPERTIES)
         r = XMLRPCLdtpdFactory()
         xmlrpc.addIntrospection(r)
         if parentpid:
             reactor.callWhenRunning(SignalParent(parentpid).send_later)
         reactor.listenTCP(port, server.Site(r))
+        metrics_file = os.environ.get(ENV_METRICS_FILE, None)
+        if metrics_file:
+            from twisted.internet import task
+            def _write_metrics():
+                try:
+                    metrics.write(metrics_file)
+                except (IOError, OSError):
+                    if _ldtp_debug:
+                        print(traceback.format_exc())
+            interval = float(os.environ.get(ENV_METRICS_INTERVAL, 10))
+            task.LoopingCall(_write_metrics).start(interval, now=False)
+        profile_mode = os.environ.get(ENV_PROFILE, None)
+        if profile_mode:
+            try:
+                profiler.start(profile_mode,
+                               float(os.environ.get(ENV_PROFILE_INTERVAL,
+                                                    0.005)))
+            except ValueError as e:
+                # Invalid mode or interval, run without profiling
+                print(f'Warning: {ENV_PROFILE} ignored, {str(e)}')
+            else:
+                # Profiles are written to LDTP_PROFILE_DIR on exit
+                reactor.addSystemEventTrigger('before', 'shutdown',
+                                              profiler.stop)
         print(f'Running reactor on port {port}')
         reactor.run()
     except twisted.internet.error.CannotListenError:
@@ -0,0 +1,81 @@
+"""
+LDTP v2 accessibility backends.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See "COPYING" in the source distribution for more information.
+
+Headers in this file shall remain intact.
+
+ldtpd modules use the active backend as a pyatspi replacement:
+
+    from .backends import atspi
+    atspi.Registry.generateMouseEvent(x, y, 'b1c')
+
+The backend is chosen once, on first use, from set_backend() or the
+LDTP_BACKEND environment variable, default pyatspi. So select it
+before importing any other ldtpd module.
+"""
+
+import os
+import importlib
+
+ENV_BACKEND = 'LDTP_BACKEND'
+
+# Backend name: module, class
+_backends = {'pyatspi' : ('.pyatspi_backend', 'PyatspiBackend'),
+             'gi' : ('.gi_atspi', 'GiAtspiBackend'),
+             'memory' : ('.memory', 'MemoryBackend')}
+
+_backend = None
+
+def _load(name):
+    if name not in _backends:
+        raise ValueError('Unknown accessibility backend %s, use one of %s' % \
+                             (name, ', '.join(sorted(_backends))))
+    module_name, class_name = _backends[name]
+    module = importlib.import_module(module_name, __name__)
+    return getattr(module, class_name)()
+
+def set_backend(backend):
+    """
+    Select the accessibility backend
+
+    @param backend: Backend name (pyatspi, gi, memory) or Backend instance
+    @type backend: string
+
+    @return: active backend
+    @rtype: object
+    """
+    global _backend
+    if _backend is not None:
+        if backend == _backend or backend == _backend.name:
+            return _backend
+        raise RuntimeError('Accessibility backend %s already in use' % \
+                               _backend.name)
+    if isinstance(backend, str):
+        backend = _load(backend)
+    _backend = backend
+    return _backend
+
+def get_backend():
+    """
+    @return: active backend, selected from LDTP_BACKEND if not set
+    @rtype: object
+    """
+    if _backend is None:
+        set_backend(os.environ.get(ENV_BACKEND, 'pyatspi'))
+    return _backend
+
+def __getattr__(name):
+    # from .backends import atspi
+    if name == 'atspi':
+        return get_backend()
+    raise AttributeError(name)
@@ -0,0 +1,157 @@
+"""
+LDTP v2 accessibility backend interface.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See "COPYING" in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+class Backend:
+    """
+    Accessibility backend.
+
+    A backend exposes the pyatspi compatible namespace used all over
+    ldtpd as attributes: ROLE_* / STATE_* / RELATION_* / KEY_*
+    constants, Registry, findDescendant, allModifiers, listInterfaces,
+    setCacheLevel and so on. Accessible objects returned by the
+    backend follow the pyatspi object API (name, getRole(),
+    queryTable(), ...).
+
+    The helper methods below cover tree access, properties,
+    interfaces and events. They are implemented with the pyatspi
+    object API, a backend overrides them only to go faster.
+    """
+    name = None
+
+    def _export(self, namespace):
+        """
+        Copy public names of namespace as attributes, so that constant
+        lookups don't go through __getattr__
+        """
+        for key, value in namespace.items():
+            if not key.startswith('_') and not hasattr(Backend, key):
+                setattr(self, key, value)
+
+    # Tree access
+    def get_desktop(self):
+        return self.Registry.getDesktop(0)
+
+    def get_children(self, acc):
+        return list(acc)
+
+    def get_child_count(self, acc):
+        return acc.childCount
+
+    def get_child_at(self, acc, index):
+        return acc.getChildAtIndex(index)
+
+    def get_parent(self, acc):
+        return acc.parent
+
+    def get_index_in_parent(self, acc):
+        return acc.getIndexInParent()
+
+    # Properties
+    def get_name(self, acc):
+        return acc.name
+
+    def get_role(self, acc):
+        return acc.getRole()
+
+    def get_role_name(self, acc):
+        return acc.getRoleName()
+
+    def get_application(self, acc):
+        return acc.getApplication()
+
+    def get_states(self, acc):
+        return acc.getState().getStates()
+
+    def has_state(self, acc, state):
+        return acc.getState().contains(state)
+
+    # Interfaces
+    def get_table(self, acc):
+        """
+        Table interface, only to be passed to the get_table_* helpers
+        as its type depends on the backend
+
+        @return: table interface, None if acc is not a table
+        @rtype: object
+        """
+        try:
+            return acc.queryTable()
+        except NotImplementedError:
+            return None
+
+    def get_table_size(self, tablei):
+        """
+        @return: rows, columns
+        @rtype: tuple
+        """
+        return tablei.nRows, tablei.nColumns
+
+    def get_table_cell(self, tablei, row, column):
+        return tablei.getAccessibleAt(row, column)
+
+    def is_table_row_selected(self, tablei, row):
+        return tablei.isRowSelected(row)
+
+    def select_table_row(self, tablei, row):
+        """
+        @return: True if the row was added to the selection
+        @rtype: boolean
+        """
+        return tablei.addRowSelection(row)
+
+    def deselect_table_row(self, tablei, row):
+        """
+        @return: True if the row was removed from the selection
+        @rtype: boolean
+        """
+        return tablei.removeRowSelection(row)
+
+    def get_text(self, acc):
+        """
+        @return: text interface, None if acc has no text
+        @rtype: object
+        """
+        try:
+            return acc.queryText()
+        except NotImplementedError:
+            return None
+
+    # Component
+    def get_extents(self, acc):
+        """
+        @return: x, y, width, height in desktop coordinates, None if
+        acc has no component interface
+        @rtype: tuple
+        """
+        try:
+            bb = acc.queryComponent().getExtents(self.DESKTOP_COORDS)
+        except NotImplementedError:
+            return None
+        return bb.x, bb.y, bb.width, bb.height
+
+    # Events
+    def register_event(self, callback, *events):
+        self.Registry.registerEventListener(callback, *events)
+
+    def deregister_event(self, callback, *events):
+        self.Registry.deregisterEventListener(callback, *events)
+
+    def generate_mouse_event(self, x, y, name):
+        self.Registry.generateMouseEvent(x, y, name)
+
+    def generate_keyboard_event(self, keycode, keystring, kind):
+        self.Registry.generateKeyboardEvent(keycode, keystring, kind)
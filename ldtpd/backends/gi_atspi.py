@@ -0,0 +1,81 @@
+"""
+LDTP v2 gi.repository.Atspi accessibility backend.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See "COPYING" in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+from gi.repository import Atspi
+
+from .pyatspi_backend import PyatspiBackend
+
+_Accessible = Atspi.Accessible
+_Table = Atspi.Table
+
+def _get_children(acc):
+    get_child = _Accessible.get_child_at_index
+    return [get_child(acc, i) for i in range(_Accessible.get_child_count(acc))]
+
+def _get_states(acc):
+    return _Accessible.get_state_set(acc).get_states()
+
+def _has_state(acc, state):
+    return _Accessible.get_state_set(acc).contains(state)
+
+def _get_table_size(tablei):
+    return _Table.get_n_rows(tablei), _Table.get_n_columns(tablei)
+
+def _get_extents(acc):
+    try:
+        bb = Atspi.Component.get_extents(acc, Atspi.CoordType.SCREEN)
+    except Exception:
+        # No component interface
+        return None
+    return bb.x, bb.y, bb.width, bb.height
+
+class GiAtspiBackend(PyatspiBackend):
+    """
+    pyatspi backend, with the tree walk, property, state and table
+    helpers calling gi.repository.Atspi directly.
+
+    pyatspi objects are Atspi.Accessible instances, so objects returned
+    by the helpers can still be used with the pyatspi object API. The
+    helpers are the unbound GI functions, no Python wrapper in between.
+    """
+    name = 'gi'
+
+    # Tree access
+    get_children = staticmethod(_get_children)
+    get_child_count = staticmethod(_Accessible.get_child_count)
+    get_child_at = staticmethod(_Accessible.get_child_at_index)
+    get_parent = staticmethod(_Accessible.get_parent)
+    get_index_in_parent = staticmethod(_Accessible.get_index_in_parent)
+
+    # Properties
+    get_name = staticmethod(_Accessible.get_name)
+    get_role = staticmethod(_Accessible.get_role)
+    get_role_name = staticmethod(_Accessible.get_role_name)
+    get_application = staticmethod(_Accessible.get_application)
+    get_states = staticmethod(_get_states)
+    has_state = staticmethod(_has_state)
+
+    # Table, returns Atspi.Table or None
+    get_table = staticmethod(_Accessible.get_table_iface)
+    get_table_size = staticmethod(_get_table_size)
+    get_table_cell = staticmethod(_Table.get_accessible_at)
+    is_table_row_selected = staticmethod(_Table.is_row_selected)
+    select_table_row = staticmethod(_Table.add_row_selection)
+    deselect_table_row = staticmethod(_Table.remove_row_selection)
+
+    # Component
+    get_extents = staticmethod(_get_extents)
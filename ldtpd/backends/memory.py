@@ -0,0 +1,483 @@
+"""
+LDTP v2 in-memory accessibility backend.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See "COPYING" in the source distribution for more information.
+
+Headers in this file shall remain intact.
+
+Trees are plain dictionaries, so that they can be generated and
+serialized as JSON:
+
+    {'role' : 'frame', 'name' : 'Untitled - gedit',
+     'states' : ['enabled', 'visible'], 'actions' : ['click'],
+     'text' : '...', 'columns' : 3, 'extents' : [x, y, width, height],
+     'children' : [...]}
+
+Only 'role' is mandatory. Table children are the cells, in row major
+order, 'columns' gives the table width. A desktop is a list of trees
+with role 'application', or a JSON file with that list. Set
+LDTP_MEMORY_TREE to load a desktop when the backend is created.
+
+Events are emitted with Registry.emit(), eg:
+
+    atspi.Registry.emit('window:create', window)
+"""
+
+import os
+import json
+import types
+from collections import deque
+
+from .base import Backend
+
+ENV_MEMORY_TREE = 'LDTP_MEMORY_TREE'
+
+# Same numbering as AT-SPI Atspi.Role
+_roles = ['INVALID', 'ACCELERATOR_LABEL', 'ALERT', 'ANIMATION', 'ARROW',
+          'CALENDAR', 'CANVAS', 'CHECK_BOX', 'CHECK_MENU_ITEM',
+          'COLOR_CHOOSER', 'COLUMN_HEADER', 'COMBO_BOX', 'DATE_EDITOR',
+          'DESKTOP_ICON', 'DESKTOP_FRAME', 'DIAL', 'DIALOG',
+          'DIRECTORY_PANE', 'DRAWING_AREA', 'FILE_CHOOSER', 'FILLER',
+          'FOCUS_TRAVERSABLE', 'FONT_CHOOSER', 'FRAME', 'GLASS_PANE',
+          'HTML_CONTAINER', 'ICON', 'IMAGE', 'INTERNAL_FRAME', 'LABEL',
+          'LAYERED_PANE', 'LIST', 'LIST_ITEM', 'MENU', 'MENU_BAR',
+          'MENU_ITEM', 'OPTION_PANE', 'PAGE_TAB', 'PAGE_TAB_LIST', 'PANEL',
+          'PASSWORD_TEXT', 'POPUP_MENU', 'PROGRESS_BAR', 'PUSH_BUTTON',
+          'RADIO_BUTTON', 'RADIO_MENU_ITEM', 'ROOT_PANE', 'ROW_HEADER',
+          'SCROLL_BAR', 'SCROLL_PANE', 'SEPARATOR', 'SLIDER', 'SPIN_BUTTON',
+          'SPLIT_PANE', 'STATUS_BAR', 'TABLE', 'TABLE_CELL',
+          'TABLE_COLUMN_HEADER', 'TABLE_ROW_HEADER', 'TEAROFF_MENU_ITEM',
+          'TERMINAL', 'TEXT', 'TOGGLE_BUTTON', 'TOOL_BAR', 'TOOL_TIP',
+          'TREE', 'TREE_TABLE', 'UNKNOWN', 'VIEWPORT', 'WINDOW', 'EXTENDED',
+          'HEADER', 'FOOTER', 'PARAGRAPH', 'RULER', 'APPLICATION',
+          'AUTOCOMPLETE', 'EDITBAR', 'EMBEDDED', 'ENTRY']
+
+# Same numbering as AT-SPI Atspi.StateType
+_states = ['INVALID', 'ACTIVE', 'ARMED', 'BUSY', 'CHECKED', 'COLLAPSED',
+           'DEFUNCT', 'EDITABLE', 'ENABLED', 'EXPANDABLE', 'EXPANDED',
+           'FOCUSABLE', 'FOCUSED', 'HAS_TOOLTIP', 'HORIZONTAL', 'ICONIFIED',
+           'MODAL', 'MULTI_LINE', 'MULTISELECTABLE', 'OPAQUE', 'PRESSED',
+           'RESIZABLE', 'SELECTABLE', 'SELECTED', 'SENSITIVE', 'SHOWING',
+           'SINGLE_LINE', 'STALE', 'TRANSIENT', 'VERTICAL', 'VISIBLE',
+           'MANAGES_DESCENDANTS', 'INDETERMINATE', 'REQUIRED', 'TRUNCATED',
+           'ANIMATED', 'INVALID_ENTRY', 'SUPPORTS_AUTOCOMPLETION',
+           'SELECTABLE_TEXT', 'IS_DEFAULT', 'VISITED', 'CHECKABLE',
+           'HAS_POPUP', 'READ_ONLY']
+
+class Role(int):
+    def __str__(self):
+        return 'ROLE_%s' % _roles[self]
+    __repr__ = __str__
+
+class StateType(int):
+    def __str__(self):
+        return 'STATE_%s' % _states[self]
+    __repr__ = __str__
+
+ROLES = dict((name, Role(value)) for value, name in enumerate(_roles))
+STATES = dict((name, StateType(value)) for value, name in enumerate(_states))
+
+def role_name(role):
+    return _roles[role].lower().replace('_', ' ')
+
+class StateSet:
+    def __init__(self, states):
+        self._states = states
+
+    def contains(self, state):
+        return state in self._states
+
+    def getStates(self):
+        return list(self._states)
+
+    def add(self, state):
+        self._states.add(state)
+
+    def remove(self, state):
+        self._states.discard(state)
+
+class Extents:
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+class Component:
+    def __init__(self, acc):
+        self._acc = acc
+
+    def getExtents(self, coord_type):
+        return Extents(*self._acc._extents)
+
+    def getLayer(self):
+        return 0
+
+    def grabFocus(self):
+        self._acc._states.add(STATES['FOCUSED'])
+        return True
+
+class Action:
+    def __init__(self, acc):
+        self._acc = acc
+        self.nActions = len(acc._actions)
+
+    def getName(self, i):
+        return self._acc._actions[i]
+
+    def getKeyBinding(self, i):
+        return ''
+
+    def doAction(self, i):
+        self._acc._done_actions.append(self._acc._actions[i])
+        return True
+
+class Table:
+    def __init__(self, acc):
+        self._acc = acc
+        self.nColumns = acc._columns
+        self.nRows = len(acc._children) // acc._columns
+
+    def getAccessibleAt(self, row, column):
+        if row >= self.nRows or column >= self.nColumns:
+            return None
+        return self._acc._children[row * self.nColumns + column]
+
+    def getColumnHeader(self, column):
+        return None
+
+    def _row(self, row):
+        return self._acc._children[row * self.nColumns:
+                                       (row + 1) * self.nColumns]
+
+    def isRowSelected(self, row):
+        return all(STATES['SELECTED'] in cell._states \
+                       for cell in self._row(row))
+
+    def addRowSelection(self, row):
+        for cell in self._row(row):
+            cell._states.add(STATES['SELECTED'])
+        return True
+
+    def removeRowSelection(self, row):
+        for cell in self._row(row):
+            cell._states.discard(STATES['SELECTED'])
+        return True
+
+class Text:
+    def __init__(self, acc):
+        self._acc = acc
+        self.characterCount = len(acc._text)
+        self.caretOffset = acc._caret
+
+    def getText(self, start, end):
+        if end == -1:
+            end = len(self._acc._text)
+        return self._acc._text[start:end]
+
+    def setCaretOffset(self, offset):
+        self._acc._caret = offset
+        return True
+
+class EditableText(Text):
+    def setTextContents(self, text):
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+        self._acc._text = text
+        return True
+
+    def insertText(self, offset, text, length):
+        self._acc._text = self._acc._text[:offset] + text + \
+            self._acc._text[offset:]
+        return True
+
+    def deleteText(self, start, end):
+        self._acc._text = self._acc._text[:start] + self._acc._text[end:]
+        return True
+
+class Accessible:
+    """
+    In-memory accessible, built from a tree dictionary
+    """
+    def __init__(self, spec, parent=None, app=None):
+        self.parent = parent
+        self._app = app or self
+        self._role = ROLES[spec.get('role', 'unknown').upper()]
+        self.name = spec.get('name', '')
+        self.description = spec.get('description', '')
+        self._states = set(STATES[state.upper()] for state in \
+                               spec.get('states', ('enabled', 'visible',
+                                                   'showing', 'sensitive')))
+        self._actions = spec.get('actions', ())
+        self._done_actions = []
+        self._text = spec.get('text', None)
+        self._caret = 0
+        self._columns = spec.get('columns', 0)
+        self._extents = spec.get('extents', (0, 0, 10, 10))
+        self._children = [Accessible(child, self, app or self) \
+                              for child in spec.get('children', ())]
+        self._index = -1
+
+    def __repr__(self):
+        return '[%s | %s]' % (role_name(self._role), self.name)
+
+    def __bool__(self):
+        # Empty containers are not false
+        return True
+
+    def __len__(self):
+        return len(self._children)
+
+    def __iter__(self):
+        return iter(self._children)
+
+    def __getitem__(self, index):
+        return self._children[index]
+
+    @property
+    def childCount(self):
+        return len(self._children)
+
+    def getChildAtIndex(self, index):
+        if index < 0 or index >= len(self._children):
+            return None
+        return self._children[index]
+
+    def getIndexInParent(self):
+        if self.parent is None:
+            return -1
+        if self._index == -1:
+            self._index = self.parent._children.index(self)
+        return self._index
+
+    def getRole(self):
+        return self._role
+
+    def getRoleName(self):
+        return role_name(self._role)
+
+    def getApplication(self):
+        return self._app
+
+    def getRelationSet(self):
+        return []
+
+    def getState(self):
+        return StateSet(self._states)
+
+    def setCacheMask(self, mask):
+        pass
+
+    def queryComponent(self):
+        return Component(self)
+
+    def queryAction(self):
+        if not self._actions:
+            raise NotImplementedError
+        return Action(self)
+
+    def queryTable(self):
+        if self._role != ROLES['TABLE'] or not self._columns:
+            raise NotImplementedError
+        return Table(self)
+
+    def queryText(self):
+        if self._text is None:
+            raise NotImplementedError
+        return Text(self)
+
+    def queryEditableText(self):
+        if self._text is None or STATES['EDITABLE'] not in self._states:
+            raise NotImplementedError
+        return EditableText(self)
+
+class Event:
+    def __init__(self, event_type, source, detail1=0, detail2=0,
+                 any_data=None):
+        self.type = event_type
+        self.source = source
+        self.detail1 = detail1
+        self.detail2 = detail2
+        self.any_data = any_data
+        self.host_application = source.getApplication() if source else None
+        self.source_name = source.name if source else ''
+
+class Registry:
+    """
+    Desktop and event listener registry
+    """
+    def __init__(self):
+        self._desktop = Accessible({'role' : 'desktop_frame',
+                                    'name' : 'main'})
+        self._listeners = []
+        self.generated_events = 0
+
+    def load(self, apps):
+        """
+        Replace the desktop applications
+
+        @param apps: application tree dictionaries, role application
+        @type apps: list
+        """
+        self._desktop._children = []
+        for spec in apps:
+            app = Accessible(spec)
+            app.parent = self._desktop
+            self._desktop._children.append(app)
+
+    def getDesktop(self, index):
+        return self._desktop
+
+    def registerEventListener(self, client, *names):
+        for name in names:
+            self._listeners.append((client, name))
+
+    def deregisterEventListener(self, client, *names):
+        for name in names:
+            if (client, name) in self._listeners:
+                self._listeners.remove((client, name))
+
+    def registerKeystrokeListener(self, client, *args, **kwargs):
+        pass
+
+    def deregisterKeystrokeListener(self, client, *args, **kwargs):
+        pass
+
+    def generateMouseEvent(self, x, y, name):
+        self.generated_events += 1
+
+    def generateKeyboardEvent(self, keycode, keystring, kind):
+        self.generated_events += 1
+
+    def emit(self, event_type, source, detail1=0, detail2=0, any_data=None):
+        """
+        Deliver a synthetic event to the matching listeners, a
+        listener registered for 'window' gets 'window:activate'
+        """
+        event = Event(event_type, source, detail1, detail2, any_data)
+        for client, name in list(self._listeners):
+            if event_type == name or event_type.startswith(name + ':'):
+                client(event)
+
+def _find_descendant(acc, pred, breadth_first=False):
+    if breadth_first:
+        # Level by level, as pyatspi
+        queue = deque(acc)
+        while queue:
+            child = queue.popleft()
+            if pred(child):
+                return child
+            queue.extend(child)
+        return None
+    for child in acc:
+        if pred(child):
+            return child
+        found = _find_descendant(child, pred)
+        if found:
+            return found
+    return None
+
+def dump(acc, backend):
+    """
+    Serialize an accessible tree of any backend, to be loaded later by
+    the memory backend
+
+    @param acc: Accessible handle, eg: application or window
+    @type acc: object
+    @param backend: Backend of acc
+    @type backend: object
+
+    @return: tree dictionary
+    @rtype: dictionary
+    """
+    node = {'role' : _roles[backend.get_role(acc)].lower(),
+            'name' : backend.get_name(acc) or ''}
+    if acc.description:
+        node['description'] = acc.description
+    node['states'] = [_states[state].lower() for state in \
+                          backend.get_states(acc)]
+    try:
+        actioni = acc.queryAction()
+        node['actions'] = [actioni.getName(i) for i in \
+                               range(actioni.nActions)]
+    except NotImplementedError:
+        pass
+    texti = backend.get_text(acc)
+    if texti:
+        node['text'] = texti.getText(0, -1)
+    tablei = backend.get_table(acc)
+    if tablei:
+        node['columns'] = tablei.nColumns
+    try:
+        bb = acc.queryComponent().getExtents(backend.DESKTOP_COORDS)
+        node['extents'] = [bb.x, bb.y, bb.width, bb.height]
+    except NotImplementedError:
+        pass
+    children = [dump(child, backend) for child in \
+                    backend.get_children(acc) if child]
+    if children:
+        node['children'] = children
+    return node
+
+class MemoryBackend(Backend):
+    """
+    Deterministic backend, serving a tree loaded from a dictionary
+    or JSON file, without any desktop session
+    """
+    name = 'memory'
+
+    def __init__(self):
+        for name, role in ROLES.items():
+            setattr(self, 'ROLE_%s' % name, role)
+        for name, state in STATES.items():
+            setattr(self, 'STATE_%s' % name, state)
+        self.STATE_VALUE_TO_NAME = dict((state, name.lower()) for \
+                                            name, state in STATES.items())
+        self.state = self
+        self.Registry = Registry()
+        self.Accessible = Accessible
+        self.cache = types.SimpleNamespace(ALL=0xffff)
+        self.CACHE_PROPERTIES = 2
+        self.DESKTOP_COORDS = 0
+        self.WINDOW_COORDS = 1
+        self.LAYER_POPUP = 5
+        self.RELATION_LABELLED_BY = 2
+        self.RELATION_CONTROLLED_BY = 4
+        self.KEY_PRESS = 0
+        self.KEY_RELEASE = 1
+        self.KEY_PRESSRELEASE = 2
+        self.KEY_PRESSED_EVENT = 0
+        self.KEY_RELEASED_EVENT = 1
+        self.findDescendant = _find_descendant
+        if os.environ.get(ENV_MEMORY_TREE, None):
+            self.load(os.environ[ENV_MEMORY_TREE])
+
+    def setCacheLevel(self, level):
+        pass
+
+    def allModifiers(self):
+        return iter(range(256))
+
+    def listInterfaces(self, acc):
+        return ['Accessible', 'Component']
+
+    def load(self, apps):
+        """
+        Replace the desktop applications
+
+        @param apps: application tree dictionaries, or JSON file name
+        @type apps: list
+        """
+        if isinstance(apps, str):
+            with open(apps) as fp:
+                apps = json.load(fp)
+        self.Registry.load(apps)
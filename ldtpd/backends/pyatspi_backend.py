@@ -0,0 +1,29 @@
+"""
+LDTP v2 pyatspi accessibility backend.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See "COPYING" in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import pyatspi
+
+from .base import Backend
+
+class PyatspiBackend(Backend):
+    """
+    Default backend, the pyatspi module as is
+    """
+    name = 'pyatspi'
+
+    def __init__(self):
+        self._export(vars(pyatspi))
@@ -19,7 +19,7 @@ See 'COPYING' in the source distribution for more information.
 Headers in this file shall remain intact.
 """
 
-import pyatspi 
+from .backends import atspi
 from .utils import Utils
 from .server_exception import LdtpServerException
 
@@ -303,16 +303,16 @@ class ComboBox(LayeredPane, Utils):
         obj = self._get_object(window_name, object_name)
         self._grab_focus(obj)
 
-        if obj.getRole() == pyatspi.ROLE_LAYERED_PANE:
+        if obj.getRole() == atspi.ROLE_LAYERED_PANE:
             return self._lp_selectitem(obj, item_name)
-        elif obj.getRole() == pyatspi.ROLE_LIST:
+        elif obj.getRole() == atspi.ROLE_LIST:
             # Firefox Preference has ROLE_LIST item as top level object
             child_obj = obj
         else:
             child_obj = self._get_combo_child_object_type(obj)
             if not child_obj:
                 raise LdtpServerException('Unable to get combo box children')
-        if child_obj.getRole() == pyatspi.ROLE_LIST:
+        if child_obj.getRole() == atspi.ROLE_LIST:
             index = 0
             for child in self._list_objects(child_obj):
                 if child == child_obj:
@@ -340,7 +340,7 @@ class ComboBox(LayeredPane, Utils):
                     finally:
                         return 1
                 index += 1
-        elif child_obj.getRole() == pyatspi.ROLE_MENU:
+        elif child_obj.getRole() == atspi.ROLE_MENU:
             for child in self._list_objects(child_obj):
                 if child == child_obj:
                     # As the _list_objects gives the current object as well
@@ -384,17 +384,17 @@ class ComboBox(LayeredPane, Utils):
         obj = self._get_object(window_name, object_name)
         self._grab_focus(obj)
 
-        if obj.getRole() == pyatspi.ROLE_LAYERED_PANE:
+        if obj.getRole() == atspi.ROLE_LAYERED_PANE:
             self._lp_selectindex(obj, item_index)
 
         child_obj = self._get_combo_child_object_type(obj)
         if not child_obj:
             raise LdtpServerException('Unable to get combo box children')
-        if child_obj.getRole() == pyatspi.ROLE_LIST:
+        if child_obj.getRole() == atspi.ROLE_LIST:
             selectioni = child_obj.querySelection()
             selectioni.selectChild(item_index)
             return 1
-        elif child_obj.getRole() == pyatspi.ROLE_MENU:
+        elif child_obj.getRole() == atspi.ROLE_MENU:
             index = 0
             for child in self._list_objects(child_obj):
                 if child == child_obj:
@@ -432,7 +432,7 @@ class ComboBox(LayeredPane, Utils):
         if not child_obj:
             raise LdtpServerException('Unable to get combo box children')
         item_list = []
-        if child_obj.getRole() == pyatspi.ROLE_LIST:
+        if child_obj.getRole() == atspi.ROLE_LIST:
             for child in self._list_objects(child_obj):
                 if child == child_obj:
                     # As the _list_objects gives the current object as well
@@ -446,7 +446,7 @@ class ComboBox(LayeredPane, Utils):
 
                 item_list.append(text)
             return item_list
-        elif child_obj.getRole() == pyatspi.ROLE_MENU:
+        elif child_obj.getRole() == atspi.ROLE_MENU:
             for child in self._list_objects(child_obj):
                 if child == child_obj:
                     # As the _list_objects gives the current object as well
@@ -478,7 +478,7 @@ class ComboBox(LayeredPane, Utils):
         if not child_obj:
             raise LdtpServerException('Unable to get combo box children')
 
-        if not self._check_state(child_obj, pyatspi.STATE_VISIBLE):
+        if not self._check_state(child_obj, atspi.STATE_VISIBLE):
             self._click_object(obj, 'press')
 
         return 1
@@ -504,7 +504,7 @@ class ComboBox(LayeredPane, Utils):
         if not child_obj:
             raise LdtpServerException('Unable to get combo box children')
 
-        if self._check_state(child_obj, pyatspi.STATE_VISIBLE):
+        if self._check_state(child_obj, atspi.STATE_VISIBLE):
             self._click_object(obj, 'press')
 
         return 1
@@ -531,11 +531,11 @@ class ComboBox(LayeredPane, Utils):
             if not child_obj:
                 return 0
 
-            if child_obj.getRole() == pyatspi.ROLE_LIST and \
-                    self._check_state(obj, pyatspi.STATE_FOCUSABLE):
+            if child_obj.getRole() == atspi.ROLE_LIST and \
+                    self._check_state(obj, atspi.STATE_FOCUSABLE):
                 return 1
-            elif child_obj.getRole() == pyatspi.ROLE_MENU:
-                if self._check_state(child_obj, pyatspi.STATE_VISIBLE):
+            elif child_obj.getRole() == atspi.ROLE_MENU:
+                if self._check_state(child_obj, atspi.STATE_VISIBLE):
                     return 1
         except:
             pass
@@ -579,12 +579,12 @@ class ComboBox(LayeredPane, Utils):
             if not child_obj:
                 return 0
 
-            if child_obj.getRole() == pyatspi.ROLE_LIST and \
-                    not self._check_state(obj, pyatspi.STATE_FOCUSABLE):
+            if child_obj.getRole() == atspi.ROLE_LIST and \
+                    not self._check_state(obj, atspi.STATE_FOCUSABLE):
                 return 1
-            elif child_obj.getRole() == pyatspi.ROLE_MENU:
-                if not self._check_state(obj, pyatspi.STATE_VISIBLE) and \
-                        not self._check_state(obj, pyatspi.STATE_SHOWING):
+            elif child_obj.getRole() == atspi.ROLE_MENU:
+                if not self._check_state(obj, atspi.STATE_VISIBLE) and \
+                        not self._check_state(obj, atspi.STATE_SHOWING):
                     return 1
         except:
             pass
@@ -613,7 +613,7 @@ class ComboBox(LayeredPane, Utils):
             child_obj = self._get_combo_child_object_type(obj)
             if not child_obj:
                 return 0
-            if child_obj.getRole() == pyatspi.ROLE_LIST:
+            if child_obj.getRole() == atspi.ROLE_LIST:
                 for child in self._list_objects(child_obj):
                     if child == child_obj:
                         # As the _list_objects gives the current object as well
@@ -627,7 +627,7 @@ class ComboBox(LayeredPane, Utils):
 
                     if self._glob_match(item_name, text):
                         return 1
-            elif child_obj.getRole() == pyatspi.ROLE_MENU:
+            elif child_obj.getRole() == atspi.ROLE_MENU:
                 if self._glob_match(item_name, obj.name):
                     return 1
                 # Get LDTP format accessibile name
@@ -661,7 +661,7 @@ class ComboBox(LayeredPane, Utils):
                                obj_type = ["combo_box"])
         self._grab_focus(obj)
 
-        child_obj = self._get_child_object_type(obj, pyatspi.ROLE_TEXT)
+        child_obj = self._get_child_object_type(obj, atspi.ROLE_TEXT)
         if child_obj:
             # Combo box object which has children type text
             # If yes, then that's the one selected, just return it
@@ -19,59 +19,59 @@ See 'COPYING' in the source distribution for more information.
 Headers in this file shall remain intact.
 """
 
-import pyatspi
+from .backends import atspi
 
 abbreviated_roles = {
-    pyatspi.ROLE_PAGE_TAB : 'ptab',
-    pyatspi.ROLE_PAGE_TAB_LIST : 'ptl',
-    pyatspi.ROLE_TABLE : 'tbl',
-    pyatspi.ROLE_COMBO_BOX : 'cbo',
-    pyatspi.ROLE_SPIN_BUTTON : 'sbtn',
-    pyatspi.ROLE_FONT_CHOOSER : 'dlg',
-    pyatspi.ROLE_COLOR_CHOOSER : 'dlg',
-    pyatspi.ROLE_RADIO_BUTTON : 'rbtn',
-    pyatspi.ROLE_TREE : 'tree',
-    pyatspi.ROLE_TREE_TABLE : 'ttbl',
-    pyatspi.ROLE_LAYERED_PANE : 'pane',
-    pyatspi.ROLE_ICON : 'ico',
-    pyatspi.ROLE_FRAME : 'frm',
-    pyatspi.ROLE_DIALOG : 'dlg',
-    pyatspi.ROLE_WINDOW : 'dlg',
-    pyatspi.ROLE_FILE_CHOOSER : 'dlg',
-    pyatspi.ROLE_ALERT : 'dlg',
-    pyatspi.ROLE_CALENDAR : 'cal',
-    pyatspi.ROLE_PANEL : 'pnl',
-    pyatspi.ROLE_LABEL : 'lbl',
-    pyatspi.ROLE_MENU_BAR : 'mbr',
-    pyatspi.ROLE_MENU : 'mnu',
-    pyatspi.ROLE_MENU_ITEM : 'mnu',
-    pyatspi.ROLE_LIST_ITEM : 'lst',
-    pyatspi.ROLE_LIST : 'lst',
-    pyatspi.ROLE_CHECK_MENU_ITEM : 'mnu',
-    pyatspi.ROLE_RADIO_MENU_ITEM : 'mnu',
-    pyatspi.ROLE_PUSH_BUTTON : 'btn',
-    pyatspi.ROLE_TOGGLE_BUTTON : 'tbtn',
-    pyatspi.ROLE_SCROLL_BAR : 'scbr',
-    pyatspi.ROLE_SCROLL_PANE : 'scpn',
-    pyatspi.ROLE_TEXT : 'txt',
-    pyatspi.ROLE_ENTRY : 'txt',
-    pyatspi.ROLE_AUTOCOMPLETE : 'auto',
-    pyatspi.ROLE_PARAGRAPH : 'txt',
-    pyatspi.ROLE_PASSWORD_TEXT : 'txt',
-    pyatspi.ROLE_STATUS_BAR : 'stat',
-    pyatspi.ROLE_EDITBAR : 'txt',
-    pyatspi.ROLE_TABLE_COLUMN_HEADER : 'tch',
-    pyatspi.ROLE_SEPARATOR : 'spr',
-    pyatspi.ROLE_FILLER : 'flr',
-    pyatspi.ROLE_CANVAS : 'cnvs',
-    pyatspi.ROLE_SPLIT_PANE : 'splt',
-    pyatspi.ROLE_SLIDER : 'sldr',
-    pyatspi.ROLE_HTML_CONTAINER : 'html',
-    pyatspi.ROLE_PROGRESS_BAR : 'pbar',
-    pyatspi.ROLE_TOOL_BAR : 'tbar',
-    pyatspi.ROLE_TOOL_TIP : 'ttip',
-    pyatspi.ROLE_CHECK_BOX : 'chk',
-    pyatspi.ROLE_TABLE_CELL : 'tblc',
-    pyatspi.ROLE_OPTION_PANE : 'opane',
-    pyatspi.ROLE_POPUP_MENU : 'popmnu',
-    pyatspi.ROLE_EMBEDDED : 'emb'}
+    atspi.ROLE_PAGE_TAB : 'ptab',
+    atspi.ROLE_PAGE_TAB_LIST : 'ptl',
+    atspi.ROLE_TABLE : 'tbl',
+    atspi.ROLE_COMBO_BOX : 'cbo',
+    atspi.ROLE_SPIN_BUTTON : 'sbtn',
+    atspi.ROLE_FONT_CHOOSER : 'dlg',
+    atspi.ROLE_COLOR_CHOOSER : 'dlg',
+    atspi.ROLE_RADIO_BUTTON : 'rbtn',
+    atspi.ROLE_TREE : 'tree',
+    atspi.ROLE_TREE_TABLE : 'ttbl',
+    atspi.ROLE_LAYERED_PANE : 'pane',
+    atspi.ROLE_ICON : 'ico',
+    atspi.ROLE_FRAME : 'frm',
+    atspi.ROLE_DIALOG : 'dlg',
+    atspi.ROLE_WINDOW : 'dlg',
+    atspi.ROLE_FILE_CHOOSER : 'dlg',
+    atspi.ROLE_ALERT : 'dlg',
+    atspi.ROLE_CALENDAR : 'cal',
+    atspi.ROLE_PANEL : 'pnl',
+    atspi.ROLE_LABEL : 'lbl',
+    atspi.ROLE_MENU_BAR : 'mbr',
+    atspi.ROLE_MENU : 'mnu',
+    atspi.ROLE_MENU_ITEM : 'mnu',
+    atspi.ROLE_LIST_ITEM : 'lst',
+    atspi.ROLE_LIST : 'lst',
+    atspi.ROLE_CHECK_MENU_ITEM : 'mnu',
+    atspi.ROLE_RADIO_MENU_ITEM : 'mnu',
+    atspi.ROLE_PUSH_BUTTON : 'btn',
+    atspi.ROLE_TOGGLE_BUTTON : 'tbtn',
+    atspi.ROLE_SCROLL_BAR : 'scbr',
+    atspi.ROLE_SCROLL_PANE : 'scpn',
+    atspi.ROLE_TEXT : 'txt',
+    atspi.ROLE_ENTRY : 'txt',
+    atspi.ROLE_AUTOCOMPLETE : 'auto',
+    atspi.ROLE_PARAGRAPH : 'txt',
+    atspi.ROLE_PASSWORD_TEXT : 'txt',
+    atspi.ROLE_STATUS_BAR : 'stat',
+    atspi.ROLE_EDITBAR : 'txt',
+    atspi.ROLE_TABLE_COLUMN_HEADER : 'tch',
+    atspi.ROLE_SEPARATOR : 'spr',
+    atspi.ROLE_FILLER : 'flr',
+    atspi.ROLE_CANVAS : 'cnvs',
+    atspi.ROLE_SPLIT_PANE : 'splt',
+    atspi.ROLE_SLIDER : 'sldr',
+    atspi.ROLE_HTML_CONTAINER : 'html',
+    atspi.ROLE_PROGRESS_BAR : 'pbar',
+    atspi.ROLE_TOOL_BAR : 'tbar',
+    atspi.ROLE_TOOL_TIP : 'ttip',
+    atspi.ROLE_CHECK_BOX : 'chk',
+    atspi.ROLE_TABLE_CELL : 'tblc',
+    atspi.ROLE_OPTION_PANE : 'opane',
+    atspi.ROLE_POPUP_MENU : 'popmnu',
+    atspi.ROLE_EMBEDDED : 'emb'}
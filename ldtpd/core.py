@@ -20,29 +20,23 @@ See 'COPYING' in the source distribution for more information.
 Headers in this file shall remain intact.
 """
 
-wnckModule=False
-from pyatspi import findDescendant, Registry
 import locale
 import subprocess
 try:
   # If we have gtk3+ gobject introspection, use that
   import gi
-  gi.require_version('Wnck', '3.0')
-  from gi.repository import Wnck as wnck
+  gi.require_version('Gtk', '3.0')
   from gi.repository import Gtk as gtk
   from gi.repository import Gdk as gdk
-  wnckModule=gtk3=True
+  gtk3=True
 except:
-  # No gobject introspection, use gtk2 libwnck
+  # No gobject introspection, use gtk2
   import gtk
-  try:
-    import wnck
-    wnckModule=True
-  except:
-    # Not all environments support wnck package
-    pass
   gtk3=False
-from .utils import Utils, ProcessStats
+from .utils import Utils, ProcessStats, get_wnck, get_wnck_screen
+from .spatial_index import spatial_indexes, window_stack
+from .metrics import metrics
+from .profiler import profiler
 from .constants import abbreviated_roles
 from .keypress_actions import KeyboardOp
 from .waiters import ObjectExistsWaiter, GuiExistsWaiter, \
@@ -54,12 +48,13 @@ import os
 import re
 import sys
 import time
-import pyatspi
+from .backends import atspi
 import traceback
 from fnmatch import translate as glob_trans
 
 from .menu import Menu
 from .text import Text
+from .macro import Macro
 from .mouse import Mouse
 from .table import Table
 from .value import Value
@@ -71,7 +66,7 @@ from gi.repository import GLib
 import _thread
 
 class Ldtpd(ComboBox, Table, Menu, PageTabList,
-            Text, Mouse, Generic, Value, Utils):
+            Text, Mouse, Macro, Generic, Value, Utils):
     """
     Core LDTP class.
     """
@@ -85,16 +80,19 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         self._kb_modifiers=[]
         # User registered events
         self._registered_events=[]
-        pyatspi.Registry.registerEventListener(self._event_cb, *self._events)
+        atspi.Registry.registerEventListener(self._event_cb, *self._events)
         self._process_stats={}
+        # ((window stack generation, window events), windows, popups)
+        # for coordinate lookups
+        self._coords_cache=None
 
     def __del__(self):
         if '_events' in dir(self):
             # De-register all registered events
           try:
-            pyatspi.Registry.deregisterEventListener(self._event_cb, *self._events)
-            pyatspi.Registry.deregisterEventListener(self._registered_event_cb,
-                                                     *self._registered_events)
+            atspi.Registry.deregisterEventListener(self._event_cb, *self._events)
+            atspi.Registry.deregisterEventListener(self._registered_event_cb,
+                                                   *self._registered_events)
           except AttributeError:
             # Handle exception during cleanup
             pass
@@ -316,6 +314,69 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         
         return self._custom_logger.log_events.pop()
 
+    def getmetrics(self, prometheus=False):
+        """
+        Get daemon metrics: per method call count, error count and
+        latency (p50 / p95 / p99 / histogram), appmap hit / miss /
+        remap counters, remap duration and node count per window,
+        window and object lookup retries / sleeps
+
+        @param prometheus: Return Prometheus text format
+        @type prometheus: boolean
+
+        @return: metrics dictionary, or text if prometheus is True
+        @rtype: dictionary
+        """
+        if prometheus:
+            return metrics.prometheus()
+        return metrics.snapshot()
+
+    def resetmetrics(self):
+        """
+        Reset all daemon metrics
+
+        @return: 1 on success
+        @rtype: integer
+        """
+        metrics.reset()
+        return 1
+
+    def startprofile(self, mode='cprofile', interval=0.005):
+        """
+        Start profiling the daemon methods, aggregated per method
+
+        @param mode: cprofile, deterministic profile dumped as pstats,
+        or sample, stack sampling dumped as collapsed stacks for flame
+        graphs
+        @type mode: string
+        @param interval: Sampling interval in seconds, for sample mode
+        @type interval: float
+
+        @return: 1 on success
+        @rtype: integer
+        """
+        try:
+            profiler.start(mode, float(interval))
+        except ValueError as e:
+            raise LdtpServerException(str(e))
+        return 1
+
+    def stopprofile(self, output_dir=''):
+        """
+        Stop profiling and write one file per profiled method
+
+        @param output_dir: Output directory on the daemon host, default
+        LDTP_PROFILE_DIR or ldtp-profile-<timestamp> in temp directory
+        @type output_dir: string
+
+        @return: list of files written
+        @rtype: list
+        """
+        try:
+            return profiler.stop(output_dir)
+        except (IOError, OSError) as e:
+            raise LdtpServerException(str(e))
+
     def startprocessmonitor(self, process_name, interval=2):
         """
         Start memory and CPU monitoring, with the time interval between
@@ -469,11 +530,11 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         @rtype: integer
         """
 
-        pyatspi.Registry.deregisterEventListener( \
+        atspi.Registry.deregisterEventListener( \
             self._registered_event_cb, *self._registered_events)
         self._registered_events.append(event_name)
-        pyatspi.Registry.registerEventListener(self._registered_event_cb,
-                                               *self._registered_events)
+        atspi.Registry.registerEventListener(self._registered_event_cb,
+                                             *self._registered_events)
         return 1
 
     def deregisterevent(self, event_name):
@@ -489,10 +550,10 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
 
         for event in self._registered_events:
             if event_name == event:
-                pyatspi.Registry.deregisterEventListener( \
+                atspi.Registry.deregisterEventListener( \
                     self._registered_event_cb, *self._registered_events)
                 self._registered_events.remove(event)
-                pyatspi.Registry.registerEventListener( \
+                atspi.Registry.registerEventListener( \
                     self._registered_event_cb, *self._registered_events)
                 break
         return 1
@@ -516,10 +577,10 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
             self._kb_modifiers.append(modifiers)
         for key_val in key_vals:
             self._kb_entries.append(key_val.value)
-        masks=[mask for mask in pyatspi.allModifiers()]
-        pyatspi.Registry.registerKeystrokeListener(self._registered_kb_event_cb,
-                                                   mask=masks,
-                                                   kind=(pyatspi.KEY_PRESSED_EVENT,))
+        masks=[mask for mask in atspi.allModifiers()]
+        atspi.Registry.registerKeystrokeListener(self._registered_kb_event_cb,
+                                                 mask=masks,
+                                                 kind=(atspi.KEY_PRESSED_EVENT,))
         return 1
 
     def deregisterkbevent(self, keys, modifiers=0):
@@ -542,10 +603,10 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         for key_val in key_vals:
             if key_val.value in self._kb_entries:
                 del self._kb_entries[self._kb_entries.index(key_val.value)]
-        masks=[mask for mask in pyatspi.allModifiers()]
-        pyatspi.Registry.deregisterKeystrokeListener(self._registered_kb_event_cb,
-                                                     mask=masks,
-                                                     kind=(pyatspi.KEY_PRESSED_EVENT,))
+        masks=[mask for mask in atspi.allModifiers()]
+        atspi.Registry.deregisterKeystrokeListener(self._registered_kb_event_cb,
+                                                   mask=masks,
+                                                   kind=(atspi.KEY_PRESSED_EVENT,))
         return 1
 
     def objectexist(self, window_name, object_name):
@@ -575,7 +636,7 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         @return: 1 if window maximized, 0 if not.
         @rtype: integer
         """
-        if not wnckModule:
+        if not get_wnck():
           raise LdtpServerException('Install python wnck module')
         waiter=MaximizeWindow(window_name)
 
@@ -592,7 +653,7 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         @return: 1 if window minimized, 0 if not.
         @rtype: integer
         """
-        if not wnckModule:
+        if not get_wnck():
           raise LdtpServerException('Install python wnck module')
         waiter=MinimizeWindow(window_name)
 
@@ -609,7 +670,7 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         @return: 1 if window unmaximized, 0 if not.
         @rtype: integer
         """
-        if not wnckModule:
+        if not get_wnck():
           raise LdtpServerException('Install python wnck module')
         waiter=UnmaximizeWindow(window_name)
 
@@ -626,7 +687,7 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         @return: 1 if window unminimized, 0 if not.
         @rtype: integer
         """
-        if not wnckModule:
+        if not get_wnck():
           raise LdtpServerException('Install python wnck module')
         waiter=UnminimizeWindow(window_name)
 
@@ -643,7 +704,7 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         @return: 1 if window unminimized, 0 if not.
         @rtype: integer
         """
-        if not wnckModule:
+        if not get_wnck():
           raise LdtpServerException('Install python wnck module')
         waiter=ActivateWindow(window_name)
 
@@ -660,7 +721,7 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         @return: 1 if window unminimized, 0 if not.
         @rtype: integer
         """
-        if not wnckModule:
+        if not get_wnck():
           raise LdtpServerException('Install python wnck module')
         waiter=CloseWindow(window_name)
 
@@ -879,9 +940,9 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         obj=self._get_object(window_name, object_name)
         self._grab_focus(obj)
 
-        if obj.getRole() == pyatspi.ROLE_TOGGLE_BUTTON:
+        if obj.getRole() == atspi.ROLE_TOGGLE_BUTTON:
             self._click_object(obj, '(click|activate)')
-        elif obj.getRole() == pyatspi.ROLE_COMBO_BOX:
+        elif obj.getRole() == atspi.ROLE_COMBO_BOX:
             self._click_object(obj, '(click|press)')
         else:
             self._click_object(obj)
@@ -926,7 +987,7 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         obj=self._get_object(window_name, object_name)
         self._grab_focus(obj)
 
-        if self._check_state(obj, pyatspi.STATE_CHECKED) == False:
+        if self._check_state(obj, atspi.STATE_CHECKED) == False:
             self._click_object(obj, '(click|press|activate|check)')
 
         return 1
@@ -948,7 +1009,7 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         obj=self._get_object(window_name, object_name)
         self._grab_focus(obj)
 
-        if self._check_state(obj, pyatspi.STATE_CHECKED):
+        if self._check_state(obj, atspi.STATE_CHECKED):
             self._click_object(obj, '(click|press|activate|uncheck)')
 
         return 1
@@ -986,7 +1047,7 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         try:
             obj=self._get_object(window_name, object_name, False)
 
-            return int(obj.getRole() == pyatspi.ROLE_PUSH_BUTTON)
+            return int(obj.getRole() == atspi.ROLE_PUSH_BUTTON)
         except:
             return 0
 
@@ -1007,7 +1068,7 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         try:
             obj=self._get_object(window_name, object_name, False)
 
-            return int(self._check_state(obj, pyatspi.STATE_CHECKED))
+            return int(self._check_state(obj, atspi.STATE_CHECKED))
         except:
             return 0
 
@@ -1108,7 +1169,7 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         try:
             obj=self._get_object(window_name, object_name, False)
 
-            return int(not self._check_state(obj, pyatspi.STATE_CHECKED))
+            return int(not self._check_state(obj, atspi.STATE_CHECKED))
         except:
             return 0
 
@@ -1129,7 +1190,7 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         try:
             obj=self._get_object(window_name, object_name, False)
 
-            return int(self._check_state(obj, pyatspi.STATE_ENABLED))
+            return int(self._check_state(obj, atspi.STATE_ENABLED))
         except:
             return 0
 
@@ -1390,47 +1451,81 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
 
         raise LdtpServerException('Window "%s" does not exist' % window_name)
 
-    def _getComponentAtCoords(self, parent, x, y):
+    def _coords_windows(self):
         """
-        Gets any child accessible that resides under given desktop coordinates.
+        Windows for coordinate lookups, listed again only after a wnck
+        window change or an at-spi window event. Override redirect
+        popup windows send no wnck signal.
 
-        @param parent: Top-level accessible.
-        @type parent: L{Accessibility.Accessible}
-        @param x: X coordinate.
-        @type x: integer
-        @param y: Y coordinate.
-        @type y: integer
-
-        @return: Child accessible at given coordinates, or None.
-        @rtype: L{Accessibility.Accessible}
+        @return: list of (window name, wnck window, gui), top most
+        first, and list of popup guis, not known to wnck
+        @rtype: tuple
         """
-        # Following lines from Accerciser, _getComponentAtCoords method
-        # quick_select.py file
-        container=parent
-        inner_container=parent
-        while True:
-            container_role=container.getRole()
-            if container_role == pyatspi.ROLE_PAGE_TAB_LIST:
-                try:
-                    si=container.querySelection()
-                    container=si.getSelectedChild(0)[0]
-                except NotImplementedError:
-                    pass
+        # Bug in wnck, if the following 2 lines are not called
+        # wnck returns empty list
+        while gtk.events_pending():
+            gtk.main_iteration()
+        window_order=window_stack.windows(get_wnck_screen())
+        generation=(window_stack.generation, self._window_events)
+        if self._coords_cache and self._coords_cache[0] == generation:
+            return self._coords_cache[1], self._coords_cache[2]
+        guis=list(self._list_guis())
+        windows=self._coords_stack(window_order, guis)
+        known=set(window[0] for window in windows)
+        popups=[]
+        for gui in guis:
             try:
-                ci=container.queryComponent()
+                if gui.name not in known and \
+                        atspi.get_role(gui) == atspi.ROLE_WINDOW:
+                    popups.append(gui)
             except:
-                break
-            else:
-                inner_container=container
-            container= ci.getAccessibleAtPoint(x, y, pyatspi.DESKTOP_COORDS)
-            if not container or container.queryComponent() == ci:
-                # The gecko bridge simply has getAccessibleAtPoint return itself
-                # if there are no further children
-                break
-        if inner_container == parent:
-            return None
-        else:
-            return inner_container
+                # Popup bailed out
+                pass
+        self._coords_cache=(generation, windows, popups)
+        return windows, popups
+
+    def _coords_stack(self, window_order, guis):
+        """
+        @param guis: Open windows, from _list_guis
+        @type guis: list
+
+        @return: list of (window name, wnck window, gui), top most first
+        @rtype: list
+        """
+        guis_by_name={}
+        for gui in guis:
+            guis_by_name.setdefault(gui.name, gui)
+        windows=[]
+        for name, w in window_order:
+            if name == 'Untitled window':
+                # wnck returns empty window name as "Untitled window"
+                # also gui.name doesn't match wnck window name in some
+                # cases, eg: Gedit Question dialog, when you try to
+                # close unsaved document. Take the application window,
+                # not known to wnck, as the window
+                pid=w.get_pid()
+                if not pid:
+                    continue
+                process_name=window_stack.process_name(pid)
+                child_windows=[child_window.get_name() for child_window in \
+                                 w.get_application().get_windows()]
+                for app in self._list_apps():
+                    if not app[0] or process_name != app[0].name:
+                        continue
+                    gui=None
+                    for gui in app[0]:
+                        if gui and gui.name not in child_windows:
+                            # Let us assume, just only one window
+                            # with 'Untitled window'
+                            break
+                        gui=None
+                    if gui:
+                        windows.append((gui.name, w, gui))
+                        break
+            elif name in guis_by_name:
+                windows.append((name, w, guis_by_name[name]))
+        windows.reverse()
+        return windows
 
     def getobjectnameatcoords(self, wait_time=0.0):
         """
@@ -1440,11 +1535,10 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
         @type timeout: double
 
         
-        @return: window name as string and all possible object names
-                matching name and type as list of string [objectname]
-        @rtype: (string, list)
+        @return: window name and object name under the mouse pointer
+        @rtype: (string, string)
         """
-        if not wnckModule:
+        if not get_wnck():
           raise LdtpServerException('Install python wnck module')
         self.wait(wait_time)
         # Following lines from Accerciser, _inspectUnderMouse method
@@ -1457,105 +1551,79 @@ class Ldtpd(ComboBox, Table, Menu, PageTabList,
            display=gtk.gdk.Display(gtk.gdk.get_display())
            screen, x, y, flags=display.get_pointer()
            del screen # A workaround http://bugzilla.gnome.org/show_bug.cgi?id=593732
-        # Bug in wnck, if the following 2 lines are not called
-        # wnck returns empty list
-        while gtk.events_pending():
-            gtk.main_iteration()
-        if gtk3:
-          wnck_screen=wnck.Screen.get_default()
-        else:
-          wnck_screen=wnck.screen_get_default()
-        wnck_screen.force_update()
-
-        window_order=[(w.get_name(), w) \
-                        for w in wnck_screen.get_windows_stacked()]
-        tmp_window_order=[]
-        for w in window_order:
-            if w[0] != 'Untitled window':
-                # If not 'Untitled window', just assign it directly to
-                # tmp_window_order
-                tmp_window_order.append(w)
-                continue
-            # Get PID
-            pid=w[1].get_pid()
-            if not pid:
-                # PID not found
+
+        # Spatial indexes are kept from the first lookup on, a window
+        # mapped before has no index and is mapped again below
+        spatial_indexes.enable()
+        windows, popups=self._coords_windows()
+        for gui in popups:
+            try:
+                extents=atspi.get_extents(gui)
+                if extents and extents[0] <= x < extents[0] + extents[2] and \
+                        extents[1] <= y < extents[1] + extents[3] and \
+                        gui.queryComponent().getLayer() == atspi.LAYER_POPUP:
+                    # A popup menu is the top-most component
+                    return (None, None)
+            except:
+                # Popup bailed out
+                pass
+        for name, w, gui in windows:
+            # wnck geometry doesn't need a call to the application
+            wx, wy, width, height=w.get_geometry()
+            if not (wx <= x < wx + width and wy <= y < wy + height):
                 continue
-            # Get process name
-            ps=subprocess.Popen('ps ch -o %%c %d' % pid, shell=True,
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE)
-            stdout, stderr=ps.communicate()
-            # Strip \n
-            stdout=re.sub('\n', '', stdout)
-            # Get child_windows of current application
-            child_windows=[child_window.get_name() for child_window in \
-                             w[1].get_application().get_windows()]
-            for app in self._list_apps():
-                if not app[0]:
-                    continue
-                if stdout != app[0].name:
+            window_handle, window_name=self._get_window_handle(name)
+            if not window_handle:
+                return (None, None)
+            window_extents=atspi.get_extents(window_handle)
+            appmap=self._appmap_pairs(window_handle, window_name)
+            index=spatial_indexes.get(appmap)
+            remapped=regridded=False
+            while True:
+                if not index:
+                    if remapped:
+                        return (None, None)
+                    # Mapped before the first lookup, or an object is gone
+                    appmap=self._appmap_pairs(window_handle, window_name,
+                                              True)
+                    index=spatial_indexes.get(appmap)
+                    remapped=True
                     continue
-                # if stdout == app[0].name:
-                for gui in app[0]:
-                    if not gui: continue
-                    # If current a11y gui.name doesn't match the
-                    # Wnck window names, let us assume, its the window
-                    # name, replace 'Untitled window' with gui.name
-                    if gui.name not in child_windows:
-                        # Direct tuple assignment is not possible
-                        # and so assigning in tmp tuple list
-                        tmp_window_order.append((gui.name, w[1]))
-                        # Let us assume, just only one window
-                        # with 'Untitled window'
-                        break
-
-        # Assign back tmp_window_order to window_order, after all the iteration
-        window_order=tmp_window_order
-
-        top_window=(None, -1)
-        z_order=-1
-        for gui in self._list_guis():
-            acc=self._getComponentAtCoords(gui, x, y)
-            if acc:
+                if index.grid is None:
+                    index.build(window_extents)
+                    metrics.incr('spatial_index_builds')
+                object_name=index.find(x, y, window_extents)
+                if not object_name:
+                    # Only the window itself at x, y
+                    return (None, None)
                 try:
-                    for w in window_order:
-                        if gui.name == w[0]:
-                            # wnck returns empty window name as "Untitled window"
-                            # also gui.name doesn't match wnck window name in some cases
-                            # eg: Gedit Question dialog, when you try to close
-                            # unsaved document
-                            z_order=window_order.index(w)
-                            break
-                except ValueError:
-                    # It's possibly a popup menu, so it would not be in our frame name
-                    # list. And if it is, it is probably the top-most component.
-                    try:
-                        if acc.queryComponent().getLayer() == pyatspi.LAYER_POPUP:
-                            return (None, None)
-                    except:
-                        pass
+                    acc=index.objects[object_name]
+                    extents=None
+                    if atspi.has_state(acc, atspi.STATE_SHOWING):
+                        extents=atspi.get_extents(acc)
+                    gone=atspi.has_state(acc, atspi.STATE_DEFUNCT)
+                except:
+                    # Object bailed out
+                    extents=None
+                    gone=True
+                if extents and \
+                        extents[0] <= x < extents[0] + extents[2] and \
+                        extents[1] <= y < extents[1] + extents[3]:
+                    metrics.incr('spatial_index_hits')
+                    return (window_name, object_name)
+                metrics.incr('spatial_index_stale')
+                if gone:
+                    if remapped:
+                        return (None, None)
+                    index=None
+                elif regridded:
+                    # Still moving, eg: animated or scrolled
+                    return (None, None)
                 else:
-                    if z_order > top_window[1]:
-                        top_window=(acc, z_order)
-        if top_window[0]:
-            # top_window[1] holds the window name and Wnck window info
-            # [0] holds the window name
-            window_name=window_order[top_window[1]][0]
-            child_object=top_window[0]
-            child_list=self.getchild(window_name, child_object.name,
-                                       child_object.getRoleName())
-            if len(child_list) > 1:
-                # If child list is more than 1 child, then
-                # return the list to the caller
-                possible_child=child_list
-            else:
-                # else, just return the only element
-                possible_child=child_list[0]
-            # NOTE: Bug, when a window title is empty
-            # the accessibility window in the list matching the
-            # x, y coordinates is returned !
-            return (self._get_window_handle(window_name)[1], possible_child)
+                    # Hidden or moved since the grid was built, the
+                    # appmap still holds the objects
+                    index.grid=None
+                    regridded=True
         return (None, None)
 
     def getaccesskey(self, window_name, object_name):
@@ -19,46 +19,33 @@ See 'COPYING' in the source distribution for more information.
 Headers in this file shall remain intact.
 """
 
-import gc
-import os
-try:
-  # If we have gtk3+ gobject introspection, use that
-  import gi
-  gi.require_version('Gtk', '3.0')
-  from gi.repository import Gtk as gtk, Gdk as gdk
-  gtk3 = True
-except:
-  # No gobject introspection, use gtk2
-  import gtk
-  gtk3 = False
-import pyatspi 
-import tempfile
-from base64 import b64encode
-
-from .utils import Utils
+import io
+from .backends import atspi
+from base64 import b64encode, b64decode
+from xmlrpc.client import Binary
+
+from .utils import Utils, gtk3
 from .server_exception import LdtpServerException
+from .screen_recorder import screen_recorder
+
+# Capture formats, raw is binary PPM, uncompressed RGB
+_capture_formats = ('png', 'jpeg', 'raw')
+
+# comparecapture baselines, id: decoded RGB image, kept until deleted
+_baselines = {}
+
+# Largest side, in pixels, of the comparecapture diff image
+_diff_image_size = 320
 
 class Generic(Utils):
-    def imagecapture(self, window_name = None, x = 0, y = 0,
-                     width = None, height = None):
+    def _capture_pixbuf(self, window_name = None, x = 0, y = 0,
+                        width = None, height = None):
         """
-        Captures screenshot of the whole desktop or given window
-        
-        @param window_name: Window name to look for, either full name,
-        LDTP's name convention, or a Unix glob.
-        @type window_name: string
-        @param x: x co-ordinate value
-        @type x: int
-        @param y: y co-ordinate value
-        @type y: int
-        @param width: width co-ordinate value
-        @type width: int
-        @param height: height co-ordinate value
-        @type height: int
+        Capture the desktop, or a window, to a pixbuf
 
-        @return: screenshot with base64 encoded for the client
-        @rtype: string
-        """	
+        @return: pixbuf, None if the capture failed
+        @rtype: object
+        """
         # Validate the parameters
         # x and y offsets cannot be nagative
         x = max(0, x)
@@ -66,22 +53,21 @@ class Generic(Utils):
 
         # height and width cannot be less than 1
         # set to None if nagative value is given
-        if width < 1:
+        if width is not None and width < 1:
             width = None
-        if height < 1:
+        if height is not None and height < 1:
             height = None
-	
         if window_name:
             acc = None
             for gui in self._list_guis():
                 if self._match_name_to_acc(window_name, gui):
-                    if 'Component' in pyatspi.listInterfaces(gui):
+                    if 'Component' in atspi.listInterfaces(gui):
                         acc = gui
                         for obj in self._list_objects(gui):
                             role = obj.getRole()
-                            if role == pyatspi.ROLE_CHECK_BOX or \
-                                    role == pyatspi.ROLE_PUSH_BUTTON or \
-                                    role == pyatspi.ROLE_RADIO_BUTTON:
+                            if role == atspi.ROLE_CHECK_BOX or \
+                                    role == atspi.ROLE_PUSH_BUTTON or \
+                                    role == atspi.ROLE_RADIO_BUTTON:
                                 try:
                                     # Try to grab focus
                                     self._grab_focus(obj)
@@ -94,7 +80,7 @@ class Generic(Utils):
             if not acc:
                 raise LdtpServerException('No window matches %s' % window_name)
             icomponent = acc.queryComponent()
-            bb = icomponent.getExtents(pyatspi.DESKTOP_COORDS)
+            bb = icomponent.getExtents(atspi.DESKTOP_COORDS)
             # If co-ordinates are provided, use it
             # offsets cannot be greater than or equal to the window size
             # we want to capture at least one pixel
@@ -134,8 +120,9 @@ class Generic(Utils):
             x = x + max(0, bb.x)
             y = y + max(0, bb.y)
 
-        tmpFile = tempfile.mktemp('.png', 'ldtpd_')
+        # Pixbuf support is loaded on the first capture
         if gtk3:
+           from gi.repository import Gdk as gdk
            window = gdk.get_default_root_window()
            tmp_size = window.get_geometry()
            size = []
@@ -159,12 +146,10 @@ class Generic(Utils):
                height = size[1] - y
            else:
                height = min(height, size[1] - y)
-           pb = gdk.pixbuf_get_from_window(window, x, y, width,
-                                           height)
-           pb.savev(tmpFile, 'png', [], [])
-           del pb
-           gc.collect()
+           return gdk.pixbuf_get_from_window(window, x, y, width,
+                                             height)
         else:
+           import gtk
            window = gtk.gdk.get_default_root_window()
            size = window.get_size()
            # offsets cannot be greater than or equal to the desktop size
@@ -190,12 +175,282 @@ class Generic(Utils):
                                       x, y, 0, 0, 
                                       width, 
                                       height)
+           return pb
+
+    def _encode_pixbuf(self, pb, format = 'png', quality = -1):
+        """
+        Encode a pixbuf in memory
+
+        @param format: png, jpeg or raw
+        @type format: string
+        @param quality: png compression level, 0 - 9, or jpeg quality,
+        0 - 100, -1 for the default
+        @type quality: integer
+
+        @return: encoded image
+        @rtype: bytes
+        """
+        if format == 'raw':
+            return self._pixbuf_to_ppm(pb)
+        keys = []
+        values = []
+        if quality is not None and quality >= 0:
+            keys.append('compression' if format == 'png' else 'quality')
+            values.append(str(quality))
+        if gtk3:
+            success, data = pb.save_to_bufferv(format, keys, values)
+            if not success:
+                raise LdtpServerException('Unable to encode %s image' % format)
+            return data
+        chunks = []
+        pb.save_to_callback(chunks.append, format, dict(zip(keys, values)))
+        return b''.join(chunks)
+
+    def _pixbuf_rgb(self, pb):
+        """
+        @return: pixbuf pixels, packed RGB rows
+        @rtype: bytes
+        """
+        width = pb.get_width()
+        height = pb.get_height()
+        channels = pb.get_n_channels()
+        rowstride = pb.get_rowstride()
+        pixels = pb.get_pixels()
+        if channels == 3 and rowstride == width * 3:
+            return bytes(pixels[:width * height * 3])
+        rows = []
+        for row in range(height):
+            line = pixels[row * rowstride:row * rowstride + width * channels]
+            if channels == 4:
+                # Drop alpha
+                line = bytearray(line)
+                del line[3::4]
+            rows.append(bytes(line))
+        return b''.join(rows)
+
+    def _pixbuf_to_ppm(self, pb):
+        return b'P6\n%d %d\n255\n' % (pb.get_width(), pb.get_height()) + \
+            self._pixbuf_rgb(pb)
+
+    def imagecapture(self, window_name = None, x = 0, y = 0,
+                     width = None, height = None, format = 'png',
+                     quality = -1, binary = False):
+        """
+        Captures screenshot of the whole desktop or given window
+        
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param x: x co-ordinate value
+        @type x: int
+        @param y: y co-ordinate value
+        @type y: int
+        @param width: width co-ordinate value
+        @type width: int
+        @param height: height co-ordinate value
+        @type height: int
+        @param format: png, jpeg, or raw for uncompressed PPM
+        @type format: string
+        @param quality: png compression level, 0 - 9, 0 is the fastest,
+        or jpeg quality, 0 - 100, -1 for the default
+        @type quality: int
+        @param binary: Return the image as XML-RPC binary, instead of
+        a base64 string
+        @type binary: boolean
+
+        @return: screenshot with base64 encoded for the client
+        @rtype: string
+        """
+        if format not in _capture_formats:
+            raise LdtpServerException('Invalid format %s, use one of %s' % \
+                                          (format, ', '.join(_capture_formats)))
+        pb = self._capture_pixbuf(window_name, x, y, width, height)
+        if not pb:
+            raise LdtpServerException('Unable to capture screen')
+        data = self._encode_pixbuf(pb, format, quality)
+        if binary:
+            return Binary(data)
+        return b64encode(data).decode('ascii')
+
+    def _pil(self):
+        try:
+            from PIL import Image
+        except ImportError:
+            raise LdtpServerException('Python-Imaging package not installed')
+        return Image
+
+    def _pixbuf_to_image(self, pb):
+        mode = 'RGBA' if pb.get_has_alpha() else 'RGB'
+        return self._pil().frombuffer(mode, (pb.get_width(), pb.get_height()),
+                                      bytes(pb.get_pixels()), 'raw', mode,
+                                      pb.get_rowstride(), 1)
+
+    def uploadbaseline(self, baseline_id, data):
+        """
+        Store a baseline image in the daemon, for comparecapture
+
+        @param baseline_id: Baseline name, an existing baseline is replaced
+        @type baseline_id: string
+        @param data: Image, png, jpeg or PPM, as XML-RPC binary or base64
+        @type data: binary
+
+        @return: 1 on success.
+        @rtype: integer
+        """
+        data = getattr(data, 'data', data)
+        if isinstance(data, str):
+            data = b64decode(data)
+        try:
+            image = self._pil().open(io.BytesIO(data))
+            image = image.convert('RGB')
+        except (IOError, ValueError):
+            raise LdtpServerException('Unable to read baseline %s image' % \
+                                          baseline_id)
+        _baselines[baseline_id] = image
+        return 1
+
+    def deletebaseline(self, baseline_id):
+        """
+        Remove a baseline image stored with uploadbaseline
+
+        @param baseline_id: Baseline name
+        @type baseline_id: string
+
+        @return: 1 on success.
+        @rtype: integer
+        """
+        if _baselines.pop(baseline_id, None) is None:
+            raise LdtpServerException('No baseline %s' % baseline_id)
+        return 1
 
-           if pb:
-              pb.save(tmpFile, 'png')
-              del pb
-              gc.collect()
-        rv = b64encode(open(tmpFile).read())
-        os.remove(tmpFile)
-        return rv
+    def comparecapture(self, window_name, baseline_id, region = None,
+                       tolerance = 0, mask = None, diff_image = False):
+        """
+        Capture the desktop, or a window, and compare it with a baseline
+        in the daemon, only the result is sent to the client
+
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob. Empty for the desktop.
+        @type window_name: string
+        @param baseline_id: Baseline name, from uploadbaseline
+        @type baseline_id: string
+        @param region: x, y, width, height captured, relative to the
+        window, empty for the whole window
+        @type region: list
+        @param tolerance: Largest channel difference ignored, 0 - 255,
+        or [red, green, blue]
+        @type tolerance: integer
+        @param mask: x, y, width, height regions to ignore, relative to
+        the captured region
+        @type mask: list
+        @param diff_image: Return a scaled down png of the differences
+        @type diff_image: boolean
+
+        @return: percent of the pixels that differ, boxes of the
+        differing regions as [x, y, width, height], size of the capture,
+        and the png as XML-RPC binary in image if requested. If the
+        capture and baseline sizes differ, percent is 100, with
+        size_mismatch and baseline_size, and no image.
+        @rtype: dict
+        """
+        if baseline_id not in _baselines:
+            raise LdtpServerException('No baseline %s, use uploadbaseline' % \
+                                          baseline_id)
+        x, y, width, height = region or (0, 0, None, None)
+        pb = self._capture_pixbuf(window_name or None, x, y, width, height)
+        if not pb:
+            raise LdtpServerException('Unable to capture screen')
+        from ldtputils.imagediff import imagediff
+        capture = self._pixbuf_to_image(pb)
+        baseline = _baselines[baseline_id]
+        if capture.size != baseline.size:
+            # Not comparable, the overlap alone could match
+            return {'percent' : 100.0,
+                    'boxes' : [[0, 0, capture.size[0], capture.size[1]]],
+                    'size' : list(capture.size),
+                    'baseline_size' : list(baseline.size),
+                    'size_mismatch' : True}
+        try:
+            percent, heatmap, boxes = imagediff(baseline,
+                                                capture, tolerance, mask,
+                                                heatmap = bool(diff_image),
+                                                boxes = True)
+        except Exception as e:
+            raise LdtpServerException(str(e))
+        result = {'percent' : percent,
+                  'boxes' : [list(box) for box in boxes],
+                  'size' : list(capture.size),
+                  'size_mismatch' : False}
+        if heatmap is not None:
+            heatmap.thumbnail((_diff_image_size, _diff_image_size))
+            output = io.BytesIO()
+            heatmap.save(output, 'png')
+            result['image'] = Binary(output.getvalue())
+        return result
+
+    def _recorder_frame(self):
+        # Recorder thread, the capture itself runs on the main loop
+        pb = screen_recorder.on_main_loop(self._capture_pixbuf)
+        if not pb:
+            return None
+        if screen_recorder.scale < 1:
+            width = max(1, int(pb.get_width() * screen_recorder.scale))
+            height = max(1, int(pb.get_height() * screen_recorder.scale))
+            if gtk3:
+                from gi.repository import GdkPixbuf
+                interp = GdkPixbuf.InterpType.BILINEAR
+            else:
+                import gtk
+                interp = gtk.gdk.INTERP_BILINEAR
+            pb = pb.scale_simple(width, height, interp)
+        return pb.get_width(), pb.get_height(), self._pixbuf_rgb(pb)
+
+    def startscreenrecorder(self, fps = 2, seconds = 30, scale = 0.5):
+        """
+        Record the desktop in the background, keeping the last seconds,
+        eg: to see what led to a test failure. A previous recording is
+        dropped.
+
+        @param fps: Frames per second, up to 10
+        @type fps: double
+        @param seconds: Seconds of recording kept
+        @type seconds: double
+        @param scale: Frame scale, 0 - 1
+        @type scale: double
 
+        @return: 1 on success.
+        @rtype: integer
+        """
+        try:
+            screen_recorder.start(self._recorder_frame, float(fps),
+                                  float(seconds), float(scale))
+        except ValueError as e:
+            raise LdtpServerException(str(e))
+        return 1
+
+    def stopscreenrecorder(self):
+        """
+        Stop the screen recorder, the recording is kept for
+        dumpscreenrecording
+
+        @return: 1 on success.
+        @rtype: integer
+        """
+        screen_recorder.stop()
+        return 1
+
+    def dumpscreenrecording(self, format = 'apng'):
+        """
+        Export the screen recording, the recorder keeps running
+
+        @param format: apng, an animated png, or frames, a zip of png
+        files and an index.json with the frame times
+        @type format: string
+
+        @return: recording, as XML-RPC binary
+        @rtype: binary
+        """
+        try:
+            return Binary(screen_recorder.dump(format))
+        except ValueError as e:
+            raise LdtpServerException(str(e))
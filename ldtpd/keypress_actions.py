@@ -21,11 +21,12 @@ Headers in this file shall remain intact.
 
 import re
 import time
+from functools import lru_cache
 try:
   from gi.repository import GObject as gobject
 except:
   import gobject
-import pyatspi
+from .backends import atspi
 import subprocess
 
 from .sequence_step import AtomicAction
@@ -71,131 +72,222 @@ def _get_keyboard_keycodes():
         key = re.split(" ", split[1], 3)[1].lower()
         _non_print_key_val[key] = keycode
 
-_get_keyboard_keycodes()
+_keymap_loaded = False
+
+def _load_keymap():
+  """
+  Add the keycodes of the current keyboard map to the key names, on
+  the first key name lookup, instead of running xmodmap on import
+  """
+  global _keymap_loaded
+  if not _keymap_loaded:
+    _keymap_loaded = True
+    try:
+      _get_keyboard_keycodes()
+    except (OSError, ValueError, IndexError):
+      # Keep the default key names
+      pass
+
+# A - Z / a - z
+_char_key = {'a' : 38, 'b' : 56, 'c' : 54, 'd' : 40, 'e' : 26,
+             'f' : 41, 'g' : 42, 'h' : 43, 'i' : 31, 'j' : 44,
+             'k' : 45, 'l' : 46, 'm' : 58, 'n' : 57, 'o' : 32,
+             'p' : 33, 'q' : 24, 'r' : 27, 's' : 39, 't' : 28,
+             'u' : 30, 'v' : 55, 'w' : 25, 'x' : 53, 'y' : 29,
+             'z' : 52}
+# 0 - 9
+_digit_key = {'0' : 19, '1' : 10, '2' : 11, '3' : 12, '4' : 13,
+              '5' : 14, '6' : 15, '7' : 16, '8' : 17, '9' : 18}
+# Symbols
+_symbol_key_val = {'-' : 20, '=' : 21, '[' : 34,
+                   ']' : 35, ';' : 47, '\'' : 48,
+                   '`' : 49, '\\' : 51, ',' : 59,
+                   '.' : 60, '/' : 61, ' ' : 65}
+_symbol_shift_key_val = {'!' : 10, '@' : 11, '#' : 12,
+                         '$' : 13, '%' : 14, '^' : 15,
+                         '&' : 16, '*' : 17, '(' : 18,
+                         ')' : 19, '_' : 20, '+' : 21,
+                         '{' : 34, '}' : 35, ':' : 47,
+                         '"' :48, '~' : 49, '|' : 51,
+                         '<' : 59, '>' : 60, '?' : 61}
+
+# Maximum key name length, between < and >
+_max_tok_size = 15
+
+# Compiled key sequences kept, by input string
+_max_key_sequences = 256
+
+_undefined_key = -1
 
 class KeyCombo:
-  def __init__(self):
-    self.shift = False
-    self.capslck = False
-    self.non_print_key = False
-    self.value = None
+  """
+  Key value. Instances are shared by the parsed key sequences, don't
+  modify them.
+  """
+  __slots__ = ('shift', 'capslck', 'non_print_key', 'value')
+
+  def __init__(self, value=None, shift=False, capslck=False,
+               non_print_key=False):
+    self.shift = shift
+    self.capslck = capslck
+    self.non_print_key = non_print_key
+    self.value = value
+
+def _build_single_keys():
+  # Lowest priority first, the earlier lookups in the original
+  # order win
+  keys = {}
+  for keyval, value in _symbol_shift_key_val.items():
+    keys[keyval] = KeyCombo(value, shift=True)
+  for keyval, value in _symbol_key_val.items():
+    keys[keyval] = KeyCombo(value)
+  for keyval, value in _digit_key.items():
+    keys[keyval] = KeyCombo(value)
+  for keyval, value in _char_key.items():
+    # Capital characters, capslock + small character
+    keys[keyval.upper()] = KeyCombo(value, capslck=True)
+  for keyval, value in _char_key.items():
+    keys[keyval] = KeyCombo(value)
+  return keys
+
+# Single character key values
+_single_keys = _build_single_keys()
+
+_undefined_key_val = KeyCombo(_undefined_key)
+
+def _get_key_value(keyval):
+  """
+  @return: L{KeyCombo} of a character or a key name, value is
+  _undefined_key if unknown
+  @rtype: object
+  """
+  if len(keyval) == 1:
+    return _single_keys.get(keyval, _undefined_key_val)
+  # This is for identifying non printing keys like numlock,
+  # capslock, etc
+  _load_keymap()
+  value = _non_print_key_val.get(keyval.lower(), None)
+  if value is None:
+    return _undefined_key_val
+  return KeyCombo(value, non_print_key=True)
+
+@lru_cache(maxsize=_max_key_sequences)
+def parse_key_sequence(input_str):
+  """
+  Parse a key sequence, eg: <ctrl>s or Hello<enter>, cached by
+  input string
+
+  @param input_str: Characters and <key name>s
+  @type input_str: string
+
+  @return: tuple of L{KeyCombo}, None if a key is invalid
+  @rtype: tuple
+  """
+  key_vals = []
+  index = 0
+  while index < len(input_str):
+    # Identified a Non Printing Key
+    if input_str[index] == '<':
+      end = input_str.find('>', index + 1, index + 2 + _max_tok_size)
+      if end == -1:
+        # Premature end of string without a closing '>'
+        return None
+      token = input_str[index + 1:end]
+      index = end + 1
+    else:
+      token = input_str[index]
+      index += 1
+    key_val = _get_key_value(token)
+    if key_val.value == _undefined_key:
+      # Invalid key
+      return None
+    key_vals.append(key_val)
+  return tuple(key_vals)
+
+@lru_cache(maxsize=_max_key_sequences)
+def compile_key_sequence(input_str):
+  """
+  Compile a key sequence to the keyboard events typing it, with
+  modifier presses and releases, cached by input string
+
+  @param input_str: Characters and <key name>s
+  @type input_str: string
+
+  @return: tuple of (hardware code, event type), None where a key
+  interval is waited, before each key. None if a key is invalid
+  @rtype: tuple
+  """
+  key_combo = parse_key_sequence(input_str)
+  if not key_combo:
+    return None
+  events = []
+  for index, key_val in enumerate(key_combo):
+    if key_val.non_print_key == True:
+      _type = atspi.KEY_PRESS
+    else:
+      _type = atspi.KEY_PRESSRELEASE
+
+    if key_val.shift:
+      # press shift
+      events.append((50, atspi.KEY_PRESS))
+    if key_val.capslck:
+      # press / release capslck
+      events.append((66, atspi.KEY_PRESSRELEASE))
+
+    events.append(None)
+    events.append((key_val.value, _type))
+
+    if key_val.shift:
+      # release shift
+      events.append((50, atspi.KEY_RELEASE))
+    if key_val.capslck:
+      # press / release capslck
+      events.append((66, atspi.KEY_PRESSRELEASE))
+
+    if key_val.non_print_key == False:
+      # If NOT found non_print_key, then release all
+      # non_print_key
+      while index >= 0:
+        index -= 1
+        if index == -1:
+          break
+        tmp_key_val = key_combo[index]
+        # EX: <alt><tab> - Here release both alt and tab
+        # <alt>m - 
+        if tmp_key_val.non_print_key == False:
+          break
+        # Release all non_print_key
+        events.append((tmp_key_val.value, atspi.KEY_RELEASE))
+
+  index = len(key_combo) - 1
+  if key_val.non_print_key == False:
+    index -= 1
+  while index >= 0:
+    tmp_key_val = key_combo[index]
+    index -= 1
+    # EX: <alt><tab> - Here release both alt and tab
+    if tmp_key_val.non_print_key == False:
+      break
+    # Release all non_print_key
+    events.append((tmp_key_val.value, atspi.KEY_RELEASE))
+  return tuple(events)
 
 class KeyboardOp:
   def __init__(self):
     self._downchar = 12
     self._upchar = 21
-    self._undefined_key = -1
+    self._undefined_key = _undefined_key
     self._max_tokens = 256
-    self._max_tok_size = 15
+    self._max_tok_size = _max_tok_size
 
   def _get_key_value(self, keyval):
-    # A - Z / a - z
-    _char_key = {'a' : 38, 'b' : 56, 'c' : 54, 'd' : 40, 'e' : 26,
-                 'f' : 41, 'g' : 42, 'h' : 43, 'i' : 31, 'j' : 44,
-                 'k' : 45, 'l' : 46, 'm' : 58, 'n' : 57, 'o' : 32,
-                 'p' : 33, 'q' : 24, 'r' : 27, 's' : 39, 't' : 28,
-                 'u' : 30, 'v' : 55, 'w' : 25, 'x' : 53, 'y' : 29,
-                 'z' : 52}
-    # 0 - 9
-    _digit_key = {'0' : 19, '1' : 10, '2' : 11, '3' : 12, '4' : 13,
-                  '5' : 14, '6' : 15, '7' : 16, '8' : 17, '9' : 18}
-    # Symbols
-    _symbol_key_val = {'-' : 20, '=' : 21, '[' : 34,
-                       ']' : 35, ';' : 47, '\'' : 48,
-                       '`' : 49, '\\' : 51, ',' : 59,
-                       '.' : 60, '/' : 61, ' ' : 65}
-    _symbol_shift_key_val = {'!' : 10, '@' : 11, '#' : 12,
-                             '$' : 13, '%' : 14, '^' : 15,
-                             '&' : 16, '*' : 17, '(' : 18,
-                             ')' : 19, '_' : 20, '+' : 21,
-                             '{' : 34, '}' : 35, ':' : 47,
-                             '"' :48, '~' : 49, '|' : 51,
-                             '<' : 59, '>' : 60, '?' : 61}
-
-    return_val = KeyCombo()
-    if len(keyval) == 1:
-      # This will identify small characters
-      if keyval in _char_key:
-        return_val.shift = False
-        return_val.capslck = False
-        return_val.non_print_key = False
-        return_val.value = _char_key[keyval]
-        return return_val
-      # This will identify Capital Charaters i.e. Shift+Small
-      # Character
-      if keyval.lower() in _char_key:
-        return_val.shift = False
-        return_val.capslck = True
-        return_val.non_print_key = False
-        return_val.value = _char_key[keyval.lower()]
-        return return_val
-      # This will identify Digits
-      if keyval in _digit_key:
-        return_val.shift = False
-        return_val.capslck = False
-        return_val.non_print_key = False
-        return_val.value = _digit_key[keyval]
-        return return_val
-      # This will identify Symbols
-      # Symbols obtained without using Shift Key
-      if keyval in _symbol_key_val:
-        return_val.shift = False
-        return_val.capslck = False
-        return_val.non_print_key = False
-        return_val.value = _symbol_key_val[keyval]
-        return return_val
-      # Symbols produced with a key combination
-      # including Shift Key
-      if keyval in _symbol_shift_key_val:
-        return_val.shift = True
-        return_val.capslck = False
-        return_val.non_print_key = False
-        return_val.value = _symbol_shift_key_val[keyval]
-        return return_val
-    else:
-      # This is for identifying non printing keys like numlock,
-      # capslock, etc
-      if keyval.lower() in _non_print_key_val:
-        return_val.shift = False
-        return_val.capslck = False
-        return_val.non_print_key = True
-        return_val.value = _non_print_key_val[keyval.lower()]
-        return return_val
-
-    # Key Undefined
-    return_val.shift = False
-    return_val.capslck = False
-    return_val.non_print_key = False
-    return_val.value = self._undefined_key
-    return return_val
+    return _get_key_value(keyval)
 
   def get_keyval_id(self, input_str):
-    index = 0
-    key_vals = []
-    while index  < len(input_str):
-      token = ''
-      # Identified a Non Printing Key
-      if input_str[index] == '<':
-        index += 1
-        i = 0
-        while input_str[index] != '>' and i < self._max_tok_size:
-          token += input_str[index]
-          index += 1
-          i += 1
-        if input_str[index] != '>':
-          # Premature end of string without an opening '<'
-          return None
-        index += 1
-      else:
-        token = input_str[index]
-        index += 1
-  
-      key_val = self._get_key_value(token)
-      if key_val.value == self._undefined_key:
-        # Invalid key
-        return None
-      key_vals.append(key_val)
-    return key_vals
+    key_vals = parse_key_sequence(input_str)
+    if key_vals is None:
+      return None
+    return list(key_vals)
 
 class KeyPressAction(AtomicAction):
   """
@@ -218,8 +310,7 @@ class KeyPressAction(AtomicAction):
     if delta_time > release_max: delta_time = release_max
     self._key_name = key_name
     if key_code is None:
-      self.key_op = KeyboardOp()
-      key_vals = self.key_op.get_keyval_id(key_name)
+      key_vals = parse_key_sequence(key_name)
       if not key_vals:
         return
       for key_val in key_vals:
@@ -234,7 +325,7 @@ class KeyPressAction(AtomicAction):
     @param key_code: Hardware key code.
     @type key_code: integer
     """
-    pyatspi.Registry.generateKeyboardEvent(key_code, None, pyatspi.KEY_PRESS)
+    atspi.Registry.generateKeyboardEvent(key_code, None, atspi.KEY_PRESS)
 
   def __str__(self):
     """
@@ -266,8 +357,7 @@ class KeyReleaseAction(AtomicAction):
     if delta_time > release_max: delta_time = release_max
     self._key_name = key_name
     if key_code is None:
-      self.key_op = KeyboardOp()
-      key_vals = self.key_op.get_keyval_id(key_name)
+      key_vals = parse_key_sequence(key_name)
       if not key_vals:
         return
       for key_val in key_vals:
@@ -282,7 +372,7 @@ class KeyReleaseAction(AtomicAction):
     @param key_code: Hardware key code.
     @type key_code: integer
     """
-    pyatspi.Registry.generateKeyboardEvent(key_code, None, pyatspi.KEY_RELEASE)
+    atspi.Registry.generateKeyboardEvent(key_code, None, atspi.KEY_RELEASE)
 
   def __str__(self):
     """
@@ -310,7 +400,7 @@ class KeyComboAction(AtomicAction):
   @ivar _key_combo: Name of key combination or single key press-release.
   @type _key_combo: string
   """
-  def __init__(self, key_combo, delta_time=0):    
+  def __init__(self, key_combo, delta_time=0, interval=0.01):
     """
     Initialize L{KeyComboAction}.
     
@@ -318,12 +408,16 @@ class KeyComboAction(AtomicAction):
     @type key_combo: string
     @param delta_time: Time to wait before performing step.
     @type delta_time: integer
+    @param interval: Time to wait, in seconds, before each key,
+    0 injects all the events in a row
+    @type interval: float
     """
-    self.key_op = KeyboardOp()
-    key_vals = self.key_op.get_keyval_id(key_combo)
-    if not key_vals:
+    events = compile_key_sequence(key_combo)
+    if not events:
       return
-    self._key_combo = key_vals
+    self._key_combo = key_combo
+    self._interval = interval
+    self._events = events
     if delta_time < min_delta: delta_time = min_delta
     AtomicAction.__init__(self, delta_time, self._doCombo)
 
@@ -336,65 +430,17 @@ class KeyComboAction(AtomicAction):
   def _doCombo(self):
     """
     Perform combo operation.
-    
-    @param key_code: Key code to press.
-    @type key_code: integer
-    @param modifiers: Modifier mask to press with.
-    @type modifiers: integer
     """
-    interval = 0
-    for key_val in self._key_combo:
-      if key_val.non_print_key == True:
-        _type = pyatspi.KEY_PRESS
-      else:
-        _type = pyatspi.KEY_PRESSRELEASE
-
-      if key_val.shift:
-        # press shift
-        pyatspi.Registry.generateKeyboardEvent(50, None, pyatspi.KEY_PRESS)
-      if key_val.capslck:
-        # press / release capslck
-        pyatspi.Registry.generateKeyboardEvent(66, None, pyatspi.KEY_PRESSRELEASE)
-
-      time.sleep(0.01)
-      pyatspi.Registry.generateKeyboardEvent(key_val.value, None, _type)
-
-      if key_val.shift:
-        # release shift
-        pyatspi.Registry.generateKeyboardEvent(50, None, pyatspi.KEY_RELEASE)
-      if key_val.capslck:
-        # press / release capslck
-        pyatspi.Registry.generateKeyboardEvent(66, None, pyatspi.KEY_PRESSRELEASE)
-
-      if key_val.non_print_key == False:
-        # If NOT found non_print_key, then release all
-        # non_print_key
-        index = self._key_combo.index(key_val)
-        while index >= 0:
-          index -= 1
-          if index == -1:
-            break
-          tmp_key_val = self._key_combo[index]
-          # EX: <alt><tab> - Here release both alt and tab
-          # <alt>m - 
-          if tmp_key_val.non_print_key == False:
-            break
-          # Release all non_print_key
-          pyatspi.Registry.generateKeyboardEvent(tmp_key_val.value, None, pyatspi.KEY_RELEASE)
-
-    index = self._key_combo.index(key_val)
-    if key_val.non_print_key == False:
-      index -= 1
-    while index >= 0:
-      tmp_key_val = self._key_combo[index]
-      index -= 1
-      # EX: <alt><tab> - Here release both alt and tab
-      if tmp_key_val.non_print_key == False:
-        break
-      # Release all non_print_key
-      pyatspi.Registry.generateKeyboardEvent(tmp_key_val.value, None, pyatspi.KEY_RELEASE)
-
-    gobject.timeout_add(interval, self.stepDone)
+    interval = self._interval
+    generate = atspi.Registry.generateKeyboardEvent
+    for event in self._events:
+      if event is None:
+        if interval:
+          time.sleep(interval)
+        continue
+      generate(event[0], None, event[1])
+
+    gobject.timeout_add(0, self.stepDone)
 
   def _keyPress(self, hw_code):
     """
@@ -403,7 +449,7 @@ class KeyComboAction(AtomicAction):
     @param hw_code: Hardware code for key.
     @type hw_code: integer
     """
-    pyatspi.Registry.generateKeyboardEvent(hw_code, None, pyatspi.KEY_PRESS)
+    atspi.Registry.generateKeyboardEvent(hw_code, None, atspi.KEY_PRESS)
     return False
 
   def _keyRelease(self, hw_code):
@@ -413,7 +459,7 @@ class KeyComboAction(AtomicAction):
     @param hw_code: Hardware code for key.
     @type hw_code: integer
     """
-    pyatspi.Registry.generateKeyboardEvent(hw_code, None, pyatspi.KEY_RELEASE)
+    atspi.Registry.generateKeyboardEvent(hw_code, None, atspi.KEY_RELEASE)
     return False
 
   def _keyPressRelease(self, keyval):
@@ -423,8 +469,8 @@ class KeyComboAction(AtomicAction):
     @param key_code: Key code.
     @type key_code: integer
     """
-    pyatspi.Registry.generateKeyboardEvent(keyval, None, 
-                                           pyatspi.KEY_PRESSRELEASE)
+    atspi.Registry.generateKeyboardEvent(keyval, None, 
+                                         atspi.KEY_PRESSRELEASE)
     return False
 
   def __str__(self):
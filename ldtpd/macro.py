@@ -0,0 +1,206 @@
+"""
+LDTP v2 macro record and replay.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import time
+from .backends import atspi
+import traceback
+from .utils import Utils
+from .sequence_step import AtomicAction
+from .server_exception import LdtpServerException
+
+# Minimum time, in milliseconds, between two recorded mouse moves
+_motion_interval = 20
+
+class Macro(Utils):
+    """
+    Record keyboard, mouse and window activation events as a compact
+    sequence and replay it inside the daemon.
+
+    Sequence format, list of steps, delta is milliseconds since the
+    previous step:
+      [delta, 'kp', hw_code] - key press
+      [delta, 'kr', hw_code] - key release
+      [delta, 'mb', event_type, x, y] - mouse button, eg: b1p, b1r
+      [delta, 'mm', x, y] - mouse move
+      [delta, 'win', window_name] - wait for window, sync point
+    """
+    _macro_sequence = None
+    _macro_timestamp = None
+    _macro_motion = None
+    _macro_replaying = False
+
+    def _macro_add(self, step):
+        now = time.perf_counter()
+        delta = int(round((now - self._macro_timestamp) * 1000))
+        self._macro_timestamp = now
+        self._macro_sequence.append([delta] + step)
+
+    def _macro_kb_cb(self, event):
+        if self._macro_sequence is None or not event:
+            return False
+        if event.type == atspi.KEY_PRESSED_EVENT:
+            self._macro_add(['kp', event.hw_code])
+        else:
+            self._macro_add(['kr', event.hw_code])
+        # Don't consume the event
+        return False
+
+    def _macro_event_cb(self, event):
+        if self._macro_sequence is None or not event:
+            return
+        try:
+            if event.type.startswith('mouse:button:'):
+                # mouse:button:1p => b1p
+                self._macro_add(['mb', 'b%s' % event.type[13:],
+                                 event.detail1, event.detail2])
+            elif event.type == 'mouse:abs':
+                now = time.perf_counter()
+                if self._macro_motion is not None and \
+                        (now - self._macro_motion) * 1000 < _motion_interval:
+                    # Throttle motion events
+                    return
+                self._macro_motion = now
+                self._macro_add(['mm', event.detail1, event.detail2])
+            elif event.type == 'window:activate' and event.source:
+                abbrev_role, abbrev_name, label_by = \
+                    self._ldtpize_accessible(event.source)
+                self._macro_add(['win', '%s%s' % (abbrev_role, abbrev_name)])
+        except:
+            if self._ldtp_debug:
+                print(traceback.format_exc())
+
+    def _macro_events(self, motion):
+        events = ['mouse:button', 'window:activate']
+        if motion:
+            events.append('mouse:abs')
+        return events
+
+    def startrecording(self, motion=False):
+        """
+        Start recording keyboard, mouse and window activation events
+
+        @param motion: Record mouse moves as well, throttled
+        @type motion: boolean
+
+        @return: 1 on success.
+        @rtype: integer
+        """
+        if self._macro_sequence is not None:
+            raise LdtpServerException('Recording already in progress')
+        self._macro_sequence = []
+        self._macro_motion = None
+        self._macro_record_motion = motion
+        self._macro_timestamp = time.perf_counter()
+        masks = [mask for mask in atspi.allModifiers()]
+        atspi.Registry.registerKeystrokeListener(
+            self._macro_kb_cb, mask=masks,
+            kind=(atspi.KEY_PRESSED_EVENT, atspi.KEY_RELEASED_EVENT))
+        atspi.Registry.registerEventListener(self._macro_event_cb,
+                                             *self._macro_events(motion))
+        return 1
+
+    def stoprecording(self):
+        """
+        Stop recording
+
+        @return: Recorded sequence, can be passed to replaysequence
+        @rtype: list
+        """
+        if self._macro_sequence is None:
+            raise LdtpServerException('Recording not started')
+        masks = [mask for mask in atspi.allModifiers()]
+        atspi.Registry.deregisterKeystrokeListener(
+            self._macro_kb_cb, mask=masks,
+            kind=(atspi.KEY_PRESSED_EVENT, atspi.KEY_RELEASED_EVENT))
+        atspi.Registry.deregisterEventListener(
+            self._macro_event_cb,
+            *self._macro_events(self._macro_record_motion))
+        sequence = self._macro_sequence
+        self._macro_sequence = None
+        return sequence
+
+    def _macro_wait_window(self, window_name):
+        gui, name = self._get_window_handle(window_name, True)
+        if not gui:
+            raise LdtpServerException('Unable to find window "%s"' % \
+                                          window_name)
+
+    def _macro_compile(self, sequence):
+        steps = []
+        for step in sequence:
+            if len(step) < 2:
+                raise LdtpServerException('Invalid step %s' % step)
+            delta, kind, args = step[0], step[1], step[2:]
+            if kind == 'kp':
+                steps.append(AtomicAction(
+                        delta, atspi.Registry.generateKeyboardEvent,
+                        args[0], None, atspi.KEY_PRESS))
+            elif kind == 'kr':
+                steps.append(AtomicAction(
+                        delta, atspi.Registry.generateKeyboardEvent,
+                        args[0], None, atspi.KEY_RELEASE))
+            elif kind == 'mb':
+                steps.append(AtomicAction(delta, self._mouse_event,
+                                          args[1], args[2], args[0]))
+            elif kind == 'mm':
+                steps.append(AtomicAction(delta, self._mouse_event,
+                                          args[0], args[1], 'abs'))
+            elif kind == 'win':
+                steps.append(AtomicAction(delta, self._macro_wait_window,
+                                          args[0]))
+            else:
+                raise LdtpServerException('Invalid step type %s' % kind)
+        return steps
+
+    def replaysequence(self, sequence, speed=1.0):
+        """
+        Replay a sequence returned by stoprecording
+
+        @param sequence: Recorded sequence
+        @type sequence: list
+        @param speed: Replay speed factor, 2.0 replays twice as fast
+        @type speed: float
+
+        @return: 1 on success.
+        @rtype: integer
+        """
+        if self._macro_sequence is not None:
+            raise LdtpServerException('Stop recording before replay')
+        if speed <= 0:
+            raise LdtpServerException('Invalid speed %s' % speed)
+        if self._macro_replaying:
+            raise LdtpServerException('Replay already in progress')
+        # Build all the steps before replay, so that an invalid
+        # sequence fails without generating any event
+        steps = self._macro_compile(sequence)
+        self._macro_replaying = True
+        try:
+            # Steps are scheduled against an absolute deadline, so
+            # the time spent in each step doesn't accumulate as drift
+            deadline = time.perf_counter()
+            for step in steps:
+                deadline += step.delta_time / 1000.0 / speed
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                step()
+                if step._func == self._macro_wait_window:
+                    # Window wait time is not part of the recording
+                    deadline = time.perf_counter()
+        finally:
+            self._macro_replaying = False
+        return 1
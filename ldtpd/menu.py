@@ -20,7 +20,7 @@ Headers in this file shall remain intact.
 """
 
 import re
-import pyatspi 
+from .backends import atspi
 from .utils import Utils
 
 class Menu(Utils):
@@ -121,7 +121,7 @@ class Menu(Utils):
         else:
             obj = self._get_object(window_name, object_name)
 
-        if self._check_state(obj, pyatspi.STATE_CHECKED) == False:
+        if self._check_state(obj, atspi.STATE_CHECKED) == False:
             self._click_object(obj)
 
         return 1
@@ -145,7 +145,7 @@ class Menu(Utils):
         else:
             obj = self._get_object(window_name, object_name)
 
-        if self._check_state(obj, pyatspi.STATE_CHECKED):
+        if self._check_state(obj, atspi.STATE_CHECKED):
             self._click_object(obj)
 
         return 1
@@ -171,7 +171,7 @@ class Menu(Utils):
             else:
                 obj = self._get_object(window_name, object_name, False)
 
-            if self._check_state(obj, pyatspi.STATE_ENABLED):
+            if self._check_state(obj, atspi.STATE_ENABLED):
                 return 1
         except:
             pass
@@ -198,7 +198,7 @@ class Menu(Utils):
             else:
                 obj = self._get_object(window_name, object_name, False)
 
-            if self._check_state(obj, pyatspi.STATE_CHECKED):
+            if self._check_state(obj, atspi.STATE_CHECKED):
                 return 1
         except:
             pass
@@ -225,7 +225,7 @@ class Menu(Utils):
             else:
                 obj = self._get_object(window_name, object_name, False)
 
-            if not self._check_state(obj, pyatspi.STATE_CHECKED):
+            if not self._check_state(obj, atspi.STATE_CHECKED):
                 return 1
         except:
             pass
@@ -0,0 +1,214 @@
+"""
+LDTP v2 daemon metrics.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See "COPYING" in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+
+# Prometheus file, written periodically by the daemon
+ENV_METRICS_FILE = 'LDTP_METRICS_FILE'
+# Interval in seconds between writes of LDTP_METRICS_FILE
+ENV_METRICS_INTERVAL = 'LDTP_METRICS_INTERVAL'
+# HTTP GET path serving the metrics, eg: /metrics
+ENV_METRICS_PATH = 'LDTP_METRICS_PATH'
+
+# Latency histogram buckets, in seconds
+_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+            1.0, 2.5, 5.0, 10.0, 30.0)
+# Latency samples kept per method, for percentiles
+_max_samples = 1024
+
+def _percentile(samples, percent):
+    if not samples:
+        return 0.0
+    return samples[int(round(percent * (len(samples) - 1)))]
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class _MethodStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(_buckets)
+        self.samples = deque(maxlen=_max_samples)
+
+    def observe(self, seconds, error):
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        for i, bound in enumerate(_buckets):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        self.samples.append(seconds)
+
+class Metrics:
+    """
+    Per-method latency and engine counters, shared by the whole daemon
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._start = time.time()
+            self._methods = {}
+            self._counters = {}
+            self._windows = {}
+
+    def observe(self, method, seconds, error=False):
+        """
+        Record one RPC call
+
+        @param method: Method name
+        @type method: string
+        @param seconds: Call duration
+        @type seconds: float
+        @param error: True if the call failed
+        @type error: boolean
+        """
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = _MethodStats()
+            stats.observe(seconds, error)
+
+    def incr(self, counter, value=1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + value
+
+    def remap(self, window_name, seconds, nodes):
+        """
+        Record one appmap build
+
+        @param window_name: Window name, in appmap format
+        @type window_name: string
+        @param seconds: Time taken to build the appmap
+        @type seconds: float
+        @param nodes: Number of objects in the appmap
+        @type nodes: integer
+        """
+        with self._lock:
+            window = self._windows.get(window_name)
+            if window is None:
+                window = self._windows[window_name] = \
+                    {'remaps' : 0, 'remap_time' : 0.0, 'nodes' : 0}
+            window['remaps'] += 1
+            window['remap_time'] += seconds
+            window['nodes'] = nodes
+
+    def snapshot(self):
+        """
+        Metrics as XML-RPC friendly dictionary
+
+        @return: uptime, methods, counters and windows
+        @rtype: dictionary
+        """
+        with self._lock:
+            methods = {}
+            for name, stats in self._methods.items():
+                samples = sorted(stats.samples)
+                buckets = {}
+                cumulative = 0
+                for bound, count in zip(_buckets, stats.buckets):
+                    cumulative += count
+                    buckets[str(bound)] = cumulative
+                buckets['+Inf'] = stats.count
+                methods[name] = {'count' : stats.count,
+                                 'errors' : stats.errors,
+                                 'total' : stats.total,
+                                 'max' : stats.max,
+                                 'p50' : _percentile(samples, 0.50),
+                                 'p95' : _percentile(samples, 0.95),
+                                 'p99' : _percentile(samples, 0.99),
+                                 'buckets' : buckets}
+            return {'uptime' : time.time() - self._start,
+                    'methods' : methods,
+                    'counters' : dict(self._counters),
+                    'windows' : dict((name, dict(window)) for name, window \
+                                         in self._windows.items())}
+
+    def prometheus(self):
+        """
+        Metrics in Prometheus text exposition format
+
+        @return: metrics text
+        @rtype: string
+        """
+        snapshot = self.snapshot()
+        lines = ['# TYPE ldtpd_uptime_seconds gauge',
+                 'ldtpd_uptime_seconds %f' % snapshot['uptime']]
+        # Each metric family is one block, its TYPE line first
+        methods = [('method="%s"' % _escape(name), stats) for name, stats \
+                       in sorted(snapshot['methods'].items())]
+        lines.append('# TYPE ldtpd_requests_total counter')
+        for label, stats in methods:
+            lines.append('ldtpd_requests_total{%s} %d' % (label,
+                                                         stats['count']))
+        lines.append('# TYPE ldtpd_request_errors_total counter')
+        for label, stats in methods:
+            lines.append('ldtpd_request_errors_total{%s} %d' % \
+                             (label, stats['errors']))
+        lines.append('# TYPE ldtpd_request_duration_seconds histogram')
+        for label, stats in methods:
+            for bound in list(map(str, _buckets)) + ['+Inf']:
+                lines.append('ldtpd_request_duration_seconds_bucket'
+                             '{%s,le="%s"} %d' % (label, bound,
+                                                  stats['buckets'][bound]))
+            lines.append('ldtpd_request_duration_seconds_sum{%s} %f' % \
+                             (label, stats['total']))
+            lines.append('ldtpd_request_duration_seconds_count{%s} %d' % \
+                             (label, stats['count']))
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append('# TYPE ldtpd_%s_total counter' % name)
+            lines.append('ldtpd_%s_total %s' % (name, value))
+        windows = [('window="%s"' % _escape(name), window) for name, window \
+                       in sorted(snapshot['windows'].items())]
+        if windows:
+            lines.append('# TYPE ldtpd_window_remaps_total counter')
+            for label, window in windows:
+                lines.append('ldtpd_window_remaps_total{%s} %d' % \
+                                 (label, window['remaps']))
+            lines.append('# TYPE ldtpd_window_remap_seconds_total counter')
+            for label, window in windows:
+                lines.append('ldtpd_window_remap_seconds_total{%s} %f' % \
+                                 (label, window['remap_time']))
+            lines.append('# TYPE ldtpd_window_nodes gauge')
+            for label, window in windows:
+                lines.append('ldtpd_window_nodes{%s} %d' % \
+                                 (label, window['nodes']))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, file_name):
+        """
+        Write Prometheus text to file, replaced atomically so that
+        a scraper never reads a partial file
+        """
+        tmp_file = '%s.tmp' % file_name
+        with open(tmp_file, 'w') as fp:
+            fp.write(self.prometheus())
+        os.rename(tmp_file, file_name)
+
+metrics = Metrics()
@@ -19,11 +19,24 @@ See 'COPYING' in the source distribution for more information.
 Headers in this file shall remain intact.
 """
 
+import re
+import math
 import time
-import pyatspi 
+from .backends import atspi
 from .utils import Utils
 from .server_exception import LdtpServerException
 
+# Mouse motion paths, time fraction to distance fraction
+_motion_paths = {'linear' : lambda t: t,
+                 # Smooth step, slow start and end
+                 'ease' : lambda t: t * t * (3 - 2 * t)}
+
+# Longest jump, in pixels, between two motion events
+_max_motion_step = 50
+
+# Mouse events allowed in a gesture
+_gesture_event = re.compile('^(abs|b[1-5][pcdr])$')
+
 class Mouse(Utils):
     """
     Mouse related events
@@ -136,7 +149,51 @@ class Mouse(Utils):
                                  _coordinates.y + _coordinates.height / 2,
                                  'b1d')
 
-    def simulatemousemove(self, source_x, source_y, dest_x, dest_y, delay = 0.0):
+    def _motion_samples(self, source_x, source_y, dest_x, dest_y,
+                        duration, rate, path):
+        """
+        Points of a mouse move, sampled at rate, source excluded
+
+        @return: list of (seconds since the move start, x, y)
+        @rtype: list
+        """
+        distance = max(abs(dest_x - source_x), abs(dest_y - source_y))
+        count = max(1, int(math.ceil(duration * rate)),
+                    int(math.ceil(distance / float(_max_motion_step))))
+        fraction = _motion_paths[path]
+        samples = []
+        for i in range(1, count + 1):
+            f = fraction(float(i) / count)
+            samples.append((duration * i / count,
+                            int(round(source_x + (dest_x - source_x) * f)),
+                            int(round(source_y + (dest_y - source_y) * f))))
+        return samples
+
+    def _play_motion(self, samples, start):
+        """
+        Generate the motion events, each at start + its time offset.
+        Events are scheduled against the absolute time, so the time
+        spent sending them doesn't accumulate as drift
+        """
+        last = None
+        for offset, x, y in samples:
+            if (x, y) == last:
+                continue
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._mouse_event(x, y, 'abs')
+            last = (x, y)
+
+    def _check_motion(self, rate, path):
+        if rate <= 0:
+            raise LdtpServerException('Invalid rate %s' % rate)
+        if path not in _motion_paths:
+            raise LdtpServerException('Invalid path %s, use one of %s' % \
+                                          (path, ', '.join(sorted(_motion_paths))))
+
+    def simulatemousemove(self, source_x, source_y, dest_x, dest_y, delay = 0.0,
+                          duration = None, rate = 120, path = 'linear'):
         """
         @param source_x: Source X
         @type source_x: integer
@@ -146,12 +203,21 @@ class Mouse(Utils):
         @type dest_x: integer
         @param dest_y: Dest Y
         @type dest_y: integer
-        @param delay: Sleep time between the mouse move
+        @param delay: Sleep time per pixel moved, used to compute the
+        duration when duration is not given
         @type delay: double
+        @param duration: Time of the whole move, in seconds
+        @type duration: double
+        @param rate: Motion events per second, at least one event per
+        50 pixels is sent
+        @type rate: integer
+        @param path: linear, or ease to slow down at the start and the end
+        @type path: string
 
         @return: 1 if simulation was successful, 0 if not.
         @rtype: integer
         """
+        self._check_motion(rate, path)
         size = self._get_geometry()
         if (source_x < size[0] or source_y < size[1] or \
                 dest_x > size[2] or dest_y > size[3]) or \
@@ -159,41 +225,55 @@ class Mouse(Utils):
                      dest_x < size[0] or dest_y < size[1]):
             return 0
 
-        x_flag = False # Iterated x ?
-        y_flag = False # Iterated y ?
-        while True:
-            if not x_flag:
-                if source_x > dest_x:
-                    # If source X greather than dest X
-                    # then move -1 pixel
-                    source_x -= 1
-                elif source_x < dest_x:
-                    # If source X less than dest X
-                    # then move +1 pixel
-                    source_x += 1
-                else:
-                    # If source X equal to dest X
-                    # then don't process X co-ordinate
-                    x_flag = True
-            if not y_flag:
-                if source_y > dest_y:
-                    # If source Y greather than dest Y
-                    # then move -1 pixel
-                    source_y -= 1
-                elif source_y < dest_y:
-                    # If source Y less than dest Y
-                    # then move +1 pixel
-                    source_y += 1
-                else:
-                    # If source Y equal to dest Y
-                    # then don't process Y co-ordinate
-                    y_flag = True
-            if delay:
-                time.sleep(delay)
-            # Start mouse move from source_x, source_y to dest_x, dest_y
-            self.generatemouseevent(source_x, source_y, 'abs')
-            if source_x == dest_x and source_y == dest_y:
-                # If we have reached the dest_x and dest_y
-                # then break the loop
-                break
+        if duration is None:
+            # Previously the delay was slept once per pixel
+            duration = delay * max(abs(dest_x - source_x),
+                                   abs(dest_y - source_y))
+        if duration < 0:
+            raise LdtpServerException('Invalid duration %s' % duration)
+        samples = self._motion_samples(source_x, source_y, dest_x, dest_y,
+                                       duration, rate, path)
+        self._play_motion(samples, time.perf_counter())
+        return 1
+
+    def mousegesture(self, steps, rate = 120, path = 'linear'):
+        """
+        Run a drag or a multi point gesture, in the daemon
+
+        @param steps: List of [x, y, event, dt], event is abs to move,
+        or a button event, eg: b1p, b1r, b1c. dt is the time in seconds
+        since the previous step. A move with dt > 0 is interpolated
+        from the previous step position.
+        eg: [[10, 10, 'b1p', 0], [300, 200, 'abs', 0.5],
+        [300, 200, 'b1r', 0.1]]
+        @type steps: list
+        @param rate: Motion events per second, on interpolated moves
+        @type rate: integer
+        @param path: linear, or ease, on interpolated moves
+        @type path: string
+
+        @return: 1 on success.
+        @rtype: integer
+        """
+        self._check_motion(rate, path)
+        # Validate all the steps before sending any event
+        for step in steps:
+            if len(step) != 4 or not _gesture_event.match(str(step[2])) \
+                    or step[3] < 0:
+                raise LdtpServerException('Invalid step %s' % step)
+        position = None
+        deadline = time.perf_counter()
+        for x, y, event, dt in steps:
+            if event == 'abs' and position and dt > 0:
+                self._play_motion(self._motion_samples(
+                        position[0], position[1], x, y, dt, rate, path),
+                                  deadline)
+                deadline += dt
+            else:
+                deadline += dt
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                self._mouse_event(x, y, event)
+            position = (x, y)
         return 1
@@ -18,7 +18,7 @@ See "COPYING" in the source distribution for more information.
 
 Headers in this file shall remain intact.
 """
-import pyatspi 
+from .backends import atspi
 from .utils import Utils
 from .server_exception import LdtpServerException
 
@@ -49,7 +49,7 @@ class PageTabList(Utils):
                     index += 1
                     continue
                 if self._match_name_to_acc(tab_name, child):
-                    if self._check_state(child, pyatspi.STATE_SELECTED):
+                    if self._check_state(child, atspi.STATE_SELECTED):
                         # Pag tab already selected
                         return 1
                     else:
@@ -118,7 +118,7 @@ class PageTabList(Utils):
                     if not child:
                         continue
                     if self._match_name_to_acc(tab_name, child) and \
-                            self._check_state(child, pyatspi.STATE_SELECTED):
+                            self._check_state(child, atspi.STATE_SELECTED):
                         return 1
             except NotImplementedError:
                 pass
@@ -0,0 +1,188 @@
+"""
+LDTP v2 daemon profiler.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See "COPYING" in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import os
+import sys
+import time
+import cProfile
+import tempfile
+import threading
+
+# Profile mode enabled on daemon startup, cprofile or sample
+ENV_PROFILE = 'LDTP_PROFILE'
+# Directory where profiles are written, on stop
+ENV_PROFILE_DIR = 'LDTP_PROFILE_DIR'
+# Sampling interval in seconds, for sample mode
+ENV_PROFILE_INTERVAL = 'LDTP_PROFILE_INTERVAL'
+
+CPROFILE = 'cprofile'
+SAMPLE = 'sample'
+
+# Methods controlling the profiler, never profiled
+_skip_methods = ('startprofile', 'stopprofile')
+
+def _frame_name(frame):
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                           code.co_firstlineno)
+
+class _Sampler(threading.Thread):
+    """
+    Sample the stack of the thread running the current method
+    """
+    def __init__(self, profiler, interval):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._profiler = profiler
+        self._interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self._interval):
+            current = self._profiler._current
+            if not current:
+                continue
+            ident, method = current
+            frame = sys._current_frames().get(ident)
+            stack = []
+            while frame:
+                if frame.f_code is _profiled_call.__code__:
+                    # Skip profiler and twisted dispatch frames
+                    break
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if not stack:
+                continue
+            stack.reverse()
+            self._profiler._add_sample(method, ';'.join(stack))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+def _profiled_call(profiler, method, function, args, kwargs):
+    profiler._current = (threading.get_ident(), method)
+    try:
+        if profiler.mode == CPROFILE:
+            profile = profiler._profiles.get(method)
+            if profile is None:
+                profile = profiler._profiles[method] = cProfile.Profile()
+            profile.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.disable()
+        return function(*args, **kwargs)
+    finally:
+        profiler._current = None
+
+class Profiler:
+    """
+    Profile RPC dispatch, aggregated per method. cprofile mode dumps
+    one pstats file per method, sample mode dumps one collapsed stack
+    file per method, for flamegraph.pl / speedscope.
+    """
+    def __init__(self):
+        self.mode = None
+        self._lock = threading.Lock()
+        self._current = None
+        self._sampler = None
+        self._profiles = {}
+        self._samples = {}
+
+    @property
+    def active(self):
+        return self.mode is not None
+
+    def start(self, mode=CPROFILE, interval=0.005):
+        """
+        Start profiling
+
+        @param mode: cprofile or sample
+        @type mode: string
+        @param interval: Sampling interval in seconds, for sample mode
+        @type interval: float
+        """
+        if mode not in (CPROFILE, SAMPLE):
+            raise ValueError('Invalid profile mode %s' % mode)
+        if self.active:
+            raise ValueError('Profiler already running in %s mode' % \
+                                 self.mode)
+        self._profiles = {}
+        self._samples = {}
+        if mode == SAMPLE:
+            self._sampler = _Sampler(self, interval)
+            self._sampler.start()
+        self.mode = mode
+
+    def stop(self, output_dir=None):
+        """
+        Stop profiling and write the profiles
+
+        @param output_dir: Output directory, default LDTP_PROFILE_DIR
+        or ldtp-profile-<timestamp> in temp directory
+        @type output_dir: string
+
+        @return: list of files written
+        @rtype: list
+        """
+        if not self.active:
+            return []
+        mode = self.mode
+        self.mode = None
+        if self._sampler:
+            self._sampler.stop()
+            self._sampler = None
+        if not output_dir:
+            output_dir = os.environ.get(ENV_PROFILE_DIR, None) or \
+                os.path.join(tempfile.gettempdir(), 'ldtp-profile-%s' % \
+                                 time.strftime('%Y%m%d-%H%M%S'))
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        files = []
+        if mode == CPROFILE:
+            for method, profile in self._profiles.items():
+                file_name = os.path.join(output_dir, '%s.pstats' % method)
+                profile.dump_stats(file_name)
+                files.append(file_name)
+        else:
+            for method, stacks in self._samples.items():
+                file_name = os.path.join(output_dir, '%s.collapsed' % method)
+                with open(file_name, 'w') as fp:
+                    for stack, count in stacks.items():
+                        fp.write('%s %d\n' % (stack, count))
+                files.append(file_name)
+        self._profiles = {}
+        self._samples = {}
+        return files
+
+    def _add_sample(self, method, stack):
+        with self._lock:
+            stacks = self._samples.setdefault(method, {})
+            stacks[stack] = stacks.get(stack, 0) + 1
+
+    def wrap(self, method, function):
+        """
+        Wrap RPC function, to profile its calls under method name
+        """
+        if method in _skip_methods:
+            return function
+        def _wrapper(*args, **kwargs):
+            return _profiled_call(self, method, function, args, kwargs)
+        return _wrapper
+
+profiler = Profiler()
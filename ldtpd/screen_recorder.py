@@ -0,0 +1,385 @@
+"""
+LDTP v2 rolling screen recorder.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See "COPYING" in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import io
+import json
+import time
+import zlib
+import struct
+import hashlib
+import zipfile
+import threading
+from collections import deque
+
+from .metrics import metrics
+
+# Tile side, in pixels of the scaled frame
+_tile_size = 32
+
+# Most frames per second recorded
+_max_fps = 10
+
+# Seconds the recorder thread waits for the main loop to grab a frame
+_grab_timeout = 1.0
+
+# Dump formats, apng is one animated png, frames a zip of png files
+# and an index.json
+_dump_formats = ('apng', 'frames')
+
+_png_signature = b'\x89PNG\r\n\x1a\n'
+
+def _chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + \
+        struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+def _ihdr(width, height):
+    # 8 bit RGB
+    return _chunk(b'IHDR', struct.pack('>IIBBBBB', width, height,
+                                       8, 2, 0, 0, 0))
+
+def _idat(rows):
+    # Filter type 0 on every row
+    return zlib.compress(b''.join(b'\x00' + row for row in rows), 6)
+
+def _png(width, height, rows):
+    return _png_signature + _ihdr(width, height) + \
+        _chunk(b'IDAT', _idat(rows)) + _chunk(b'IEND', b'')
+
+def _delay(seconds):
+    # fcTL delay, in milliseconds
+    return max(1, min(65535, int(seconds * 1000 + 0.5))), 1000
+
+class _Frame:
+    __slots__ = ('time', 'width', 'height', 'tiles')
+
+    def __init__(self, time, width, height, tiles):
+        self.time = time
+        self.width = width
+        self.height = height
+        # Tile digests, row by row
+        self.tiles = tiles
+
+class _Recorder(threading.Thread):
+    """
+    Grab a frame every interval, late frames are skipped, not queued
+    """
+    def __init__(self, recorder, grab, interval):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._recorder = recorder
+        self._grab = grab
+        self._interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        deadline = time.monotonic()
+        while not self._stop_event.wait(max(0, deadline - time.monotonic())):
+            deadline = max(deadline + self._interval,
+                           time.monotonic())
+            try:
+                frame = self._grab()
+            except Exception:
+                frame = None
+            if self._stop_event.is_set():
+                break
+            if frame is None:
+                metrics.incr('screen_recorder_skipped')
+                continue
+            self._recorder._add_frame(self, time.time(), *frame)
+
+    def stop(self):
+        # Not joined, stop is called on the main loop, the thread may
+        # wait for the main loop to run a grab
+        self._stop_event.set()
+
+class ScreenRecorder:
+    """
+    Last seconds of the screen, in a ring buffer of frames. Frames are
+    cut in tiles, stored once by digest and shared between frames, an
+    unchanged region costs a digest per tile.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._frames = deque()
+        # digest: [zlib compressed tile, frames referencing it]
+        self._tiles = {}
+        self._last = None
+        # Grab queued on the main loop, not run yet
+        self._pending = None
+        self.fps = 0
+        self.scale = 1.0
+
+    @property
+    def active(self):
+        return self._thread is not None
+
+    def start(self, grab, fps=2, seconds=30, scale=0.5):
+        """
+        Start recording, a previous recording is dropped
+
+        @param grab: Called on the recorder thread for each frame,
+        returns width, height and the RGB bytes, or None to skip
+        @type grab: function
+        @param fps: Frames per second
+        @type fps: float
+        @param seconds: Seconds kept
+        @type seconds: float
+        @param scale: Frame scale, 0 - 1
+        @type scale: float
+        """
+        if not 0 < fps <= _max_fps:
+            raise ValueError('fps must be greater than 0, up to %d' % \
+                                 _max_fps)
+        if seconds <= 0:
+            raise ValueError('seconds must be greater than 0')
+        if not 0 < scale <= 1:
+            raise ValueError('scale must be greater than 0, up to 1')
+        self.stop()
+        with self._lock:
+            self._frames = deque(maxlen=max(1, int(fps * seconds + 0.5)))
+            self._tiles = {}
+            self._last = None
+        self.fps = fps
+        self.scale = scale
+        self._thread = _Recorder(self, grab, 1.0 / fps)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop recording, recorded frames are kept for dump
+        """
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+
+    def on_main_loop(self, function, timeout=_grab_timeout):
+        """
+        Call function on the GLib main loop and wait for its result,
+        the display connection is not thread safe
+
+        @return: function result, None if the main loop did not run it
+        in time
+        @rtype: object
+        """
+        try:
+            from gi.repository import GLib
+        except ImportError:
+            return function()
+        done = threading.Event()
+        result = []
+        def call():
+            try:
+                result.append(function())
+            except Exception:
+                result.append(None)
+            done.set()
+            return False
+        if self._pending is not None and not self._pending.is_set():
+            # Main loop has not run the previous grab yet
+            return None
+        self._pending = done
+        GLib.idle_add(call)
+        if not done.wait(timeout):
+            return None
+        return result[0]
+
+    def _split(self, width, height, rgb):
+        stride = width * 3
+        tiles = []
+        for top in range(0, height, _tile_size):
+            rows = [rgb[row * stride:(row + 1) * stride] \
+                        for row in range(top, min(top + _tile_size, height))]
+            for left in range(0, stride, _tile_size * 3):
+                right = left + _tile_size * 3
+                tiles.append(b''.join([row[left:right] for row in rows]))
+        return tiles
+
+    def _add_frame(self, source, timestamp, width, height, rgb):
+        if source is not self._thread:
+            # Grabbed by a stopped recorder thread
+            return
+        digest = hashlib.blake2b(rgb, digest_size=16).digest()
+        if self._last and self._last[0] == digest and \
+                self._last[1] == (width, height):
+            # Unchanged screen, same tiles
+            tiles, new = self._last[2], {}
+        else:
+            tiles = []
+            new = {}
+            for tile in self._split(width, height, rgb):
+                key = hashlib.blake2b(tile, digest_size=16).digest()
+                tiles.append(key)
+                if key not in new and key not in self._tiles:
+                    new[key] = zlib.compress(tile, 1)
+            tiles = tuple(tiles)
+        with self._lock:
+            if source is not self._thread:
+                return
+            self._last = (digest, (width, height), tiles)
+            if self._frames and (self._frames[-1].width,
+                                 self._frames[-1].height) != (width, height):
+                # Screen size changed, the older frames do not fit
+                self._frames.clear()
+                self._tiles = {}
+                new = dict((key, zlib.compress(tile, 1)) for key, tile in \
+                               zip(tiles, self._split(width, height, rgb)))
+            for key, data in new.items():
+                self._tiles[key] = [data, 0]
+            for key in tiles:
+                self._tiles[key][1] += 1
+            if len(self._frames) == self._frames.maxlen:
+                for key in self._frames[0].tiles:
+                    entry = self._tiles[key]
+                    entry[1] -= 1
+                    if not entry[1]:
+                        del self._tiles[key]
+            self._frames.append(_Frame(timestamp, width, height, tiles))
+        metrics.incr('screen_recorder_frames')
+
+    def _snapshot(self):
+        with self._lock:
+            frames = list(self._frames)
+            tiles = dict((key, entry[0]) for key, entry in \
+                             self._tiles.items())
+        return frames, tiles
+
+    def _rows(self, frame, tiles, cache, left, top, right, bottom):
+        """
+        @return: RGB rows of the tile rectangle, in tile units
+        @rtype: list
+        """
+        columns = (frame.width + _tile_size - 1) // _tile_size
+        rows = []
+        for tile_row in range(top, bottom):
+            parts = []
+            for tile_column in range(left, right):
+                key = frame.tiles[tile_row * columns + tile_column]
+                if key not in cache:
+                    cache[key] = zlib.decompress(tiles[key])
+                parts.append(cache[key])
+            height = min(_tile_size, frame.height - tile_row * _tile_size)
+            for row in range(height):
+                line = []
+                for tile_column, part in zip(range(left, right), parts):
+                    width = min(_tile_size,
+                                frame.width - tile_column * _tile_size) * 3
+                    line.append(part[row * width:(row + 1) * width])
+                rows.append(b''.join(line))
+        return rows
+
+    def dump(self, format='apng'):
+        """
+        Export the recorded frames
+
+        @param format: apng, one animated png showing the changed
+        regions only after the first frame, or frames, a zip of png
+        files with an index.json of the frame times
+        @type format: string
+
+        @return: apng or zip data
+        @rtype: bytes
+        """
+        if format not in _dump_formats:
+            raise ValueError('Invalid format %s, use one of %s' % \
+                                 (format, ', '.join(_dump_formats)))
+        frames, tiles = self._snapshot()
+        if not frames:
+            raise ValueError('No frames recorded')
+        cache = {}
+        columns = (frames[0].width + _tile_size - 1) // _tile_size
+        tile_rows = (frames[0].height + _tile_size - 1) // _tile_size
+        interval = 1.0 / self.fps
+        if format == 'frames':
+            output = io.BytesIO()
+            index = []
+            archive = zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED)
+            for i, frame in enumerate(frames):
+                name = 'frame-%05d.png' % i
+                archive.writestr(name, _png(frame.width, frame.height,
+                                            self._rows(frame, tiles, cache, 0,
+                                                       0, columns, tile_rows)))
+                index.append({'file' : name, 'time' : frame.time,
+                              'width' : frame.width, 'height' : frame.height})
+                # Tiles of older frames are not needed again
+                if len(cache) > columns * tile_rows * 2:
+                    cache.clear()
+            archive.writestr('index.json', json.dumps(index, indent=1))
+            archive.close()
+            return output.getvalue()
+
+        # Changed tile rectangle of each frame, unchanged frames extend
+        # the previous frame delay
+        shown = []
+        previous = None
+        for frame in frames:
+            if previous is None:
+                rect = (0, 0, columns, tile_rows)
+            else:
+                changed = [i for i, (a, b) in \
+                               enumerate(zip(previous.tiles, frame.tiles)) \
+                               if a != b]
+                if not changed:
+                    continue
+                rect = (min(i % columns for i in changed),
+                        changed[0] // columns,
+                        max(i % columns for i in changed) + 1,
+                        changed[-1] // columns + 1)
+            shown.append((frame, rect))
+            previous = frame
+        width, height = frames[0].width, frames[0].height
+        chunks = [_png_signature, _ihdr(width, height),
+                  _chunk(b'acTL', struct.pack('>II', len(shown), 0))]
+        sequence = 0
+        for i, (frame, rect) in enumerate(shown):
+            if i + 1 < len(shown):
+                delay = _delay(shown[i + 1][0].time - frame.time)
+            else:
+                delay = _delay(interval)
+            left, top, right, bottom = rect
+            x, y = left * _tile_size, top * _tile_size
+            rows = self._rows(frame, tiles, cache, left, top, right, bottom)
+            # Dispose none, blend source
+            chunks.append(_chunk(b'fcTL', struct.pack(
+                        '>IIIIIHHBB', sequence, len(rows[0]) // 3, len(rows),
+                        x, y, delay[0], delay[1], 0, 0)))
+            sequence += 1
+            if i == 0:
+                chunks.append(_chunk(b'IDAT', _idat(rows)))
+            else:
+                chunks.append(_chunk(b'fdAT', struct.pack('>I', sequence) + \
+                                         _idat(rows)))
+                sequence += 1
+            # Only the latest tiles are compared with the next frame
+            if len(cache) > columns * tile_rows * 2:
+                cache.clear()
+        chunks.append(_chunk(b'IEND', b''))
+        return b''.join(chunks)
+
+    def stats(self):
+        """
+        @return: frames and distinct tiles recorded, and the compressed
+        tile bytes
+        @rtype: dict
+        """
+        with self._lock:
+            return {'frames' : len(self._frames),
+                    'tiles' : len(self._tiles),
+                    'bytes' : sum(len(entry[0]) for entry in \
+                                      self._tiles.values())}
+
+screen_recorder = ScreenRecorder()
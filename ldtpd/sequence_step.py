@@ -17,7 +17,7 @@ See "COPYING" in the source distribution for more information.
 Headers in this file shall remain intact.
 '''
 
-import pyatspi, sys
+import sys
 try:
   from gi.repository import GObject as gobject
 except:
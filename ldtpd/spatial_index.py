@@ -0,0 +1,242 @@
+"""
+LDTP v2 spatial index, for coordinate to object lookups.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See "COPYING" in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import subprocess
+from collections import OrderedDict
+from .backends import atspi
+
+# Grid cell size, in pixels
+_cell_size = 64
+
+# Windows indexed at a time, least recently used index is dropped
+_max_indexes = 8
+
+# Object changes, after which the grid of the window is built again
+_layout_events = ('object:state-changed:showing', 'object:bounds-changed')
+
+# Object changes, after which the index is dropped, the window appmap
+# misses the new objects
+_children_events = ('object:children-changed',)
+
+# wnck screen signals, after which the window stack is read again
+_stack_signals = ('window-stacking-changed', 'window-opened',
+                  'window-closed')
+
+def _contains(extents, x, y):
+    return extents[0] <= x < extents[0] + extents[2] and \
+        extents[1] <= y < extents[1] + extents[3]
+
+class SpatialIndex:
+    """
+    Uniform grid of the object extents of a window appmap, built on
+    the first lookup from the accessibles collected with the appmap
+    """
+    def __init__(self, appmap, objects):
+        # Appmap the index belongs to, a remap creates a new appmap
+        self.appmap = appmap
+        # ldtpized name: accessible, in appmap order
+        self.objects = objects
+        # Accessibles, to match event sources
+        self.members = set(objects.values())
+        # (column, row): list of (depth, order, extents, name)
+        self.grid = None
+        # Window position when the grid was built
+        self.origin = None
+
+    def _depth(self, name, depths):
+        if name not in depths:
+            parent = self.appmap[name]['parent']
+            depths[name] = self._depth(parent, depths) + 1 \
+                if parent in self.appmap else 0
+        return depths[name]
+
+    def build(self, window_extents):
+        """
+        Read the extents of the showing objects, clipped to the window
+
+        @param window_extents: Window x, y, width, height
+        @type window_extents: tuple
+        """
+        self.grid = {}
+        self.origin = window_extents[:2]
+        wx, wy, ww, wh = window_extents
+        depths = {}
+        for order, (name, acc) in enumerate(self.objects.items()):
+            try:
+                if not atspi.has_state(acc, atspi.STATE_SHOWING):
+                    continue
+                extents = atspi.get_extents(acc)
+            except Exception:
+                # Object bailed out
+                continue
+            if not extents:
+                continue
+            x, y, width, height = extents
+            left, top = max(x, wx), max(y, wy)
+            right = min(x + width, wx + ww)
+            bottom = min(y + height, wy + wh)
+            if left >= right or top >= bottom:
+                continue
+            entry = (self._depth(name, depths), order,
+                     (left, top, right - left, bottom - top), name)
+            for column in range(left // _cell_size,
+                                (right - 1) // _cell_size + 1):
+                for row in range(top // _cell_size,
+                                 (bottom - 1) // _cell_size + 1):
+                    self.grid.setdefault((column, row), []).append(entry)
+
+    def find(self, x, y, window_extents):
+        """
+        Find the innermost object at x, y, the window itself excluded
+
+        @param window_extents: Current window x, y, width, height, the
+        window may have moved since the grid was built
+        @type window_extents: tuple
+
+        @return: ldtpized name, None if no object
+        @rtype: string
+        """
+        # Grid coordinates
+        x -= window_extents[0] - self.origin[0]
+        y -= window_extents[1] - self.origin[1]
+        best = None
+        for entry in self.grid.get((x // _cell_size, y // _cell_size), ()):
+            if entry[0] and _contains(entry[2], x, y) and \
+                    (best is None or entry[:2] > best[:2]):
+                best = entry
+        return best[3] if best else None
+
+class SpatialIndexes:
+    """
+    Spatial indexes, by appmap. An index is replaced when its window
+    is remapped, its grid is built again after a showing state or
+    bounds change of one of its objects, and it is dropped after a
+    children change. Indexes are kept, and the events listened to,
+    only once enabled by the first coordinate lookup, the events are
+    costly in at-spi2.
+    """
+    def __init__(self):
+        self._indexes = OrderedDict()
+        self.enabled = False
+
+    def enable(self):
+        if not self.enabled:
+            atspi.register_event(self._on_layout_changed, *_layout_events)
+            atspi.register_event(self._on_children_changed, *_children_events)
+            self.enabled = True
+
+    def put(self, appmap, objects):
+        if not self.enabled:
+            return
+        self._indexes[id(appmap)] = SpatialIndex(appmap, objects)
+        while len(self._indexes) > _max_indexes:
+            self._indexes.popitem(last=False)
+
+    def get(self, appmap):
+        index = self._indexes.get(id(appmap), None)
+        if index is None or index.appmap is not appmap:
+            return None
+        self._indexes.move_to_end(id(appmap))
+        return index
+
+    def clear(self):
+        self._indexes.clear()
+
+    def _indexes_of(self, event):
+        if not event or event.source is None:
+            return []
+        try:
+            return [key for key, index in self._indexes.items() \
+                        if event.source in index.members]
+        except Exception:
+            # Source bailed out
+            return []
+
+    def _on_layout_changed(self, event):
+        for key in self._indexes_of(event):
+            self._indexes[key].grid = None
+
+    def _on_children_changed(self, event):
+        for key in self._indexes_of(event):
+            del self._indexes[key]
+
+spatial_indexes = SpatialIndexes()
+
+class WindowStack:
+    """
+    wnck windows in stacking order, read again only after a wnck
+    stacking, open, close or window name change signal. Process names
+    are cached by pid.
+    """
+    def __init__(self):
+        self._screen = None
+        self._windows = None
+        self._named = set()
+        self._process_names = {}
+        # Incremented on every change
+        self.generation = 0
+
+    def _changed(self, *args):
+        self._windows = None
+        self.generation += 1
+
+    def _window_closed(self, screen, window):
+        self._process_names.pop(window.get_pid(), None)
+        self._changed()
+
+    def windows(self, screen):
+        """
+        @return: list of (window name, wnck window), bottom most first
+        @rtype: list
+        """
+        if screen is not self._screen:
+            self._screen = screen
+            self._named = set()
+            for signal in _stack_signals:
+                if signal == 'window-closed':
+                    screen.connect(signal, self._window_closed)
+                else:
+                    screen.connect(signal, self._changed)
+            self._changed()
+        if self._windows is None:
+            screen.force_update()
+            self._windows = [(w.get_name(), w) for w in \
+                                 screen.get_windows_stacked()]
+            for name, w in self._windows:
+                if w.get_xid() not in self._named:
+                    w.connect('name-changed', self._changed)
+                    self._named.add(w.get_xid())
+        return self._windows
+
+    def process_name(self, pid):
+        """
+        @return: process name, as ps -o %c
+        @rtype: string
+        """
+        if pid not in self._process_names:
+            try:
+                with open('/proc/%d/comm' % pid) as fp:
+                    name = fp.read().strip()
+            except (IOError, OSError):
+                ps = subprocess.Popen(['ps', 'ch', '-o', '%c', str(pid)],
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE)
+                name = ps.communicate()[0].decode('utf-8').strip()
+            self._process_names[pid] = name
+        return self._process_names[pid]
+
+window_stack = WindowStack()
@@ -20,12 +20,350 @@ Headers in this file shall remain intact.
 """
 import re
 import time
-import pyatspi 
-from .utils import Utils
+from .backends import atspi
+from fnmatch import translate as glob_trans
+from .utils import Utils, _window_roles
+from .metrics import metrics
+from .table_index import TableEntry, TableIndex, table_indexes
 from .server_exception import LdtpServerException
 from .keypress_actions import KeyComboAction, KeyPressAction, KeyReleaseAction
 
+# Glob special characters
+_glob_chars = re.compile('[*?[]')
+
 class Table(Utils):
+    def _table_index(self, obj, rebuild=False):
+        """
+        Get cached snapshot of a table, its cell entries and column
+        values are filled on first use
+
+        @param obj: Table accessible
+        @type obj: object
+        @param rebuild: Drop the cached snapshot, even if it looks valid
+        @type rebuild: boolean
+
+        @return: table index
+        @rtype: object
+        """
+        tablei = self._get_table(obj)
+        size = atspi.get_table_size(tablei)
+        index = None if rebuild else table_indexes.get(obj)
+        if index and self._clean_table_index(index, size):
+            return index
+        index = TableIndex(tablei, size)
+        table_indexes.put(obj, index)
+        return index
+
+    def _clean_table_index(self, index, size=None):
+        """
+        Check a table index may be trusted: no table change event since
+        it was built, and the same table size
+
+        @param size: Live table size, read if not given
+        @type size: tuple
+
+        @return: True if clean
+        @rtype: boolean
+        """
+        if index.dirty:
+            return False
+        if size is None:
+            try:
+                size = atspi.get_table_size(index.tablei)
+            except:
+                return False
+        return index.size == size
+
+    def _index_table_cells(self, index):
+        """
+        Fill table index entries, with every cell and the objects
+        inside cells
+
+        @param index: Table index
+        @type index: object
+        """
+        metrics.incr('table_index_builds')
+        index.entries = []
+        flag = self._handle_table_cell
+        # Index objects inside table cells too
+        self._handle_table_cell = True
+        try:
+            for row in range(index.size[0]):
+                for column in range(index.size[1]):
+                    cell = atspi.get_table_cell(index.tablei, row, column)
+                    if not cell:
+                        continue
+                    if atspi.get_child_count(cell) > 0:
+                        nested = True
+                        # The cell itself first, its name and text are
+                        # indexed too
+                        children = self._list_objects(cell)
+                    else:
+                        nested = False
+                        children = [cell]
+                    for acc in children:
+                        abbrev_role, abbrev_name, label_by = \
+                            self._ldtpize_accessible(acc)
+                        try:
+                            name = atspi.get_name(acc)
+                            role = atspi.get_role(acc)
+                        except:
+                            # Object bailed out while indexing
+                            continue
+                        index.add(TableEntry(row, column, cell, acc, nested,
+                                             name, abbrev_role, abbrev_name,
+                                             role))
+        finally:
+            self._handle_table_cell = flag
+
+    def _table_column_values(self, obj, column, rebuild=False):
+        """
+        Get cell values of a table column, from the table snapshot
+
+        @param obj: Table accessible
+        @type obj: object
+        @param column: Column index
+        @type column: integer
+        @param rebuild: Drop the cached snapshot, even if it looks valid
+        @type rebuild: boolean
+
+        @return: table index, list of cell values in row order
+        @rtype: tuple
+        """
+        index = self._table_index(obj, rebuild)
+        rows, columns = index.size
+        if column < 0 or column >= columns:
+            raise LdtpServerException('Column index out of range: %d' % column)
+        values = index.values.get(column, None)
+        if values is None:
+            metrics.incr('table_index_builds')
+            values = []
+            for row in range(rows):
+                cell = atspi.get_table_cell(index.tablei, row, column)
+                text = self._get_cell_text(cell) if cell else None
+                values.append(text or '')
+            index.values[column] = values
+        else:
+            metrics.incr('table_index_hits')
+        return index, values
+
+    def _table_row_matcher(self, row_text, partial_match=False,
+                           match_text=False):
+        """
+        Get table entry match function for the given text
+
+        @param row_text: Row text to match
+        @type row_text: string
+        @param partial_match: Regex search instead of glob match, for
+        objects inside table cells or text content
+        @type partial_match: boolean
+        @param match_text: Match text content, not accessible name
+        @type match_text: boolean
+
+        @return: function taking a table entry, true on match
+        @rtype: function
+        """
+        def _match_name(entry):
+            return self._match_name_to_ldtpized(row_text, entry.name,
+                                                entry.abbrev_role,
+                                                entry.abbrev_name,
+                                                entry.role)
+        if match_text:
+            if partial_match:
+                def _match(entry):
+                    text = entry.text()
+                    return text is not None and \
+                        re.search(row_text, text, re.M | re.U)
+            else:
+                def _match(entry):
+                    return entry.text() == row_text
+        elif partial_match:
+            def _match(entry):
+                if entry.nested:
+                    return entry.name and re.search(row_text, entry.name)
+                return _match_name(entry)
+        else:
+            _match = _match_name
+        return _match
+
+    def _indexed_table(self, obj, rebuild=False):
+        """
+        Get table index, with cell entries filled
+
+        @param obj: Table accessible
+        @type obj: object
+        @param rebuild: Drop the cached index, even if it looks valid
+        @type rebuild: boolean
+
+        @return: table index, True if cell entries were just filled
+        @rtype: tuple
+        """
+        index = self._table_index(obj, rebuild)
+        if index.entries is None:
+            self._index_table_cells(index)
+            return index, True
+        metrics.incr('table_index_hits')
+        return index, False
+
+    def _find_table_row(self, obj, row_text, partial_match=False,
+                        match_text=False):
+        """
+        Find the first table cell, in row major order, matching the
+        given text. A clean index is trusted on a miss, a match is
+        verified against the live table and the index is rebuilt once
+        if the match is stale.
+
+        @param obj: Table accessible
+        @type obj: object
+        @param row_text: Row text to match
+        @type row_text: string
+        @param partial_match: Regex search instead of glob match, for
+        objects inside table cells or text content
+        @type partial_match: boolean
+        @param match_text: Match text content, not accessible name
+        @type match_text: boolean
+
+        @return: table entry, None if not found
+        @rtype: object
+        """
+        _match = self._table_row_matcher(row_text, partial_match, match_text)
+        index, built = self._indexed_table(obj)
+        while True:
+            entry = index.find(_match, None if match_text else row_text)
+            if built or entry is None or \
+                    self._valid_table_entry(index, entry, match_text):
+                return entry
+            # Stale index, table changed without event
+            metrics.incr('table_index_stale')
+            index, built = self._indexed_table(obj, True)
+
+    def _match_table_rows(self, obj, row_text_list, partial_match=False):
+        """
+        Find table rows matching any of the given texts, in one pass
+        over the table index. Texts without glob characters are looked
+        up by name, the others are matched like _find_table_row.
+
+        @param obj: Table accessible
+        @type obj: object
+        @param row_text_list: Row texts to match
+        @type row_text_list: list
+        @param partial_match: Regex search, see _find_table_row
+        @type partial_match: boolean
+
+        @return: table index, dictionary of row index: first matching cell
+        @rtype: tuple
+        """
+        row_texts = set(row_text_list)
+        # Literal texts, by accessible name / LDTP name, by window
+        # stripped name and by other object stripped name
+        literals = {}
+        window_literals = {}
+        other_literals = {}
+        matchers = []
+        for row_text in row_texts:
+            if partial_match or _glob_chars.search(row_text):
+                matchers.append((row_text,
+                                 self._table_row_matcher(row_text,
+                                                         partial_match)))
+                continue
+            literals.setdefault(row_text, []).append(row_text)
+            window_literals.setdefault(re.sub('( |\n)', '', row_text),
+                                       []).append(row_text)
+            other_literals.setdefault(re.sub('( |:|\.|_|\n)', '', row_text),
+                                      []).append(row_text)
+
+        index, built = self._indexed_table(obj)
+        while True:
+            found = set()
+            matched = {}
+            for entry in index.entries:
+                _object_name = '%s%s' % (entry.abbrev_role, entry.abbrev_name)
+                hits = []
+                if entry.name:
+                    hits.extend(literals.get(entry.name, ()))
+                hits.extend(literals.get(_object_name, ()))
+                if entry.role is not None:
+                    if entry.role in _window_roles:
+                        stripped = window_literals
+                    else:
+                        stripped = other_literals
+                    hits.extend(stripped.get(_object_name, ()))
+                    hits.extend(stripped.get(entry.abbrev_name, ()))
+                for row_text, _match in matchers:
+                    if _match(entry):
+                        hits.append(row_text)
+                if hits:
+                    found.update(hits)
+                    if entry.row not in matched:
+                        matched[entry.row] = entry
+            unmatched = row_texts - found
+            # Clean index, only the matches are verified
+            if built or all(self._valid_table_entry(index, entry) \
+                                for entry in matched.values()):
+                break
+            # Stale index, table changed without event
+            metrics.incr('table_index_stale')
+            index, built = self._indexed_table(obj, True)
+        if unmatched:
+            raise LdtpServerException('Unable to find row: %s' % \
+                                          ', '.join(sorted(unmatched)))
+        return index, dict((row, entry.cell) for row, entry in matched.items())
+
+    def _select_table_rows(self, tablei, cells, select=True):
+        """
+        Select or unselect table rows, with the table selection API.
+        Rows the table doesn't select that way are ctrl clicked.
+
+        @param tablei: Table interface
+        @type tablei: object
+        @param cells: Dictionary of row index: cell to click, None for
+        the first column cell
+        @type cells: dictionary
+        @param select: Select if True, unselect if False
+        @type select: boolean
+        """
+        clicks = []
+        for row in sorted(cells):
+            try:
+                if bool(atspi.is_table_row_selected(tablei, row)) == select:
+                    # Already in the expected state
+                    continue
+                if select:
+                    done = atspi.select_table_row(tablei, row)
+                else:
+                    done = atspi.deselect_table_row(tablei, row)
+            except NotImplementedError:
+                done = False
+            if not done:
+                clicks.append(cells[row] or \
+                                  atspi.get_table_cell(tablei, row, 0))
+        if not clicks:
+            return
+        key_press_action=KeyPressAction(key_name="<ctrl>")
+        key_press_action()
+        try:
+            time.sleep(1)
+            for cell in clicks:
+                size = self._get_size(cell)
+                self._mouse_event(size.x + size.width / 2,
+                                  size.y + size.height / 2)
+        finally:
+            key_release_action=KeyReleaseAction(key_name="<ctrl>")
+            key_release_action()
+
+    def _valid_table_entry(self, index, entry, match_text=False):
+        try:
+            if atspi.get_table_cell(index.tablei, entry.row,
+                                    entry.column) != entry.cell:
+                return False
+            if match_text:
+                texti = atspi.get_text(entry.acc)
+                return (texti.getText(0, -1) if texti else None) == \
+                    entry.text()
+            return atspi.get_name(entry.acc) == entry.name
+        except:
+            return False
+
     def getrowcount(self, window_name, object_name):
         """
         Get count of rows in table object.
@@ -42,12 +380,11 @@ class Table(Utils):
         """
         obj = self._get_object(window_name, object_name)
 
-        try:
-            itable = obj.queryTable()
-        except NotImplementedError:
+        itable = atspi.get_table(obj)
+        if not itable:
             raise LdtpServerException('object %s is not a table' % object_name)
 
-        return itable.nRows
+        return atspi.get_table_size(itable)[0]
 
     def selectrow(self, window_name, object_name, row_text, partial_match=False):
         """
@@ -69,37 +406,11 @@ class Table(Utils):
             return self.selectrowpartialmatch(window_name, object_name, row_text)
         obj = self._get_object(window_name, object_name)
 
-        try:
-            tablei = obj.queryTable()
-        except NotImplementedError:
-            raise LdtpServerException('Object not table type.')
-
-        for i in range(0, tablei.nRows):
-            for j in range(0, tablei.nColumns):
-                cell = tablei.getAccessibleAt(i, j)
-                if not cell:
-                    continue
-                if cell.childCount > 0:
-                    flag = False
-                    try:
-                        if self._handle_table_cell:
-                            # Was externally set, let us not
-                            # touch this value
-                            flag = True
-                        else:
-                            self._handle_table_cell = True
-                        children = self._list_objects(cell)
-                        for child in children:
-                            if self._match_name_to_acc(row_text, child):
-                                self._grab_focus(child)
-                                return 1
-                    finally:
-                        if not flag:
-                            self._handle_table_cell = False
-                elif self._match_name_to_acc(row_text, cell):
-                    self._grab_focus(cell)
-                    return 1
-        raise LdtpServerException('Unable to select row: %s' % row_text)
+        entry = self._find_table_row(obj, row_text)
+        if not entry:
+            raise LdtpServerException('Unable to select row: %s' % row_text)
+        self._grab_focus(entry.acc)
+        return 1
 
     def selectrowpartialmatch(self, window_name, object_name, row_text):
         """
@@ -119,37 +430,11 @@ class Table(Utils):
         """
         obj = self._get_object(window_name, object_name)
 
-        try:
-            tablei = obj.queryTable()
-        except NotImplementedError:
-            raise LdtpServerException('Object not table type.')
-
-        for i in range(0, tablei.nRows):
-            for j in range(0, tablei.nColumns):
-                cell = tablei.getAccessibleAt(i, j)
-                if not cell:
-                    continue
-                if cell.childCount > 0:
-                    flag = False
-                    try:
-                        if self._handle_table_cell:
-                            # Was externally set, let us not
-                            # touch this value
-                            flag = True
-                        else:
-                            self._handle_table_cell = True
-                        children = self._list_objects(cell)
-                        for child in children:
-                            if re.search(row_text, child.name):
-                                self._grab_focus(child)
-                                return 1
-                    finally:
-                        if not flag:
-                            self._handle_table_cell = False
-                elif self._match_name_to_acc(row_text, cell):
-                    self._grab_focus(cell)
-                    return 1
-        raise LdtpServerException('Unable to select row: %s' % row_text)
+        entry = self._find_table_row(obj, row_text, True)
+        if not entry:
+            raise LdtpServerException('Unable to select row: %s' % row_text)
+        self._grab_focus(entry.acc)
+        return 1
 
     def multiselect(self, window_name, object_name, row_text_list,
                     partial_match=False):
@@ -164,72 +449,20 @@ class Table(Utils):
         @type object_name: string
         @param row_text_list: Row list with matching text to select
         @type row_text: string
+        @param partial_match: Regex search, as selectrowpartialmatch
+        @type partial_match: boolean
 
         @return: 1 on success.
         @rtype: integer
         """
-        if partial_match:
-            return self.selectrowpartialmatch(window_name, object_name, row_text)
         obj = self._get_object(window_name, object_name)
         self._grab_focus(obj)
 
-        try:
-            tablei = obj.queryTable()
-        except NotImplementedError:
-            raise LdtpServerException('Object not table type.')
-
-        key_press_action=KeyPressAction(key_name="<ctrl>")
-        key_press_action()
-        try:
-            for row_text in row_text_list:
-                selected_rows = False
-                for i in range(0, tablei.nRows):
-                    for j in range(0, tablei.nColumns):
-                        cell = tablei.getAccessibleAt(i, j)
-                        if not cell:
-                            continue
-                        if cell.childCount > 0:
-                            flag = False
-                            try:
-                                if self._handle_table_cell:
-                                    # Was externally set, let us not
-                                    # touch this value
-                                    flag = True
-                                else:
-                                    self._handle_table_cell = True
-                                children = self._list_objects(cell)
-                                for child in children:
-                                    if self._match_name_to_acc(row_text, child):
-                                        time.sleep(1)
-                                        size = self._get_size(cell)
-                                        if pyatspi.state.STATE_SELECTED not \
-                                                in cell.getState().getStates():
-                                            self._mouse_event(size[0] + size[2]/2,
-                                                              size[1] + size[3]/2)
-                                        else:
-                                            # Table Cell already selected
-                                            pass
-                                        selected_rows = True
-                                        break
-                            finally:
-                                if not flag:
-                                    self._handle_table_cell = False
-                        elif self._match_name_to_acc(row_text, cell):
-                            time.sleep(1)
-                            size = self._get_size(cell)
-                            if pyatspi.state.STATE_SELECTED not \
-                                    in cell.getState().getStates():
-                                self._mouse_event(size[0] + size[2]/2,
-                                                  size[1] + size[3]/2)
-                            selected_rows = True
-                if not selected_rows:
-                    raise LdtpServerException('Unable to select row: %s' % row_text)
-        finally:
-            key_release_action=KeyReleaseAction(key_name="<ctrl>")
-            key_release_action()
-        if selected_rows:
-            return 1
-        raise LdtpServerException('Unable to select rows')
+        # Nothing is selected, if any text doesn't match
+        index, cells = self._match_table_rows(obj, row_text_list,
+                                              partial_match)
+        self._select_table_rows(index.tablei, cells)
+        return 1
 
     def multiremove(self, window_name, object_name, row_text_list,
                     partial_match=False):
@@ -244,72 +477,75 @@ class Table(Utils):
         @type object_name: string
         @param row_text_list: Row list with matching text to select
         @type row_text: string
+        @param partial_match: Regex search, as selectrowpartialmatch
+        @type partial_match: boolean
 
         @return: 1 on success.
         @rtype: integer
         """
-        if partial_match:
-            return self.selectrowpartialmatch(window_name, object_name, row_text)
         obj = self._get_object(window_name, object_name)
         self._grab_focus(obj)
 
-        try:
-            tablei = obj.queryTable()
-        except NotImplementedError:
-            raise LdtpServerException('Object not table type.')
+        # Nothing is unselected, if any text doesn't match
+        index, cells = self._match_table_rows(obj, row_text_list,
+                                              partial_match)
+        self._select_table_rows(index.tablei, cells, False)
+        return 1
 
-        key_press_action=KeyPressAction(key_name="<ctrl>")
-        key_press_action()
-        try:
-            for row_text in row_text_list:
-                unselected_rows = False
-                for i in range(0, tablei.nRows):
-                    for j in range(0, tablei.nColumns):
-                        cell = tablei.getAccessibleAt(i, j)
-                        if not cell:
-                            continue
-                        if cell.childCount > 0:
-                            flag = False
-                            try:
-                                if self._handle_table_cell:
-                                    # Was externally set, let us not
-                                    # touch this value
-                                    flag = True
-                                else:
-                                    self._handle_table_cell = True
-                                children = self._list_objects(cell)
-                                for child in children:
-                                    if self._match_name_to_acc(row_text, child):
-                                        time.sleep(1)
-                                        size = self._get_size(cell)
-                                        if pyatspi.state.STATE_SELECTED \
-                                                in cell.getState().getStates():
-                                            self._mouse_event(size[0] + size[2]/2,
-                                                              size[1] + size[3]/2)
-                                        else:
-                                            # Table Cell wasn't selected
-                                            pass
-                                        unselected_rows = True
-                                        break
-                            finally:
-                                if not flag:
-                                    self._handle_table_cell = False
-                        elif self._match_name_to_acc(row_text, cell):
-                            time.sleep(1)
-                            size = self._get_size(cell)
-                            if pyatspi.state.STATE_SELECTED \
-                                    in cell.getState().getStates():
-                                self._mouse_event(size[0] + size[2]/2,
-                                                  size[1] + size[3]/2)
-                            unselected_rows = True
-                if not unselected_rows:
-                    raise LdtpServerException('Unable to unselect row: %s' % row_text)
-        finally:
-            key_release_action=KeyReleaseAction(key_name="<ctrl>")
-            key_release_action()
-        if unselected_rows:
-            return 1
-        raise LdtpServerException('Unable to unselect rows')
+    def _table_row_indexes(self, obj, row_index_list):
+        tablei = self._get_table(obj)
+        rows, columns = atspi.get_table_size(tablei)
+        for row_index in row_index_list:
+            if row_index < 0 or row_index >= rows:
+                raise LdtpServerException('Row index out of range: %d' % \
+                                              row_index)
+        return tablei, dict.fromkeys(row_index_list)
+
+    def multiselectindex(self, window_name, object_name, row_index_list):
+        """
+        Select multiple row by index
+
+        @param window_name: Window name to type in, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to type in, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param row_index_list: Row indexes to select
+        @type row_index_list: list
+
+        @return: 1 on success.
+        @rtype: integer
+        """
+        obj = self._get_object(window_name, object_name)
+        self._grab_focus(obj)
+
+        tablei, cells = self._table_row_indexes(obj, row_index_list)
+        self._select_table_rows(tablei, cells)
+        return 1
+
+    def multiremoveindex(self, window_name, object_name, row_index_list):
+        """
+        Remove multiple row by index
+
+        @param window_name: Window name to type in, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to type in, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param row_index_list: Row indexes to unselect
+        @type row_index_list: list
+
+        @return: 1 on success.
+        @rtype: integer
+        """
+        obj = self._get_object(window_name, object_name)
+        self._grab_focus(obj)
+
+        tablei, cells = self._table_row_indexes(obj, row_index_list)
+        self._select_table_rows(tablei, cells, False)
+        return 1
 
     def selectrowindex(self, window_name, object_name, row_index):
         """
@@ -329,15 +565,13 @@ class Table(Utils):
         """
         obj = self._get_object(window_name, object_name)
 
-        try:
-            tablei = obj.queryTable()
-        except NotImplementedError:
-            raise LdtpServerException('Object not table type.')
+        tablei = self._get_table(obj)
+        rows, columns = atspi.get_table_size(tablei)
 
-        if row_index < 0 or row_index > tablei.nRows:
+        if row_index < 0 or row_index > rows:
             raise LdtpServerException('Row index out of range: %d' % row_index)
 
-        cell = tablei.getAccessibleAt(row_index, 0)
+        cell = atspi.get_table_cell(tablei, row_index, 0)
         self._grab_focus(cell)
         return 1
 
@@ -357,12 +591,10 @@ class Table(Utils):
         """
         obj = self._get_object(window_name, object_name)
 
-        try:
-            tablei = obj.queryTable()
-        except NotImplementedError:
-            raise LdtpServerException('Object not table type.')
+        tablei = self._get_table(obj)
+        rows, columns = atspi.get_table_size(tablei)
 
-        cell = tablei.getAccessibleAt(tablei.nRows - 1, 0)
+        cell = atspi.get_table_cell(tablei, rows - 1, 0)
         self._grab_focus(cell)
         return 1
 
@@ -390,8 +622,15 @@ class Table(Utils):
         """
         obj = self._get_object(window_name, object_name)
         cell = self._get_accessible_at_row_column(obj, row_index, column)
+        try:
+            return self._set_cell_value(cell, data)
+        finally:
+            # Toolkits don't always emit a cell change event
+            table_indexes.invalidate(obj)
+
+    def _set_cell_value(self, cell, data):
         name = None
-        if cell.childCount > 0:
+        if atspi.get_child_count(cell) > 0:
             flag = False
             try:
                 if self._handle_table_cell:
@@ -407,7 +646,7 @@ class Table(Utils):
                     except NotImplementedError:
                         iaction = None
                     if iaction:
-                        for i in xrange(iaction.nActions):
+                        for i in range(iaction.nActions):
                             # If the cell is toggle type
                             if re.match('toggle', iaction.getName(i), re.I):
                                 iaction.doAction(i)
@@ -421,7 +660,7 @@ class Table(Utils):
                                 self._grab_focus(child)
                                 if not data:
                                     raise LdtpServerException('data cannot be empty string.')
-                                return int(texti.setTextContents(data.encode('utf-8')))
+                                return int(texti.setTextContents(data))
                 else:
                     raise LdtpServerException('Text cannot be entered into object.')
             finally:
@@ -434,7 +673,7 @@ class Table(Utils):
                 iaction = None
             self._grab_focus(cell)
             if iaction:
-                for i in xrange(iaction.nActions):
+                for i in range(iaction.nActions):
                     # If the cell is toggle type
                     if re.match('toggle', iaction.getName(i), re.I):
                         iaction.doAction(i)
@@ -446,7 +685,7 @@ class Table(Utils):
                             raise LdtpServerException('Text cannot be entered into object.')
                         if not data:
                             raise LdtpServerException('data cannot be empty string.')
-                        return int(texti.setTextContents(data.encode('utf-8')))
+                        return int(texti.setTextContents(data))
         raise LdtpServerException('Text cannot be entered into object.')
 
     def getcellvalue(self, window_name, object_name, row_index, column = 0):
@@ -470,35 +709,216 @@ class Table(Utils):
         obj = self._get_object(window_name, object_name)
 
         cell = self._get_accessible_at_row_column(obj, row_index, column)
-        name = None
-        if cell.childCount > 0:
-            flag = False
-            try:
-                if self._handle_table_cell:
-                    # Was externally set, let us not
-                    # touch this value
-                    flag = True
-                else:
-                    self._handle_table_cell = True
-                children = self._list_objects(cell)
-                for child in children:
-                    try:
-                        texti = child.queryText()
-                    except NotImplementedError:
-                        continue
-                    name = child.name
-                    self._grab_focus(cell)
-                    break
-            finally:
-                if not flag:
-                    self._handle_table_cell = False
-        else:
-            name = cell.name
-            self._grab_focus(cell)
+        name = self._get_cell_text(cell)
         if name is None:
             raise LdtpServerException('Unable to get row text')
+        self._grab_focus(cell)
         return name
 
+    def _get_cell_text(self, cell):
+        """
+        Get table cell text, from the first object with text interface
+        inside the cell, or the cell name
+
+        @param cell: Table cell accessible
+        @type cell: object
+
+        @return: cell text, None if the cell has no text
+        @rtype: string
+        """
+        if atspi.get_child_count(cell) == 0:
+            return atspi.get_name(cell)
+        flag = False
+        try:
+            if self._handle_table_cell:
+                # Was externally set, let us not
+                # touch this value
+                flag = True
+            else:
+                self._handle_table_cell = True
+            for child in self._list_objects(cell):
+                if atspi.get_text(child):
+                    return atspi.get_name(child)
+        finally:
+            if not flag:
+                self._handle_table_cell = False
+        return None
+
+    def gettablecontents(self, window_name, object_name, start_row = 0,
+                         count = -1, columns = None):
+        """
+        Get table cell values, in one call
+
+        @param window_name: Window name to type in, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to type in, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param start_row: First row index to get
+        @type start_row: integer
+        @param count: Number of rows to get, -1 for all remaining rows
+        @type count: integer
+        @param columns: Column indexes to get, default all columns
+        @type columns: list
+
+        @return: list of rows, each row a list of cell values, empty
+        string for cells without text
+        @rtype: list
+        """
+        obj = self._get_object(window_name, object_name)
+
+        tablei = self._get_table(obj)
+        rows, total_columns = atspi.get_table_size(tablei)
+        if start_row < 0 or start_row > rows:
+            raise LdtpServerException('Row index out of range: %d' % start_row)
+        if columns is None:
+            columns = range(total_columns)
+        else:
+            for column in columns:
+                if column < 0 or column >= total_columns:
+                    raise LdtpServerException('Column index out of range: %d' \
+                                                  % column)
+        end_row = rows
+        if count >= 0:
+            end_row = min(rows, start_row + count)
+        contents = []
+        for row in range(start_row, end_row):
+            values = []
+            for column in columns:
+                cell = atspi.get_table_cell(tablei, row, column)
+                text = self._get_cell_text(cell) if cell else None
+                values.append(text or '')
+            contents.append(values)
+        return contents
+
+    def querytable(self, window_name, object_name, column, pattern,
+                   mode = 'glob', limit = 0):
+        """
+        Find table rows, whose cell value in the given column matches
+
+        @param window_name: Window name to type in, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to type in, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param column: Column index to match
+        @type column: integer
+        @param pattern: Cell value to match
+        @type pattern: string
+        @param mode: glob, regex (search) or exact
+        @type mode: string
+        @param limit: Maximum number of rows to return, 0 for all
+        @type limit: integer
+
+        @return: list of [row index, cell value]
+        @rtype: list
+        """
+        if mode == 'glob':
+            _match = re.compile(glob_trans(pattern), re.M | re.U).match
+        elif mode == 'regex':
+            _match = re.compile(pattern, re.M | re.U).search
+        elif mode == 'exact':
+            _match = lambda value: value == pattern
+        else:
+            raise LdtpServerException('Invalid mode %s, use glob, regex ' \
+                                          'or exact' % mode)
+        obj = self._get_object(window_name, object_name)
+
+        rebuild = False
+        while True:
+            index, values = self._table_column_values(obj, column, rebuild)
+            if rebuild or self._valid_table_snapshot(index, column, values):
+                matches = []
+                for row, value in enumerate(values):
+                    if _match(value):
+                        matches.append([row, value])
+                        if limit and len(matches) >= limit:
+                            break
+                if rebuild or self._valid_table_values(index, column,
+                                                       matches):
+                    return matches
+            # Stale snapshot, table changed without event
+            metrics.incr('table_index_stale')
+            rebuild = True
+
+    def _valid_table_snapshot(self, index, column, values):
+        """
+        Check a column snapshot before trusting it, misses included:
+        clean index, and the first, middle and last values unchanged
+
+        @return: True if valid
+        @rtype: boolean
+        """
+        if not self._clean_table_index(index):
+            return False
+        rows = len(values)
+        sample = sorted(set((0, rows // 2, rows - 1))) if rows else []
+        return self._valid_table_values(index, column,
+                                        [(row, values[row]) for row in sample])
+
+    def _valid_table_values(self, index, column, matches):
+        try:
+            for row, value in matches:
+                cell = atspi.get_table_cell(index.tablei, row, column)
+                text = self._get_cell_text(cell) if cell else None
+                if (text or '') != value:
+                    return False
+        except:
+            return False
+        return True
+
+    def istablesorted(self, window_name, object_name, column, key = 'str',
+                      reverse = False):
+        """
+        Check whether table rows are sorted on a column
+
+        @param window_name: Window name to type in, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to type in, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param column: Column index to check
+        @type column: integer
+        @param key: Compare cell values as str, nocase (case
+        insensitive str) or number
+        @type key: string
+        @param reverse: Check descending order
+        @type reverse: boolean
+
+        @return: 1 if sorted, 0 if not
+        @rtype: integer
+        """
+        if key == 'str':
+            _key = str
+        elif key == 'nocase':
+            _key = str.casefold
+        elif key == 'number':
+            _key = float
+        else:
+            raise LdtpServerException('Invalid key %s, use str, nocase ' \
+                                          'or number' % key)
+        obj = self._get_object(window_name, object_name)
+
+        index, values = self._table_column_values(obj, column)
+        if not self._valid_table_snapshot(index, column, values):
+            # Stale snapshot, table changed without event
+            metrics.incr('table_index_stale')
+            index, values = self._table_column_values(obj, column, True)
+        try:
+            keys = [_key(value) for value in values]
+        except ValueError as e:
+            raise LdtpServerException('Unable to compare cell values: %s' % e)
+        for i in range(1, len(keys)):
+            if reverse:
+                if keys[i - 1] < keys[i]:
+                    return 0
+            elif keys[i - 1] > keys[i]:
+                return 0
+        return 1
+
     def getcellsize(self, window_name, object_name, row_index, column = 0):
         """
         Get cell size
@@ -521,7 +941,7 @@ class Table(Utils):
 
         cell=self._get_accessible_at_row_column(obj, row_index, column)
         current_cell=None
-        if cell.childCount > 0:
+        if atspi.get_child_count(cell) > 0:
             flag = False
             try:
                 if self._handle_table_cell:
@@ -569,44 +989,14 @@ class Table(Utils):
         """
         obj = self._get_object(window_name, object_name)
 
-        try:
-            tablei = obj.queryTable()
-        except NotImplementedError:
-            raise LdtpServerException('Object not table type.')
-
-        for i in range(0, tablei.nRows):
-            for j in range(0, tablei.nColumns):
-                cell = tablei.getAccessibleAt(i, j)
-                if not cell:
-                    continue
-                if cell.childCount > 0:
-                    flag = False
-                    try:
-                        if self._handle_table_cell:
-                            # Was externally set, let us not
-                            # touch this value
-                            flag = True
-                        else:
-                            self._handle_table_cell = True
-                        children = self._list_objects(cell)
-                        for child in children:
-                            if self._match_name_to_acc(row_text, child):
-                                self._grab_focus(child)
-                                size = self._get_size(child)
-                                self._mouse_event(size.x + size.width / 2,
-                                                  size.y + size.height / 2, 'b3c')
-                                return 1
-                    finally:
-                        if not flag:
-                            self._handle_table_cell = False
-                elif self._match_name_to_acc(row_text, cell):
-                    self._grab_focus(cell)
-                    size = self._get_size(cell)
-                    self._mouse_event(size.x + size.width / 2,
-                                      size.y + size.height / 2, 'b3c')
-                    return 1
-                
-        raise LdtpServerException('Unable to right click row: %s' % row_text)
+        entry = self._find_table_row(obj, row_text)
+        if not entry:
+            raise LdtpServerException('Unable to right click row: %s' % row_text)
+        self._grab_focus(entry.acc)
+        size = self._get_size(entry.acc)
+        self._mouse_event(size.x + size.width / 2,
+                          size.y + size.height / 2, 'b3c')
+        return 1
 
     def checkrow(self, window_name, object_name, row_index, column = 0):
         """
@@ -629,8 +1019,11 @@ class Table(Utils):
         obj = self._get_object(window_name, object_name)
 
         cell = self._get_accessible_at_row_column(obj, row_index, column)
+        return self._check_cell(cell, True)
+
+    def _check_cell(self, cell, check=True):
         flag = None
-        if cell.childCount > 0:
+        if atspi.get_child_count(cell) > 0:
             flag = False
             try:
                 if self._handle_table_cell:
@@ -644,7 +1037,7 @@ class Table(Utils):
                     try:
                         actioni = child.queryAction()
                         flag = True
-                        if not self._check_state(child, pyatspi.STATE_CHECKED):
+                        if self._check_state(child, atspi.STATE_CHECKED) != check:
                             self._click_object(child, 'toggle')
                     except NotImplementedError:
                         continue
@@ -657,7 +1050,7 @@ class Table(Utils):
             try:
                 actioni = cell.queryAction()
                 flag = True
-                if not self._check_state(cell, pyatspi.STATE_CHECKED):
+                if self._check_state(cell, atspi.STATE_CHECKED) != check:
                     self._click_object(cell, 'toggle')
             except NotImplementedError:
                 raise LdtpServerException('Unable to check row')
@@ -687,8 +1080,11 @@ class Table(Utils):
         obj = self._get_object(window_name, object_name)
 
         cell = self._get_accessible_at_row_column(obj, row_index, column)
+        return self._expand_cell(cell)
+
+    def _expand_cell(self, cell):
         flag = None
-        if cell.childCount > 0:
+        if atspi.get_child_count(cell) > 0:
             flag = False
             try:
                 if self._handle_table_cell:
@@ -743,42 +1139,151 @@ class Table(Utils):
         obj = self._get_object(window_name, object_name)
 
         cell = self._get_accessible_at_row_column(obj, row_index, column)
-        flag = None
-        if cell.childCount > 0:
-            flag = False
+        return self._check_cell(cell, False)
+
+    def _table_cells_apply(self, window_name, object_name, cells, func,
+                           changes_values=False):
+        """
+        Apply func on table cells, the table is resolved once
+
+        @param changes_values: func changes cell values, the table index
+        is marked dirty
+        @type changes_values: boolean
+
+        @return: list of [row, column, 1 or 0, error message]
+        @rtype: list
+        """
+        obj = self._get_object(window_name, object_name)
+        tablei = self._get_table(obj)
+        size = atspi.get_table_size(tablei)
+        outcomes = []
+        for cell_spec in cells:
+            row_index, column = cell_spec[0], cell_spec[1]
             try:
-                if self._handle_table_cell:
-                    # Was externally set, let us not
-                    # touch this value
-                    flag = True
-                else:
-                    self._handle_table_cell = True
-                children = self._list_objects(cell)
-                for child in children:
-                    try:
-                        actioni = child.queryAction()
-                        flag = True
-                        if self._check_state(child, pyatspi.STATE_CHECKED):
-                            self._click_object(child, 'toggle')
-                    except NotImplementedError:
-                        continue
-                    self._grab_focus(cell)
-                    break
-            finally:
-                if not flag:
-                    self._handle_table_cell = False
+                cell = self._get_table_cell_at(tablei, size, row_index, column)
+                func(cell, *cell_spec[2:])
+                outcomes.append([row_index, column, 1, ''])
+            except LdtpServerException as e:
+                outcomes.append([row_index, column, 0, e.faultString])
+            except Exception as e:
+                # AT-SPI error on this cell, eg: stale cell, the other
+                # cells are still applied and reported
+                outcomes.append([row_index, column, 0,
+                                 str(e) or e.__class__.__name__])
+        if changes_values:
+            table_indexes.invalidate(obj)
+        return outcomes
+
+    def checkrows(self, window_name, object_name, row_index_list, column = 0):
+        """
+        Check rows
+
+        @param window_name: Window name to type in, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to type in, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param row_index_list: Row indexes to check
+        @type row_index_list: list
+        @param column: Column index, default value 0
+        @type column: integer
+
+        @return: list of [row, column, 1 on success 0 on failure,
+        error message]
+        @rtype: list
+        """
+        return self._table_cells_apply(window_name, object_name,
+                                       [(row_index, column, True) \
+                                            for row_index in row_index_list],
+                                       self._check_cell)
+
+    def uncheckrows(self, window_name, object_name, row_index_list, column = 0):
+        """
+        Uncheck rows
+
+        @param window_name: Window name to type in, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to type in, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param row_index_list: Row indexes to uncheck
+        @type row_index_list: list
+        @param column: Column index, default value 0
+        @type column: integer
+
+        @return: list of [row, column, 1 on success 0 on failure,
+        error message]
+        @rtype: list
+        """
+        return self._table_cells_apply(window_name, object_name,
+                                       [(row_index, column, False) \
+                                            for row_index in row_index_list],
+                                       self._check_cell)
+
+    def expandtablecells(self, window_name, object_name, row_index_list,
+                         column = 0):
+        """
+        Expand or contract table cells
+
+        @param window_name: Window name to type in, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to type in, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param row_index_list: Row indexes to expand or contract
+        @type row_index_list: list
+        @param column: Column index, default value 0
+        @type column: integer
+
+        @return: list of [row, column, 1 on success 0 on failure,
+        error message]
+        @rtype: list
+        """
+        return self._table_cells_apply(window_name, object_name,
+                                       [(row_index, column) \
+                                            for row_index in row_index_list],
+                                       self._expand_cell)
+
+    def setcellvalues(self, window_name, object_name, values):
+        """
+        Set cell values
+
+        @param window_name: Window name to type in, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to type in, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param values: list of [row, column, data], or dictionary of
+        'row,column': data. data None toggles the cell, as setcellvalue
+        @type values: list
+
+        @return: list of [row, column, 1 on success 0 on failure,
+        error message]
+        @rtype: list
+        """
+        cells = []
+        if isinstance(values, dict):
+            for key, data in values.items():
+                try:
+                    row_index, column = [int(i) for i in key.split(',')]
+                except ValueError:
+                    raise LdtpServerException('Invalid cell %s, use row,column' \
+                                                  % key)
+                cells.append((row_index, column, data))
+            # Dictionary order doesn't matter to the caller, apply row wise
+            cells.sort(key=lambda cell: cell[:2])
         else:
-            try:
-                actioni = cell.queryAction()
-                flag = True
-                if self._check_state(cell, pyatspi.STATE_CHECKED):
-                    self._click_object(cell, 'toggle')
-            except NotImplementedError:
-                raise LdtpServerException('Unable to check row')
-            self._grab_focus(cell)
-        if not flag:
-            raise LdtpServerException('Unable to check row')
-        return 1
+            for cell in values:
+                if len(cell) != 3:
+                    raise LdtpServerException('Invalid cell %s, use ' \
+                                                  '[row, column, data]' % cell)
+                cells.append(tuple(cell))
+        return self._table_cells_apply(window_name, object_name, cells,
+                                       self._set_cell_value, True)
 
     def gettablerowindex(self, window_name, object_name, row_text):
         """
@@ -798,37 +1303,11 @@ class Table(Utils):
         """
         obj = self._get_object(window_name, object_name)
 
-        try:
-            tablei = obj.queryTable()
-        except NotImplementedError:
-            raise LdtpServerException('Object not table type.')
-
-        for i in range(0, tablei.nRows):
-            for j in range(0, tablei.nColumns):
-                cell = tablei.getAccessibleAt(i, j)
-                if not cell:
-                    continue
-                if cell.childCount > 0:
-                    flag = False
-                    try:
-                        if self._handle_table_cell:
-                            # Was externally set, let us not
-                            # touch this value
-                            flag = True
-                        else:
-                            self._handle_table_cell = True
-                        children = self._list_objects(cell)
-                        for child in children:
-                            if self._match_name_to_acc(row_text, child):
-                                self._grab_focus(child)
-                                return i
-                    finally:
-                        if not flag:
-                            self._handle_table_cell = False
-                elif self._match_name_to_acc(row_text, cell):
-                    self._grab_focus(cell)
-                    return i
-        raise LdtpServerException('Unable to get row index: %s' % row_text)
+        entry = self._find_table_row(obj, row_text)
+        if not entry:
+            raise LdtpServerException('Unable to get row index: %s' % row_text)
+        self._grab_focus(entry.acc)
+        return entry.row
 
     def singleclickrow(self, window_name, object_name, row_text):
         """
@@ -848,45 +1327,15 @@ class Table(Utils):
         """
         obj = self._get_object(window_name, object_name)
 
-        try:
-            tablei = obj.queryTable()
-        except NotImplementedError:
-            raise LdtpServerException('Object not table type.')
-
-        for i in range(0, tablei.nRows):
-            for j in range(0, tablei.nColumns):
-                cell = tablei.getAccessibleAt(i, j)
-                if not cell:
-                    continue
-                if cell.childCount > 0:
-                    flag = False
-                    try:
-                        if self._handle_table_cell:
-                            # Was externally set, let us not
-                            # touch this value
-                            flag = True
-                        else:
-                            self._handle_table_cell = True
-                        children = self._list_objects(cell)
-                        for child in children:
-                            if self._match_name_to_acc(row_text, child):
-                                self._grab_focus(child)
-                                size = self._get_size(cell)
-                                self._mouse_event(size.x + size.width / 2,
-                                                  size.y + size.height / 2,
-                                                  'b1c')
-                                return i
-                    finally:
-                        if not flag:
-                            self._handle_table_cell = False
-                elif self._match_name_to_acc(row_text, cell):
-                    self._grab_focus(cell)
-                    size = self._get_size(cell)
-                    self._mouse_event(size.x + size.width / 2,
-                                      size.y + size.height / 2,
-                                      'b1c')
-                    return i
-        raise LdtpServerException('Unable to get row index: %s' % row_text)
+        entry = self._find_table_row(obj, row_text)
+        if not entry:
+            raise LdtpServerException('Unable to get row index: %s' % row_text)
+        self._grab_focus(entry.acc)
+        size = self._get_size(entry.cell)
+        self._mouse_event(size.x + size.width / 2,
+                          size.y + size.height / 2,
+                          'b1c')
+        return entry.row
 
     def doubleclickrow(self, window_name, object_name, row_text):
         """
@@ -906,45 +1355,15 @@ class Table(Utils):
         """
         obj = self._get_object(window_name, object_name)
 
-        try:
-            tablei = obj.queryTable()
-        except NotImplementedError:
-            raise LdtpServerException('Object not table type.')
-
-        for i in range(0, tablei.nRows):
-            for j in range(0, tablei.nColumns):
-                cell = tablei.getAccessibleAt(i, j)
-                if not cell:
-                    continue
-                if cell.childCount > 0:
-                    flag = False
-                    try:
-                        if self._handle_table_cell:
-                            # Was externally set, let us not
-                            # touch this value
-                            flag = True
-                        else:
-                            self._handle_table_cell = True
-                        children = self._list_objects(cell)
-                        for child in children:
-                            if self._match_name_to_acc(row_text, child):
-                                self._grab_focus(child)
-                                size = self._get_size(cell)
-                                self._mouse_event(size.x + size.width / 2,
-                                                  size.y + size.height / 2,
-                                                  'b1d')
-                                return i
-                    finally:
-                        if not flag:
-                            self._handle_table_cell = False
-                elif self._match_name_to_acc(row_text, cell):
-                    self._grab_focus(cell)
-                    size = self._get_size(cell)
-                    self._mouse_event(size.x + size.width / 2,
-                                      size.y + size.height / 2,
-                                      'b1d')
-                    return i
-        raise LdtpServerException('Unable to get row index: %s' % row_text)
+        entry = self._find_table_row(obj, row_text)
+        if not entry:
+            raise LdtpServerException('Unable to get row index: %s' % row_text)
+        self._grab_focus(entry.acc)
+        size = self._get_size(entry.cell)
+        self._mouse_event(size.x + size.width / 2,
+                          size.y + size.height / 2,
+                          'b1d')
+        return entry.row
 
     def doubleclickrowindex(self, window_name, object_name, row_index, col_index=0):
         """
@@ -966,15 +1385,13 @@ class Table(Utils):
         """
         obj = self._get_object(window_name, object_name)
 
-        try:
-            tablei = obj.queryTable()
-        except NotImplementedError:
-            raise LdtpServerException('Object not table type.')
+        tablei = self._get_table(obj)
+        rows, columns = atspi.get_table_size(tablei)
 
-        if row_index < 0 or row_index > tablei.nRows:
+        if row_index < 0 or row_index > rows:
             raise LdtpServerException('Row index out of range: %d' % row_index)
         try:
-            cell = tablei.getAccessibleAt(row_index, col_index)
+            cell = atspi.get_table_cell(tablei, row_index, col_index)
             self._grab_focus(cell)
             size = self._get_size(cell)
             self._mouse_event(size.x + size.width / 2,
@@ -1035,6 +1452,12 @@ class Table(Utils):
         try:
             obj = self._get_object(window_name, object_name, False)
 
+            if atspi.get_table(obj):
+                # Cells, with their own text, and the objects inside
+                # cells are indexed, a clean index is trusted on a miss
+                return int(bool(self._find_table_row(obj, row_text,
+                                                     partial_match, True)))
+
             def _searchString(acc):
                 try:
                     itext = acc.queryText()
@@ -1046,7 +1469,7 @@ class Table(Utils):
                 else:
                     return row_text == itext.getText(0, -1)
 
-            results = pyatspi.findDescendant(obj, _searchString)
+            results = atspi.findDescendant(obj, _searchString)
         
             return int(bool(results))
         except:
@@ -0,0 +1,197 @@
+"""
+LDTP v2 table text index.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See "COPYING" in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+from collections import OrderedDict
+from .backends import atspi
+
+# Tables indexed at a time, least recently used index is dropped
+_max_indexes = 8
+
+# Table changes, after which the table index is rebuilt
+_table_events = ('object:model-changed', 'object:row-inserted',
+                 'object:row-deleted', 'object:row-reordered')
+
+# Cell changes, from a table cell or a nested table cell, after which
+# the index of the table is rebuilt
+_cell_events = ('object:property-change:accessible-name',
+                'object:text-changed')
+
+_unset = object()
+
+class TableEntry:
+    """
+    Indexed accessible, a table cell or an object inside a table cell
+    """
+    __slots__ = ('row', 'column', 'cell', 'acc', 'nested', 'name',
+                 'abbrev_role', 'abbrev_name', 'role', '_text')
+
+    def __init__(self, row, column, cell, acc, nested, name,
+                 abbrev_role, abbrev_name, role):
+        self.row = row
+        self.column = column
+        self.cell = cell
+        # Accessible to act on, cell or an object inside the cell
+        self.acc = acc
+        # True if the cell has children
+        self.nested = nested
+        self.name = name
+        self.abbrev_role = abbrev_role
+        self.abbrev_name = abbrev_name
+        self.role = role
+        self._text = _unset
+
+    def text(self):
+        """
+        @return: text interface content, None if no text interface,
+        fetched on first call
+        @rtype: string
+        """
+        if self._text is _unset:
+            texti = atspi.get_text(self.acc)
+            self._text = texti.getText(0, -1) if texti else None
+        return self._text
+
+class TableIndex:
+    """
+    Table snapshot: table cells in row major order, with cell name to
+    first position, and cell values by column
+    """
+    def __init__(self, tablei, size):
+        self.tablei = tablei
+        # rows, columns when the index was built
+        self.size = size
+        # Set on a table change event
+        self.dirty = False
+        # None until filled
+        self.entries = None
+        self.names = {}
+        # column index: list of cell values
+        self.values = {}
+
+    def add(self, entry):
+        self.names.setdefault(entry.name, len(self.entries))
+        self.entries.append(entry)
+
+    def find(self, match, name=None):
+        """
+        Find the first entry, in row major order, matching
+
+        @param match: Function taking an entry, returns true on match
+        @type match: function
+        @param name: Cell name, when an exact name match is likely
+        @type name: string
+
+        @return: entry, None if no match
+        @rtype: object
+        """
+        end = len(self.entries)
+        if name is not None and name in self.names:
+            position = self.names[name]
+            if match(self.entries[position]):
+                # Only entries before the exact name can match first
+                end = position
+        for i in range(end):
+            if match(self.entries[i]):
+                return self.entries[i]
+        if end < len(self.entries):
+            return self.entries[end]
+        return None
+
+class TableIndexes:
+    """
+    Table indexes, by table accessible. An index is marked dirty when
+    its table emits a model change event, or one of its cells a name or
+    text change event. Events are listened to only while an index is
+    held.
+    """
+    def __init__(self):
+        self._indexes = OrderedDict()
+        self._listening = False
+
+    def get(self, obj):
+        index = self._indexes.get(obj, None)
+        if index is not None:
+            self._indexes.move_to_end(obj)
+        return index
+
+    def put(self, obj, index):
+        if not self._listening:
+            atspi.register_event(self._on_table_changed, *_table_events)
+            atspi.register_event(self._on_cell_changed, *_cell_events)
+            self._listening = True
+        self._indexes[obj] = index
+        self._indexes.move_to_end(obj)
+        while len(self._indexes) > _max_indexes:
+            self._indexes.popitem(last=False)
+
+    def invalidate(self, obj):
+        index = self._indexes.get(obj, None)
+        if index is not None:
+            index.dirty = True
+
+    def clear(self):
+        self._indexes.clear()
+        self._stop_listening()
+
+    def prune(self):
+        """
+        Drop the indexes of tables gone, and stop listening once no
+        index is held
+        """
+        for obj in list(self._indexes.keys()):
+            try:
+                if not atspi.has_state(obj, atspi.STATE_DEFUNCT):
+                    continue
+            except Exception:
+                # Table bailed out
+                pass
+            del self._indexes[obj]
+        if not self._indexes:
+            self._stop_listening()
+
+    def _stop_listening(self):
+        if self._listening:
+            atspi.deregister_event(self._on_table_changed, *_table_events)
+            atspi.deregister_event(self._on_cell_changed, *_cell_events)
+            self._listening = False
+
+    def _on_table_changed(self, event):
+        if event and event.source is not None:
+            self.invalidate(event.source)
+
+    def _on_cell_changed(self, event):
+        if not self._indexes or not event or event.source is None:
+            return
+        try:
+            # Other events, desktop wide, cost no remote parent lookup
+            if atspi.get_role(event.source) != atspi.ROLE_TABLE_CELL:
+                return
+            # Table is the parent of a cell, or of the cell of a nested
+            # cell
+            parent = event.source.parent
+            for i in range(2):
+                if parent is None:
+                    return
+                if parent in self._indexes:
+                    self.invalidate(parent)
+                    return
+                parent = parent.parent
+        except Exception:
+            # Source bailed out
+            pass
+
+table_indexes = TableIndexes()
@@ -20,12 +20,89 @@ Headers in this file shall remain intact.
 """
 
 import re
-import pyatspi 
+import hashlib
+from collections import OrderedDict
+from .backends import atspi
 from .utils import Utils
 from fnmatch import translate as glob_trans
 from .server_exception import LdtpServerException
+from .waiters import TextChangedWaiter
 from .keypress_actions import KeyComboAction, KeyPressAction, KeyReleaseAction
 
+# Text input modes, see enterstring
+_input_modes = ('keys', 'bulk', 'insert', 'paste')
+
+# Seconds to wait for the typed text, on verify
+_verify_timeout = 5
+
+# Keys in enterstring syntax, <enter>
+_key_token = re.compile('<[^>]+>')
+
+# Default gettextchunk length, in characters
+_text_chunk_size = 65536
+
+# Text objects resolved by gettextlength / gettextchunk, by
+# (window_name, object_name), least recently used is dropped
+_max_text_handles = 8
+_text_handles = OrderedDict()
+
+# Longest findtext match, in characters, a longer one raises an error
+_max_match = _text_chunk_size
+
+# Text digests kept at a time
+_max_text_hashes = 32
+
+class TextHashes:
+    """
+    Text digests, by accessible and algorithm. The digests of an
+    accessible are dropped when it emits a text-changed event.
+    """
+    def __init__(self):
+        self._hashes = OrderedDict()
+        self._listening = False
+
+    def get(self, obj, texti, algorithm):
+        """
+        @return: hex digest of the text, cached until the text changes
+        @rtype: string
+        """
+        digests = self._hashes.get(obj, None)
+        if digests is None:
+            if not self._listening:
+                atspi.register_event(self._on_text_changed,
+                                     'object:text-changed')
+                self._listening = True
+            digests = self._hashes[obj] = {}
+            while len(self._hashes) > _max_text_hashes:
+                self._hashes.popitem(last=False)
+        else:
+            self._hashes.move_to_end(obj)
+        if algorithm not in digests:
+            digests[algorithm] = self._digest(texti, algorithm)
+        return digests[algorithm]
+
+    def _digest(self, texti, algorithm):
+        try:
+            digest = hashlib.new(algorithm)
+        except ValueError:
+            raise LdtpServerException('Unsupported algorithm %s' % algorithm)
+        # Hash in chunks, to not hold a second copy of large text
+        length = texti.characterCount
+        for offset in range(0, length, _text_chunk_size):
+            digest.update(texti.getText(
+                    offset, min(offset + _text_chunk_size,
+                                length)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def invalidate(self, obj):
+        self._hashes.pop(obj, None)
+
+    def _on_text_changed(self, event):
+        if event and event.source is not None:
+            self.invalidate(event.source)
+
+text_hashes = TextHashes()
+
 class Text(Utils):
     def generatekeyevent(self, data):
         """
@@ -76,7 +153,8 @@ class Text(Utils):
 
         return 1
 
-    def enterstring(self, window_name, object_name='', data=''):
+    def enterstring(self, window_name, object_name='', data='',
+                    mode='keys', verify=False):
         """
         Type string sequence.
         
@@ -88,15 +166,31 @@ class Text(Utils):
         @type object_name: string
         @param data: data to type.
         @type data: string
+        @param mode: keys - key events, with a delay between keys,
+        bulk - key events without delay, insert - insert data at the
+        cursor through the accessibility API, paste - paste data from
+        the clipboard. insert and paste take data as is, without
+        <key> names, and need object_name.
+        @type mode: string
+        @param verify: Wait for the typed text to show up in the object,
+        needs object_name.
+        @type verify: boolean
 
         @return: 1 on success.
         @rtype: integer
         """
+        if mode not in _input_modes:
+            raise LdtpServerException('Invalid mode %s, use one of %s' % \
+                                          (mode, ', '.join(_input_modes)))
+        obj = None
         if object_name:
             obj=self._get_object(window_name, object_name,
                                  obj_type=['combo_box', 'text', 'entry',
                                            'paragraph', 'password_text', 'editbar'])
             self._grab_focus(obj)
+        elif mode in ('insert', 'paste') or verify:
+            raise LdtpServerException('object_name is required with mode %s' \
+                                          ' or verify' % mode)
         if data:
             for gui in self._list_guis():
                 if self._match_name_to_acc(window_name, gui):
@@ -105,12 +199,24 @@ class Text(Utils):
         else:
             text=window_name # TODO: Major hack, this is a bad API choice
 
-        key_combo_action=KeyComboAction(text)
-        key_combo_action()
-
+        if obj:
+            obj = self._get_text_object(obj)
+        if verify:
+            before = self._get_text_content(obj)
+            if mode in ('keys', 'bulk'):
+                # Key names don't show up as is
+                chunks = [chunk for chunk in _key_token.split(text) if chunk]
+            else:
+                chunks = [text]
+            condition = lambda current: current != before and \
+                all(chunk in current for chunk in chunks)
+        self._input_text(obj, text, mode)
+        if verify:
+            self._verify_text(obj, condition)
         return 1
 
-    def settextvalue(self, window_name, object_name, data):
+    def settextvalue(self, window_name, object_name, data, mode='insert',
+                     verify=False):
         """
         Type string sequence.
         
@@ -122,25 +228,111 @@ class Text(Utils):
         @type object_name: string
         @param data: data to type.
         @type data: string
+        @param mode: insert - replace the text through the
+        accessibility API, keys, bulk or paste - clear the text, then
+        enter data as enterstring
+        @type mode: string
+        @param verify: Wait for the object text to be data, for keys
+        and bulk modes, to contain data without the <key> names
+        @type verify: boolean
 
         @return: 1 on success.
         @rtype: integer
         """
+        if mode not in _input_modes:
+            raise LdtpServerException('Invalid mode %s, use one of %s' % \
+                                          (mode, ', '.join(_input_modes)))
         obj=self._get_object(window_name, object_name,
                              obj_type=['combo_box', 'text', 'entry',
                                        'paragraph', 'password_text', 'editbar'])
         self._grab_focus(obj)
-        if obj.getRole() == pyatspi.ROLE_COMBO_BOX:
-            obj=self._get_child_object_type(obj, pyatspi.ROLE_TEXT)
+        obj = self._get_text_object(obj)
+        texti = self._get_editable_text(obj)
+
+        if mode == 'insert':
+            result = int(texti.setTextContents(data))
+        else:
+            texti.deleteText(0, texti.characterCount)
+            self._input_text(obj, data, mode)
+            result = 1
+        if verify:
+            if mode in ('keys', 'bulk'):
+                chunks = [chunk for chunk in _key_token.split(data) if chunk]
+                condition = lambda current: \
+                    all(chunk in current for chunk in chunks)
+            else:
+                condition = lambda current: current == data
+            self._verify_text(obj, condition)
+        return result
+
+    def _get_text_object(self, obj):
+        """
+        Get the object holding the text, combo box text child
+        """
+        if atspi.get_role(obj) == atspi.ROLE_COMBO_BOX:
+            obj=self._get_child_object_type(obj, atspi.ROLE_TEXT)
             if not obj:
                 raise LdtpServerException('Unable to get combo box children')
+        return obj
 
+    def _get_editable_text(self, obj):
         try:
-            texti=obj.queryEditableText()
+            return obj.queryEditableText()
         except NotImplementedError:
             raise LdtpServerException('Text cannot be entered into object.')
 
-        return int(texti.setTextContents(data.encode('utf-8')))
+    def _get_text_content(self, obj):
+        try:
+            return obj.queryText().getText(0, -1)
+        except NotImplementedError:
+            raise LdtpServerException('Unable to get text.')
+
+    def _input_text(self, obj, text, mode):
+        """
+        Enter text in the focused object, as per enterstring mode
+        """
+        if mode == 'keys':
+            key_combo_action=KeyComboAction(text)
+            key_combo_action()
+        elif mode == 'bulk':
+            key_combo_action=KeyComboAction(text, interval=0)
+            key_combo_action()
+        elif mode == 'insert':
+            texti = self._get_editable_text(obj)
+            # Length in bytes, as gtk_editable_insert_text takes it
+            texti.insertText(texti.caretOffset, text,
+                             len(text.encode('utf-8')))
+        else:
+            self._set_clipboard_text(text)
+            try:
+                texti = obj.queryEditableText()
+            except NotImplementedError:
+                texti = None
+            if texti:
+                texti.pasteText(texti.caretOffset)
+            else:
+                key_combo_action=KeyComboAction('<ctrl>v')
+                key_combo_action()
+
+    def _set_clipboard_text(self, text):
+        try:
+            import gi
+            gi.require_version('Gtk', '3.0')
+            from gi.repository import Gtk, Gdk
+        except (ImportError, ValueError):
+            raise LdtpServerException('Clipboard requires gtk3')
+        clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
+        clipboard.set_text(text, -1)
+        # Keep the text, if the daemon exits before the paste
+        clipboard.store()
+
+    def _verify_text(self, obj, condition):
+        waiter = TextChangedWaiter(
+            obj, lambda: condition(self._get_text_content(obj)),
+            _verify_timeout)
+        if not waiter.run():
+            raise LdtpServerException('Text was not entered, current text: %s' \
+                                          % self._get_text_content(obj))
 
     def gettextvalue(self, window_name, object_name, startPosition=None,
                      endPosition=None):
@@ -165,13 +357,13 @@ class Text(Utils):
                              obj_type=['combo_box', 'text', 'entry', 'label',
                                        'paragraph', 'password_text', 'editbar',
                                        'terminal'])
-        if obj.getRole() == pyatspi.ROLE_COMBO_BOX:
+        if obj.getRole() == atspi.ROLE_COMBO_BOX:
             child_obj=self._get_combo_child_object_type(obj)
-            if child_obj.getRole() == pyatspi.ROLE_LIST:
-                obj=self._get_child_object_type(obj, pyatspi.ROLE_TEXT)
+            if child_obj.getRole() == atspi.ROLE_LIST:
+                obj=self._get_child_object_type(obj, atspi.ROLE_TEXT)
                 if not obj:
                     raise LdtpServerException('Unable to get text object')
-            elif child_obj.getRole() == pyatspi.ROLE_MENU:
+            elif child_obj.getRole() == atspi.ROLE_MENU:
                 return obj.name
             else:
                 raise LdtpServerException('Unable to get combo box child object')
@@ -189,11 +381,261 @@ class Text(Utils):
         else:
             end=texti.characterCount
 
-        text=texti.getText(start, end)
+        return texti.getText(start, end)
+
+    def _get_text_handle(self, window_name, object_name):
+        """
+        Text object and its text interface, reused across calls with
+        the same window and object name, as long as the object is alive
+        """
+        key = (window_name, object_name)
+        handle = _text_handles.get(key, None)
+        if handle is not None:
+            try:
+                # Fails, if the object is gone
+                handle[1].characterCount
+                _text_handles.move_to_end(key)
+                return handle
+            except Exception:
+                del _text_handles[key]
+        obj=self._get_object(window_name, object_name,
+                             obj_type=['text', 'entry', 'label', 'paragraph',
+                                       'password_text', 'editbar', 'terminal',
+                                       'combo_box'])
+        obj=self._get_text_object(obj)
         try:
-            return unicode(text)
-        except UnicodeDecodeError:
-            return text
+            texti=obj.queryText()
+        except NotImplementedError:
+            raise LdtpServerException('Text cannot be retrieved from object %s.' % obj)
+        _text_handles[key] = (obj, texti)
+        while len(_text_handles) > _max_text_handles:
+            _text_handles.popitem(last=False)
+        return obj, texti
+
+    def gettextlength(self, window_name, object_name):
+        """
+        Get text length, in characters, to page through large text
+        with gettextchunk
+        
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to look for, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+
+        @return: text length on success.
+        @rtype: integer
+        """
+        obj, texti = self._get_text_handle(window_name, object_name)
+        return texti.characterCount
+
+    def gettextchunk(self, window_name, object_name, offset=0,
+                     length=_text_chunk_size):
+        """
+        Get part of the text, without fetching the whole text
+        
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to look for, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param offset: Starting character offset
+        @type offset: integer
+        @param length: Maximum characters to fetch
+        @type length: integer
+
+        @return: text from offset, empty string at the end of text.
+        @rtype: string
+        """
+        if offset < 0 or length <= 0:
+            raise LdtpServerException('Invalid offset %d or length %d' % \
+                                          (offset, length))
+        obj, texti = self._get_text_handle(window_name, object_name)
+        end = min(offset + length, texti.characterCount)
+        if offset >= end:
+            return ''
+        return texti.getText(offset, end)
+
+    def _find_text(self, texti, pattern, regex, start, max_hits):
+        """
+        Search the text in chunks of _text_chunk_size, holding at most
+        two chunks at a time
+
+        @return: list of [offset, length, line number]
+        @rtype: list
+        """
+        try:
+            regexp = re.compile(pattern if regex else re.escape(pattern), re.M)
+        except re.error as e:
+            raise LdtpServerException('Invalid pattern %s: %s' % (pattern, e))
+        length = texti.characterCount
+        if start < 0 or start > length:
+            raise LdtpServerException('Invalid start %d' % start)
+        line = 1
+        for offset in range(0, start, _text_chunk_size):
+            line += texti.getText(offset, min(offset + _text_chunk_size,
+                                              start)).count('\n')
+        # Keep one character before the search position, so that ^
+        # and \b see the preceding text
+        base = max(start - 1, 0)
+        buffer = texti.getText(base, start) if start else ''
+        # Search position and the position line refers to, in buffer
+        pos = line_pos = len(buffer)
+        read = start
+        hits = []
+        while True:
+            end = min(read + _text_chunk_size, length)
+            if read < end:
+                buffer += texti.getText(read, end)
+            read = end
+            final = read >= length
+            keep = None
+            for match in regexp.finditer(buffer, pos):
+                if not final and match.start() + _max_match >= len(buffer):
+                    # Match may continue, or be a longer one, with the
+                    # next chunk
+                    keep = match.start()
+                    break
+                if not final and match.end() == len(buffer):
+                    # Cut at the buffer end
+                    raise LdtpServerException(
+                        'Match at offset %d is longer than %d characters' % \
+                            (base + match.start(), _max_match))
+                if match.start() == match.end():
+                    continue
+                line += buffer.count('\n', line_pos, match.start())
+                line_pos = match.start()
+                hits.append([base + match.start(),
+                             match.end() - match.start(), line])
+                pos = match.end()
+                if max_hits > 0 and len(hits) >= max_hits:
+                    return hits
+            if final:
+                return hits
+            # Keep the tail, a match may start there
+            keep = max(pos if keep is None else keep,
+                       len(buffer) - _max_match)
+            line += buffer.count('\n', line_pos, keep)
+            cut = max(keep - 1, 0)
+            base += cut
+            buffer = buffer[cut:]
+            pos = line_pos = keep - cut
+
+    def findtext(self, window_name, object_name, pattern, regex=False,
+                 start=0, max_hits=100):
+        """
+        Find text, in the daemon, without fetching the whole text
+        
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to look for, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param pattern: Text to find, or a Python regular expression,
+        matched in multiline mode, matches are limited to 64K characters,
+        a longer match raises an error
+        @type pattern: string
+        @param regex: pattern is a regular expression
+        @type regex: boolean
+        @param start: Character offset to start the search from
+        @type start: integer
+        @param max_hits: Maximum matches to return, 0 for all
+        @type max_hits: integer
+
+        @return: list of [offset, length, line number], line numbers
+        start at 1
+        @rtype: list
+        """
+        obj, texti = self._get_text_handle(window_name, object_name)
+        return self._find_text(texti, pattern, regex, start, max_hits)
+
+    def setcursortomatch(self, window_name, object_name, pattern,
+                         regex=False, start=0, occurrence=1):
+        """
+        Move the cursor to the start of a findtext match
+        
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to look for, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param pattern: Text to find, or a Python regular expression
+        @type pattern: string
+        @param regex: pattern is a regular expression
+        @type regex: boolean
+        @param start: Character offset to start the search from
+        @type start: integer
+        @param occurrence: Match to move to, 1 for the first match
+        @type occurrence: integer
+
+        @return: cursor offset on success.
+        @rtype: integer
+        """
+        if occurrence < 1:
+            raise LdtpServerException('Invalid occurrence %d' % occurrence)
+        obj, texti = self._get_text_handle(window_name, object_name)
+        hits = self._find_text(texti, pattern, regex, start, occurrence)
+        if len(hits) < occurrence:
+            raise LdtpServerException('Unable to find %s' % pattern)
+        offset = hits[-1][0]
+        if not texti.setCaretOffset(offset):
+            raise LdtpServerException('Unable to set cursor position')
+        return offset
+
+    def gettexthash(self, window_name, object_name, algorithm='sha1'):
+        """
+        Get digest of the text, computed in the daemon and cached until
+        the object emits a text-changed event
+        
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to look for, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param algorithm: hashlib algorithm name, eg: md5, sha1, sha256
+        @type algorithm: string
+
+        @return: hex digest on success.
+        @rtype: string
+        """
+        obj, texti = self._get_text_handle(window_name, object_name)
+        return text_hashes.get(obj, texti, algorithm)
+
+    def waitfortextchange(self, window_name, object_name, since_hash,
+                          timeout=30, algorithm='sha1'):
+        """
+        Wait until the text digest differs from since_hash
+        
+        @param window_name: Window name to look for, either full name,
+        LDTP's name convention, or a Unix glob.
+        @type window_name: string
+        @param object_name: Object name to look for, either full name,
+        LDTP's name convention, or a Unix glob. 
+        @type object_name: string
+        @param since_hash: Digest returned by gettexthash
+        @type since_hash: string
+        @param timeout: Wait timeout in seconds
+        @type timeout: integer
+        @param algorithm: Algorithm of since_hash
+        @type algorithm: string
+
+        @return: current hex digest, same as since_hash on timeout.
+        @rtype: string
+        """
+        obj, texti = self._get_text_handle(window_name, object_name)
+        current = lambda: text_hashes.get(obj, texti, algorithm)
+        if current() == since_hash:
+            # Cached digest is dropped on text-changed, so polling
+            # rehashes only after a change
+            waiter = TextChangedWaiter(obj, lambda: current() != since_hash,
+                                       timeout)
+            waiter.run()
+        return current()
 
     def inserttext(self, window_name, object_name, position, data):
         """
@@ -217,8 +659,8 @@ class Text(Utils):
                              obj_type=['combo_box', 'text', 'entry',
                                        'paragraph', 'password_text', 'editbar'])
         self._grab_focus(obj)
-        if obj.getRole() == pyatspi.ROLE_COMBO_BOX:
-            obj=self._get_child_object_type(obj, pyatspi.ROLE_TEXT)
+        if obj.getRole() == atspi.ROLE_COMBO_BOX:
+            obj=self._get_child_object_type(obj, atspi.ROLE_TEXT)
             if not obj:
                 raise LdtpServerException('Unable to get combo box children')
 
@@ -227,7 +669,9 @@ class Text(Utils):
         except NotImplementedError:
             raise LdtpServerException('Text cannot be entered into object.')
 
-        return int(texti.insertText(position, data.encode('utf-8'), len(data)))
+        # Length in bytes, as gtk_editable_insert_text takes it
+        return int(texti.insertText(position, data,
+                                    len(data.encode('utf-8'))))
 
     def verifypartialmatch(self, window_name, object_name, partial_text):
         """
@@ -318,8 +762,8 @@ class Text(Utils):
                              obj_type=['combo_box', 'text', 'entry',
                                        'paragraph', 'password_text', 'editbar'])
         self._grab_focus(obj)
-        if obj.getRole() == pyatspi.ROLE_COMBO_BOX:
-            obj=self._get_child_object_type(obj, pyatspi.ROLE_TEXT)
+        if obj.getRole() == atspi.ROLE_COMBO_BOX:
+            obj=self._get_child_object_type(obj, atspi.ROLE_TEXT)
             if not obj:
                 raise LdtpServerException('Unable to get combo box children')
 
@@ -329,7 +773,7 @@ class Text(Utils):
             raise LdtpServerException('Text cannot be entered into object.')
 
         texti.setTextContents('%s%s' % (texti.getText(0, texti.characterCount),
-                                        data.encode('utf-8')))
+                                        data))
         return 1
 
     def istextstateenabled(self, window_name, object_name):
@@ -350,7 +794,7 @@ class Text(Utils):
             obj=self._get_object(window_name, object_name, False,
                                  obj_type=['combo_box', 'text', 'entry',
                                            'paragraph', 'password_text', 'editbar'])
-            return int(self._check_state(obj, pyatspi.STATE_EDITABLE))
+            return int(self._check_state(obj, atspi.STATE_EDITABLE))
         except:
             return 0
 
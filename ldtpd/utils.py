@@ -23,9 +23,8 @@ Headers in this file shall remain intact.
 import os
 import re
 import time
-import fnmatch
 import logging
-import pyatspi
+from .backends import atspi
 import threading
 import traceback
 import logging.handlers
@@ -40,16 +39,79 @@ except:
   import gtk
   gtk3 = False
 from re import match as re_match
+from functools import lru_cache
+from .metrics import metrics
+from .table_index import table_indexes
+from .spatial_index import spatial_indexes
 from .constants import abbreviated_roles
 from fnmatch import translate as glob_trans
 from .server_exception import LdtpServerException
 
-importStatGrab = False
-try:
+# Optional modules, imported on first use, None if not installed
+_optional_modules = {}
+
+def _import_optional(name, importer):
+    if name not in _optional_modules:
+        try:
+            _optional_modules[name] = importer()
+        except (ImportError, ValueError):
+            _optional_modules[name] = None
+    return _optional_modules[name]
+
+def _import_wnck():
+    if gtk3:
+        gi.require_version('Wnck', '3.0')
+        from gi.repository import Wnck
+        return Wnck
+    import wnck
+    return wnck
+
+def _import_statgrab():
     import statgrab
-    importStatGrab = True
-except ImportError:
-    pass
+    return statgrab
+
+def get_wnck():
+    """
+    @return: wnck module, None if not installed
+    @rtype: object
+    """
+    return _import_optional('wnck', _import_wnck)
+
+def get_wnck_screen():
+    """
+    @return: default wnck screen, None if wnck is not installed
+    @rtype: object
+    """
+    wnck = get_wnck()
+    if wnck is None:
+        return None
+    if gtk3:
+        return wnck.Screen.get_default()
+    return wnck.screen_get_default()
+
+def get_statgrab():
+    """
+    @return: statgrab module, None if not installed
+    @rtype: object
+    """
+    return _import_optional('statgrab', _import_statgrab)
+
+# Window roles, their names are stripped differently
+_window_roles = frozenset([atspi.ROLE_FRAME, atspi.ROLE_DIALOG,
+                           atspi.ROLE_WINDOW, atspi.ROLE_FONT_CHOOSER,
+                           atspi.ROLE_FILE_CHOOSER, atspi.ROLE_ALERT,
+                           atspi.ROLE_COLOR_CHOOSER])
+
+@lru_cache(maxsize=256)
+def _name_patterns(name):
+    """
+    Compiled glob patterns of a name, as is, stripped for window
+    names and stripped for other object names
+    """
+    flags = re.M | re.U
+    return (re.compile(glob_trans(name), flags),
+            re.compile(glob_trans(re.sub('( |\n)', '', name)), flags),
+            re.compile(glob_trans(re.sub('( |:|\.|_|\n)', '', name)), flags))
 
 class LdtpCustomLog(logging.Handler):
     """
@@ -106,7 +168,7 @@ class ProcessStats(threading.Thread):
         @param interval: Time interval between each process scan
         @type interval: float
         """
-        if not importStatGrab:
+        if not get_statgrab():
             raise LdtpServerException('python-statgrab package is not installed')
         threading.Thread.__init__(self)
         self._appname = appname
@@ -120,7 +182,7 @@ class ProcessStats(threading.Thread):
 
     def get_cpu_memory_stat(self):
         proc_list = []
-        for i in statgrab.sg_get_process_stats():
+        for i in get_statgrab().sg_get_process_stats():
             if self._stop:
                 self.running = False
                 return proc_list
@@ -133,7 +195,7 @@ class ProcessStats(threading.Thread):
                 # in that case let us use process_name
                 proctitle = str(i['process_name'])
             if not re.search(self._appname, proctitle,
-                             re.U | re.L):
+                             re.U):
                 # If process name doesn't match, continue
                 continue
             proc_list.append([i, self._appname])
@@ -183,25 +245,28 @@ class Utils:
         self._get_all_state_names()
         self._handle_table_cell = False
         self._custom_logger = _custom_logger
-        self._desktop = pyatspi.Registry.getDesktop(0)
+        self._desktop = atspi.Registry.getDesktop(0)
         self._ldtp_debug = os.environ.get('LDTP_DEBUG', None)
         self._ldtp_debug_file = os.environ.get('LDTP_DEBUG_FILE', None)
         # Initialize atspi2 version to False
         self._atspi2_ver = False
+        # Incremented on every window event, popup windows send no
+        # wnck signal
+        self._window_events = 0
         if Utils.cached_apps is None:
-            pyatspi.Registry.registerEventListener(
+            atspi.Registry.registerEventListener(
                 self._on_window_event, 'window')
             # Above window event doesn't get called for
             # 'window:destroy', so registering it individually
-            pyatspi.Registry.registerEventListener(
+            atspi.Registry.registerEventListener(
                 self._on_window_event, 'window:destroy')
             # Notify on any changes in all windows, based on this info,
             # its decided, whether force_remap is required or not
             # Commenting the following lines of code
             # as it sucks the execution time in at-spi2
-            #pyatspi.Registry.registerEventListener(self._obj_changed, 
+            #atspi.Registry.registerEventListener(self._obj_changed, 
             #                                       'object:children-changed')
-            #pyatspi.Registry.registerEventListener(
+            #atspi.Registry.registerEventListener(
             #    self._obj_changed, 'object:property-change:accessible-name')
 
             Utils.cached_apps = list()
@@ -215,10 +280,12 @@ class Utils:
                     self.cached_apps.append([app, True])
         if self._ldtp_debug:
             _custom_logger.setLevel(logging.DEBUG)
+
+    @property
+    def _root_window(self):
         if gtk3:
-            self._root_window = Gdk.get_default_root_window()
-        else:
-            self._root_window = gtk.gdk.get_default_root_window()
+            return Gdk.get_default_root_window()
+        return gtk.gdk.get_default_root_window()
 
     def _get_all_state_names(self):
         """
@@ -226,7 +293,7 @@ class Utils:
         Create a dictionary
         NOTE: Just called once, internally
         """
-        for state in pyatspi.STATE_VALUE_TO_NAME.keys():
+        for state in atspi.STATE_VALUE_TO_NAME.keys():
             self._states_old[state.__repr__()] = state
             # b.g.o Bug#654683
             self._states[str(state)] = state
@@ -270,6 +337,7 @@ class Utils:
                 continue
 
     def _on_window_event(self, event):
+        self._window_events += 1
         if self._ldtp_debug:
             try:
                 print(event, event.type, event.source, event.source.parent)
@@ -277,6 +345,9 @@ class Utils:
                 # With at-spi2, sometimes noticed exception
                 # ignore exception, as we just use them for debugging
                 pass
+        if event and event.type == "window:destroy":
+            # Tables of the window are gone with it
+            table_indexes.prune()
         try:
             # Proceed only for window destry and deactivate event
             if event and (event.type == "window:destroy" or \
@@ -319,7 +390,7 @@ class Utils:
                     index = self.cached_apps.index(app)
                     self.cached_apps[index][1] = True
                     if hasattr(app, 'setCacheMask'):
-                        app.setCacheMask(pyatspi.cache.ALL)
+                        app.setCacheMask(atspi.cache.ALL)
                     break
             if cache:
                 # If app doesn't exist in cached apps, then add it
@@ -335,7 +406,7 @@ class Utils:
                     fp.write(traceback.format_exc())
 
     def _atspi2_workaround(self):
-        if not hasattr(pyatspi, 'Accessible'):
+        if not hasattr(atspi, 'Accessible'):
             # This exist only in pyatspi2
             # Don't do the work around
             return
@@ -349,7 +420,7 @@ class Utils:
                     flag = True
                     break
             if hasattr(app, 'setCacheMask'):
-                app.setCacheMask(pyatspi.cache.ALL)
+                app.setCacheMask(atspi.cache.ALL)
             # App already in list, don't add again
             if flag: continue
             self.cached_apps.append([app, True])
@@ -379,7 +450,9 @@ class Utils:
             except LookupError:
                 # If the window doesn't exist, remove from the cached list
                 self.cached_apps.remove(app)
-            except:
+            except Exception:
+                # Not GeneratorExit, raised when the caller stops
+                # iterating, the application is still valid
                 # In at-spi2 gi._glib.GError exception is thrown
                 # If the window doesn't exist, remove from the cached list
                 self.cached_apps.remove(app)
@@ -415,8 +488,8 @@ class Utils:
                 relationType = rel.getRelationType()
                 # If object relation is labelled by or controlled by,
                 # then give that importance, rather than the direct object label
-                if relationType == pyatspi.RELATION_LABELLED_BY or \
-                        relationType == pyatspi.RELATION_CONTROLLED_BY:
+                if relationType == atspi.RELATION_LABELLED_BY or \
+                        relationType == atspi.RELATION_CONTROLLED_BY:
                     # Get associated label
                     try:
                         label_acc = rel.getTarget(i)
@@ -435,16 +508,11 @@ class Utils:
                                 fp.write(traceback.format_exc())
                         continue
         try:
-            role = acc.getRole()
+            role = atspi.get_role(acc)
         except:
             # with at-spi2 noticed gi._glib.GError exception
             role = None
-        if role == pyatspi.ROLE_FRAME or role == pyatspi.ROLE_DIALOG or \
-                role == pyatspi.ROLE_WINDOW or \
-                role == pyatspi.ROLE_FONT_CHOOSER or \
-                role == pyatspi.ROLE_FILE_CHOOSER or \
-                role == pyatspi.ROLE_ALERT or \
-                role == pyatspi.ROLE_COLOR_CHOOSER:
+        if role in _window_roles:
             # Strip space and new line from window title
             strip = '( |\n)'
         else:
@@ -454,14 +522,14 @@ class Utils:
         if label_acc:
             try:
                 # Priority to associated label
-                label_by = label_acc.name
+                label_by = atspi.get_name(label_acc)
             except:
                 label_by = ''
         # Return the role type (if, not in the know list of roles,
         # return ukn - unknown), strip the above characters from name
         # also return labely_by string
         try:
-            label = re.sub(strip, '', (label_acc or acc).name)
+            label = re.sub(strip, '', atspi.get_name(label_acc or acc))
         except:
             label = ''
         return abbreviated_roles.get(role, 'ukn'), \
@@ -472,9 +540,9 @@ class Utils:
         """
         Match given string, by escaping regex characters
         """
-        # regex flags Multi-line, Unicode, Locale
+        # regex flags Multi-line, Unicode
         return bool(re_match(glob_trans(pattern), string,
-                             re.M | re.U | re.L))
+                             re.M | re.U))
 
     def _match_name_to_acc(self, name, acc, classType = None):
         """
@@ -500,18 +568,14 @@ class Utils:
                 # User might mistype with multiple space, to avoid
                 # any confusion, using _. So, user will be inputing
                 # push_button
-                roleName = acc.getRoleName().replace(' ', '_')
+                roleName = atspi.get_role_name(acc).replace(' ', '_')
             else:
                 roleName = None
             if roleName != classType:
                 # If type doesn't match, don't proceed further
                 return 0
-            if acc.name:
-                try:
-                    _acc_name="%s" % acc.name
-                except UnicodeDecodeError:
-                    _acc_name=acc.name.decode('utf-8')
-            if acc.name and re.match(fnmatch.translate(name), _acc_name, re.M | re.U):
+            acc_name = atspi.get_name(acc)
+            if acc_name and _name_patterns(name)[0].match(acc_name):
                 # Since, type already matched and now the given name
                 # and accessibile name matched, mission accomplished
                 return 1
@@ -519,45 +583,58 @@ class Utils:
             # In at-spi2 gi._glib.GError exception is thrown
             return 0
         # Get LDTP format accessibile name
-        _ldtpize_accessible_name = self._ldtpize_accessible(acc)
-        # Concat object type and object name
-        # ex: 'frmUnsavedDocument1-gedit' for Gedit application
-        # frm - Frame, Window title - 'Unsaved Document 1 - gedit'
+        abbrev_role, abbrev_name, label_by = self._ldtpize_accessible(acc)
         try:
-           _object_name = '%s%s' % (_ldtpize_accessible_name[0],
-                                     _ldtpize_accessible_name[1])
-        except UnicodeDecodeError:
-           _object_name = '%s%s' % (_ldtpize_accessible_name[0],
-                                     _ldtpize_accessible_name[1].decode('utf-8'))
-        if self._glob_match(name, acc.name):
+            role = atspi.get_role(acc)
+        except:
+            # In at-spi2 acc doesn't exist
+            # which raises exception gi._glib.GError
+            role = None
+        return self._match_name_to_ldtpized(name, acc_name, abbrev_role,
+                                            abbrev_name, role)
+
+    def _match_name_to_ldtpized(self, name, acc_name, abbrev_role,
+                                abbrev_name, role):
+        """
+        Match given name with an accessible name and its LDTP format,
+        as returned by _ldtpize_accessible
+
+        @param name: Label to be matched
+        @type name: string
+        @param acc_name: Accessible name
+        @type acc_name: string
+        @param abbrev_role: LDTP object type, ex: frm
+        @type abbrev_role: string
+        @param abbrev_name: Stripped accessible name
+        @type abbrev_name: string
+        @param role: Accessible role, None if unknown
+        @type role: object
+
+        @return: Return 0 on failure, 1 on successful match
+        @rtype: integer
+        """
+        name_re, window_re, other_re = _name_patterns(name)
+        if acc_name and name_re.match(acc_name):
             # If given name match object name with regexp
             return 1
-        if self._glob_match(name, _object_name):
+        # Concat object type and object name
+        # ex: 'frmUnsavedDocument1-gedit' for Gedit application
+        # frm - Frame, Window title - 'Unsaved Document 1 - gedit'
+        _object_name = '%s%s' % (abbrev_role, abbrev_name)
+        if name_re.match(_object_name):
             # If given name match LDTPized name format with regexp
             return 1
-        try:
-            role = acc.getRole()
-        except:
-            # In at-spi2 acc doesn't exist
-            # which raises exception gi._glib.GError
+        if role is None:
             return 0
-        if role == pyatspi.ROLE_FRAME or role == pyatspi.ROLE_DIALOG or \
-                role == pyatspi.ROLE_WINDOW or \
-                role == pyatspi.ROLE_FONT_CHOOSER or \
-                role == pyatspi.ROLE_FILE_CHOOSER or \
-                role == pyatspi.ROLE_ALERT or \
-                role == pyatspi.ROLE_COLOR_CHOOSER:
-            # If window type, strip using this format
-            strip = '( |\n)'
+        # Given name stripped as per window type or other type
+        if role in _window_roles:
+            strip_re = window_re
         else:
-            # If any other type, strip using this format
-            strip = '( |:|\.|_|\n)'
-        # Strip given name too, as per window type or other type
-        _tmp_name = re.sub(strip, '', name)
-        if self._glob_match(_tmp_name, _object_name):
+            strip_re = other_re
+        if strip_re.match(_object_name):
             # Match stripped given name and LDTPized name
             return 1
-        if self._glob_match(_tmp_name, _ldtpize_accessible_name[1]):
+        if strip_re.match(abbrev_name):
             # Match stripped given name and LDTPized name, without object type
             # ex: UnsavedDocument1-gedit, without frm at start
             return 1
@@ -615,15 +692,15 @@ class Utils:
     def _list_objects(self, obj):
         if obj:
             yield obj
-            for child in obj:
+            for child in atspi.get_children(obj):
                 if not self._handle_table_cell and \
-                        child.getRole() == pyatspi.ROLE_TABLE_CELL:
+                        atspi.get_role(child) == atspi.ROLE_TABLE_CELL:
                     # In OO.o navigating table cells consumes more time
                     # resource
                     break
                 for c in self._list_objects(child):
                     # Don't include separators in the list
-                    if c.getRole() != pyatspi.ROLE_SEPARATOR:
+                    if atspi.get_role(c) != atspi.ROLE_SEPARATOR:
                         yield c
 
     def _get_combo_child_object_type(self, obj):
@@ -640,9 +717,9 @@ class Utils:
                 child_obj = self._get_combo_child_object_type(child)
                 if child_obj:
                     return child_obj
-            if child.getRole() == pyatspi.ROLE_LIST:
+            if child.getRole() == atspi.ROLE_LIST:
                 return child
-            elif child.getRole() == pyatspi.ROLE_MENU:
+            elif child.getRole() == atspi.ROLE_MENU:
                 return child
 
     def _get_child_object_type(self, obj, role_type):
@@ -693,31 +770,28 @@ class Utils:
         key_binding = ''
         try:
             iaction = obj.queryAction()
-            for j in xrange(iaction.nActions):
+            for j in range(iaction.nActions):
                 if iaction.getKeyBinding(j) != '':
                     key_binding = iaction.getKeyBinding(j)
                     break
         except NotImplementedError:
             pass
-        role = obj.getRole()
-        if role == pyatspi.ROLE_FRAME or role == pyatspi.ROLE_DIALOG or \
-                role == pyatspi.ROLE_WINDOW or \
-                role == pyatspi.ROLE_FONT_CHOOSER or \
-                role == pyatspi.ROLE_FILE_CHOOSER or \
-                role == pyatspi.ROLE_ALERT or \
-                role == pyatspi.ROLE_COLOR_CHOOSER:
-            obj_index = '%s#%d' % (obj.getApplication().name,
-                                   obj.getIndexInParent())
+        role = atspi.get_role(obj)
+        if role in _window_roles:
+            obj_index = '%s#%d' % (atspi.get_name(atspi.get_application(obj)),
+                                   atspi.get_index_in_parent(obj))
         else:
             obj_index = '%s#%d' % (abbrev_role,
                                    self.ldtpized_obj_index[abbrev_role])
+        if self.ldtpized_objects is not None:
+            self.ldtpized_objects[ldtpized_name] = obj
         self.ldtpized_list[ldtpized_name] = {'key' : ldtpized_name,
                                              'parent' : parent,
-                                             'class' : obj.getRoleName().replace(' ', '_'),
+                                             'class' : atspi.get_role_name(obj).replace(' ', '_'),
                                              'child_index' : child_index,
                                              'children' : '',
                                              'obj_index' : obj_index,
-                                             'label' : obj.name,
+                                             'label' : atspi.get_name(obj),
                                              'label_by' : label_by,
                                              'description' : obj.description,
                                              'key_binding' : key_binding
@@ -731,13 +805,13 @@ class Utils:
                 parent = self._add_appmap_data(obj, parent, child_index)
             # Have noticed using obj.getIndexInParent()
             # returns -1, let the loop counts the child index
-            for child in obj:
+            for child in atspi.get_children(obj):
                 index += 1
                 if not child:
                     continue
                 try:
                     if not self._handle_table_cell and \
-                           child.getRole() == pyatspi.ROLE_TABLE_CELL:
+                           atspi.get_role(child) == atspi.ROLE_TABLE_CELL:
                         break
                 except:
                     # Some object bailed out
@@ -746,8 +820,12 @@ class Utils:
 
     def _appmap_pairs(self, gui, window_name, force_remap = False):
         self.ldtpized_list = {}
+        # Accessibles, by ldtpized name, for the spatial index
+        self.ldtpized_objects = {} if spatial_indexes.enabled else None
         self.ldtpized_obj_index = {}
-        if not force_remap:
+        if force_remap:
+            metrics.incr('appmap_forced_remaps')
+        else:
             self._atspi2_workaround()
             for app in self.cached_apps:
                 try:
@@ -755,6 +833,7 @@ class Utils:
                             app[1] == True:
                         # Means force_remap
                         force_remap = True
+                        metrics.incr('appmap_invalidated_remaps')
                         index = self.cached_apps.index(app)
                         if index != -1:
                             # Reset force_remap to False
@@ -767,18 +846,25 @@ class Utils:
             if not force_remap:
                 for key in self._appmap.keys():
                     if self._match_name_to_acc(key, gui):
+                        metrics.incr('appmap_hits')
                         return self._appmap[key]
+                metrics.incr('appmap_misses')
 
         if gui and gui.parent:
             abbrev_role, abbrev_name, label_by = self._ldtpize_accessible(gui.parent)
             _parent = abbrev_name
         else:
             _parent = ''
+        start_time = time.time()
         try:
             self._populate_appmap(gui, _parent, gui.getIndexInParent())
         except LookupError:
             raise LdtpServerException("Unable to find window/object")
+        metrics.remap(window_name, time.time() - start_time,
+                      len(self.ldtpized_list))
         self._appmap[window_name] = self.ldtpized_list
+        if self.ldtpized_objects is not None:
+            spatial_indexes.put(self.ldtpized_list, self.ldtpized_objects)
         return self.ldtpized_list
 
     def _get_menu_hierarchy(self, window_name, object_name,
@@ -817,7 +903,7 @@ class Utils:
             raise LdtpServerException(
                 'Object does not have an Action interface')
         else:
-            for i in xrange(iaction.nActions):
+            for i in range(iaction.nActions):
                 if self._ldtp_debug:
                     print(iaction.getName(i))
                 if re.match(action, iaction.getName(i), re.I):
@@ -858,10 +944,13 @@ class Utils:
         else:
             retry=1
         for i in range(retry):
+            if i:
+                metrics.incr('window_lookup_retries')
             gui, name = self._internal_get_window_handle(window_name)
             if gui:
                 return gui, name
             if wait:
+                metrics.incr('window_lookup_sleeps')
                 time.sleep(1)
         return None, None
 
@@ -956,11 +1045,14 @@ class Utils:
         else:
             retry=1
         for i in range(retry):
+            if i:
+                metrics.incr('object_lookup_retries')
             obj = self._internal_get_object(_window_handle, _window_name,
                                             obj_name, obj_type)
             if obj:
                 return obj
             if wait:
+                metrics.incr('object_lookup_sleeps')
                 time.sleep(1)
         raise LdtpServerException(
             'Unable to find object name "%s" in application map' % obj_name)
@@ -1053,37 +1145,62 @@ class Utils:
             raise LdtpServerException('Failed to grab focus for %s' % obj)
         componenti.grabFocus()
 
-    def _get_accessible_at_row_column(self, obj, row_index, column_index):
-        try:
-            tablei = obj.queryTable()
-        except NotImplementedError:
+    def _get_table(self, obj):
+        """
+        Get table interface of obj, for the atspi.get_table_* helpers
+
+        @param obj: Accessible handle
+        @type obj: object
+
+        @return: table interface
+        @rtype: object
+        """
+        tablei = atspi.get_table(obj)
+        if not tablei:
             raise LdtpServerException('Object not table type.')
+        return tablei
 
-        if row_index < 0 or row_index > tablei.nRows:
+    def _get_accessible_at_row_column(self, obj, row_index, column_index):
+        tablei = self._get_table(obj)
+        return self._get_table_cell_at(tablei, atspi.get_table_size(tablei),
+                                       row_index, column_index)
+
+    def _get_table_cell_at(self, tablei, size, row_index, column_index):
+        """
+        Get table cell, when the table interface is already resolved
+
+        @param tablei: Table interface, from _get_table
+        @type tablei: object
+        @param size: rows, columns of the table
+        @type size: tuple
+        @param row_index: Row index
+        @type row_index: integer
+        @param column_index: Column index
+        @type column_index: integer
+
+        @return: cell accessible
+        @rtype: object
+        """
+        rows, columns = size
+
+        if row_index < 0 or row_index > rows:
             raise LdtpServerException('Row index out of range: %d' % row_index)
 
-        if column_index < 0 or column_index > tablei.nColumns:
+        if column_index < 0 or column_index > columns:
             raise LdtpServerException('Column index out of range: %d' % \
                                           column_index)
 
-        cell = tablei.getAccessibleAt(row_index, column_index)
+        cell = atspi.get_table_cell(tablei, row_index, column_index)
         if not cell:
             raise LdtpServerException('Unable to access table cell on ' \
                                           'the given row and column index')
         return cell
 
     def _check_state(self, obj, object_state):
-        _state = obj.getState()
-        _current_state = _state.getStates()
-
-        _status = False
-        if object_state in _current_state:
-            _status = True
-
-        return _status
+        return atspi.has_state(obj, object_state)
 
     def _mouse_event(self, x, y, name = 'b1c'):
-        pyatspi.Registry.generateMouseEvent(x, y, name)
+        atspi.Registry.generateMouseEvent(x, y, name)
 
         return 1
 
@@ -1092,4 +1209,4 @@ class Utils:
             componenti = obj.queryComponent()
         except:
             raise LdtpServerException('Failed to grab focus for %s' % obj)
-        return componenti.getExtents(pyatspi.DESKTOP_COORDS)
+        return componenti.getExtents(atspi.DESKTOP_COORDS)
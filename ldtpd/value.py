@@ -20,7 +20,7 @@ Headers in this file shall remain intact.
 """
 
 import time
-import pyatspi 
+from .backends import atspi
 from .utils import Utils
 from .server_exception import LdtpServerException
 
@@ -208,7 +208,7 @@ class Value(Utils):
         try:
             obj = self._get_object(window_name, object_name, False)
 
-            if self._check_state(obj, pyatspi.STATE_VERTICAL):
+            if self._check_state(obj, atspi.STATE_VERTICAL):
                 return 1
         except:
             pass
@@ -231,7 +231,7 @@ class Value(Utils):
         try:
             obj = self._get_object(window_name, object_name, False)
 
-            if self._check_state(obj, pyatspi.STATE_HORIZONTAL):
+            if self._check_state(obj, atspi.STATE_HORIZONTAL):
                 return 1
         except:
             pass
@@ -254,7 +254,7 @@ class Value(Utils):
         try:
             obj = self._get_object(window_name, object_name, False)
 
-            if self._check_state(obj, pyatspi.STATE_VERTICAL):
+            if self._check_state(obj, atspi.STATE_VERTICAL):
                 return 1
         except:
             pass
@@ -277,7 +277,7 @@ class Value(Utils):
         try:
             obj = self._get_object(window_name, object_name, False)
 
-            if self._check_state(obj, pyatspi.STATE_HORIZONTAL):
+            if self._check_state(obj, atspi.STATE_HORIZONTAL):
                 return 1
         except:
             pass
@@ -19,31 +19,23 @@ See "COPYING" in the source distribution for more information.
 Headers in this file shall remain intact.
 """
 
-wnckModule = False
-from .utils import Utils
+from .utils import Utils, get_wnck_screen
 import re
 import time
 try:
   # If we have gtk3+ gobject introspection, use that
   import gi
-  gi.require_version('Wnck', '3.0')
-  from gi.repository import Wnck as wnck
+  gi.require_version('Gtk', '3.0')
   from gi.repository import Gtk as gtk
   from gi.repository import GObject as gobject
-  wnckModule = gtk3 = True
+  gtk3 = True
 except:
-  # No gobject introspection, use gtk2 libwnck
+  # No gobject introspection, use gtk2
   gtk3 = False
   import gtk
   import gobject
-  try:
-    import wnck
-    wnckModule = True
-  except:
-    # Not all environments support wnck package
-    pass
 import fnmatch
-import pyatspi
+from .backends import atspi
 import traceback
 import datetime
 
@@ -80,14 +72,14 @@ class Waiter(Utils):
           gobject.timeout_add_seconds(self.timeout_seconds,
                                       self._timeout_cb)
           if self.events:
-            pyatspi.Registry.registerEventListener(
+            atspi.Registry.registerEventListener(
               self._event_cb, *self.events)
           if _main_loop:
             _main_loop.run()
           else:
             gtk.main()
           if self.events:
-            pyatspi.Registry.deregisterEventListener(
+            atspi.Registry.deregisterEventListener(
               self._event_cb, *self.events)
         except:
           if self._ldtp_debug:
@@ -175,10 +167,7 @@ class MaximizeWindow(Waiter):
     def poll(self):
         while gtk.events_pending():
           gtk.main_iteration()
-        if not gtk3:
-          screen = wnck.screen_get_default()
-        else:
-          screen = wnck.Screen.get_default()
+        screen = get_wnck_screen()
         screen.force_update()
         window_list = screen.get_windows()
         for w in window_list:
@@ -208,10 +197,7 @@ class MinimizeWindow(Waiter):
     def poll(self):
         while gtk.events_pending():
             gtk.main_iteration()
-        if not gtk3:
-          screen = wnck.screen_get_default()
-        else:
-          screen = wnck.Screen.get_default()
+        screen = get_wnck_screen()
         screen.force_update()
         window_list = screen.get_windows()
         for w in window_list:
@@ -241,10 +227,7 @@ class UnmaximizeWindow(Waiter):
     def poll(self):
         while gtk.events_pending():
             gtk.main_iteration()
-        if not gtk3:
-          screen = wnck.screen_get_default()
-        else:
-          screen = wnck.Screen.get_default()
+        screen = get_wnck_screen()
         screen.force_update()
         window_list = screen.get_windows()
         for w in window_list:
@@ -274,10 +257,7 @@ class UnminimizeWindow(Waiter):
     def poll(self):
         while gtk.events_pending():
             gtk.main_iteration()
-        if not gtk3:
-          screen = wnck.screen_get_default()
-        else:
-          screen = wnck.Screen.get_default()
+        screen = get_wnck_screen()
         screen.force_update()
         window_list = screen.get_windows()
         for w in window_list:
@@ -307,10 +287,7 @@ class ActivateWindow(Waiter):
     def poll(self):
         while gtk.events_pending():
             gtk.main_iteration()
-        if not gtk3:
-          screen = wnck.screen_get_default()
-        else:
-          screen = wnck.Screen.get_default()
+        screen = get_wnck_screen()
         screen.force_update()
         window_list = screen.get_windows()
         for w in window_list:
@@ -338,10 +315,7 @@ class CloseWindow(Waiter):
     def poll(self):
         while gtk.events_pending():
             gtk.main_iteration()
-        if not gtk3:
-          screen = wnck.screen_get_default()
-        else:
-          screen = wnck.Screen.get_default()
+        screen = get_wnck_screen()
         # Added screen.force_update() based on
         # http://stackoverflow.com/questions/5794309/how-can-i-get-a-list-of-windows-with-wnck-using-pygi
         screen.force_update()
@@ -461,6 +435,24 @@ class ObjectNotExistsWaiter(GuiNotExistsWaiter):
         except:
             self.success = True
 
+class TextChangedWaiter(Waiter):
+    """
+    Wait until condition, a function without arguments, returns true.
+    Checked on text-changed events of obj and every second
+    """
+    events = ['object:text-changed']
+    def __init__(self, obj, condition, timeout):
+        Waiter.__init__(self, timeout)
+        self._obj = obj
+        self._condition = condition
+
+    def poll(self):
+        self.success = bool(self._condition())
+
+    def event_cb(self, event):
+        if event.source == self._obj:
+            self.poll()
+
 if __name__ == "__main__":
     waiter = ObjectExistsWaiter('frmCalculator', 'mnuEitanIsaacsonFoo', 0)
     print(waiter.run())
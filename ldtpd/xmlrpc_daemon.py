@@ -24,9 +24,12 @@ import re
 import time
 
 from twisted.web import xmlrpc
+from twisted.python.failure import Failure
 
 from .core import Ldtpd
 from .log import logger
+from .metrics import metrics, ENV_METRICS_PATH
+from .profiler import profiler
 
 if 'LDTP_COMMAND_DELAY' in os.environ:
     delay = os.environ['LDTP_COMMAND_DELAY']
@@ -35,16 +38,22 @@ else:
 
 _ldtp_debug = os.environ.get('LDTP_DEBUG', None)
 _ldtp_debug_file = os.environ.get('LDTP_DEBUG_FILE', None)
+_metrics_path = os.environ.get(ENV_METRICS_PATH, None)
 
 class XMLRPCLdtpd(Ldtpd, xmlrpc.XMLRPC, object):
     def __new__(cls, *args, **kwargs):
-        for symbol in dir(Ldtpd):
-            if symbol.startswith('_'): 
-                continue
-            obj = getattr(cls, symbol)
-            if not callable(obj):
-                continue
-            setattr(cls, 'xmlrpc_'+symbol, obj)
+        # Bind the xmlrpc_ methods once per class, not per instance
+        if '_xmlrpc_functions' not in cls.__dict__:
+            functions = []
+            for symbol in dir(Ldtpd):
+                if symbol.startswith('_'): 
+                    continue
+                obj = getattr(cls, symbol)
+                if not callable(obj):
+                    continue
+                setattr(cls, 'xmlrpc_'+symbol, obj)
+                functions.append(symbol)
+            cls._xmlrpc_functions = functions
         return object.__new__(cls, *args, **kwargs)
 
     def __init__(self):
@@ -52,8 +61,7 @@ class XMLRPCLdtpd(Ldtpd, xmlrpc.XMLRPC, object):
         Ldtpd.__init__(self)
 
     def _listFunctions(self):
-        return [a[7:] for a in \
-                  filter(lambda x: x.startswith('xmlrpc_'), dir(self))]
+        return list(self._xmlrpc_functions)
     # Starting twisted 11.1
     listProcedures = _listFunctions
 
@@ -71,12 +79,26 @@ class XMLRPCLdtpd(Ldtpd, xmlrpc.XMLRPC, object):
 
             return xmlrpc.Fault(self.FAILURE, value)
 
+    def _observe(self, result, functionPath, start_time):
+        metrics.observe(functionPath, time.time() - start_time,
+                        isinstance(result, (Failure, xmlrpc.Fault)))
+        return result
+
+    if _metrics_path:
+        def render_GET(self, request):
+            if request.path.decode('utf-8') != _metrics_path:
+                request.setResponseCode(404)
+                return b''
+            request.setHeader('content-type',
+                              'text/plain; version=0.0.4')
+            return metrics.prometheus().encode('utf-8')
+
     def render_POST(self, request):
         request.content.seek(0, 0)
         request.setHeader("content-type", "text/xml")
         try:
             content = request.content.read()
-            args, functionPath = xmlrpc.client.loads(content)
+            args, functionPath = xmlrpc.xmlrpclib.loads(content)
             if args and isinstance(args[-1], dict):
                 # Passing args and kwargs to _ldtp_callback
                 # fail, so using self, kind of work around !
@@ -84,7 +106,7 @@ class XMLRPCLdtpd(Ldtpd, xmlrpc.XMLRPC, object):
                 args = args[:-1]
                 if delay or self._delaycmdexec:
                     pattern = '(wait|exist|has|get|verify|enabled|'
-                    pattern += 'launch|image|system)'
+                    pattern += 'launch|image|capture|baseline|screen|system)'
                     p = re.compile(pattern)
                     if not p.search(functionPath):
                         # Sleep for 1 second, else the at-spi-registryd dies,
@@ -115,7 +137,7 @@ class XMLRPCLdtpd(Ldtpd, xmlrpc.XMLRPC, object):
                 if _ldtp_debug:
                     debug_st = '%s(%s)' % \
                         (functionPath,
-                         ', '.join(map(repr, args) + \
+                         ', '.join(list(map(repr, args)) + \
                                        ['%s=%s' % (k, repr(v)) \
                                             for k, v in kwargs.items()]))
                     print(debug_st)
@@ -123,8 +145,14 @@ class XMLRPCLdtpd(Ldtpd, xmlrpc.XMLRPC, object):
                 if _ldtp_debug_file:
                     with open(_ldtp_debug_file, "a") as fp:
                         fp.write(debug_st)
+                if profiler.active:
+                    function = profiler.wrap(functionPath, function)
+                start_time = time.time()
                 xmlrpc.defer.maybeDeferred(function, *args,
                                            **kwargs).\
+                                           addBoth(self._observe,
+                                                   functionPath,
+                                                   start_time).\
                                            addErrback(self._ebRender).\
                                            addCallback(self._cbRender,
                                                        request)
@@ -0,0 +1,236 @@
+"""
+LDTP v2 image comparison.
+
+@license: LGPL
+
+http://ldtp.freedesktop.org
+
+This file may be distributed and/or modified under the terms of the GNU Lesser General
+Public License version 2 as published by the Free Software Foundation. This file
+is distributed without any warranty; without even the implied warranty of
+merchantability or fitness for a particular purpose.
+
+See 'COPYING' in the source distribution for more information.
+
+Headers in this file shall remain intact.
+"""
+
+import re
+
+try:
+    from PIL import Image, ImageChops, ImageDraw
+except ImportError:
+    try:
+        import Image, ImageChops, ImageDraw
+    except ImportError:
+        Image = None
+
+# Rows compared at a time, the threshold is checked after each band
+_tile_size = 128
+
+# Differing regions closer than this, in pixels, are reported as one
+_box_gap = 8
+
+# Differing regions reported, above this only their bounding box is
+_max_boxes = 32
+
+def _open(image):
+    if Image is None:
+        raise Exception('Python-Imaging package not installed')
+    if not isinstance(image, Image.Image):
+        try:
+            image = Image.open(image)
+        except IOError:
+            raise Exception('Input file does not exist')
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+def _channel_tolerance(tolerance):
+    if isinstance(tolerance, (list, tuple)):
+        if len(tolerance) != 3:
+            raise Exception('Tolerance must be one value or (red, green, blue)')
+        return tuple(max(0, min(255, int(t))) for t in tolerance)
+    return (max(0, min(255, int(tolerance))),) * 3
+
+def _ignore_mask(size, mask):
+    """
+    @return: L image, 255 on the ignored pixels
+    @rtype: object
+    """
+    ignore = Image.new('L', size, 0)
+    draw = ImageDraw.Draw(ignore)
+    for x, y, width, height in mask:
+        if width > 0 and height > 0:
+            draw.rectangle((x, y, x + width - 1, y + height - 1), fill=255)
+    return ignore
+
+def _diff_band(band1, band2, luts, ignore):
+    """
+    @return: L image, 255 on the differing pixels, and the channel
+    differences
+    @rtype: tuple
+    """
+    channels = ImageChops.difference(band1, band2).split()
+    red, green, blue = [c.point(lut) for c, lut in zip(channels, luts)]
+    differs = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+    if ignore is not None:
+        differs = ImageChops.subtract(differs, ignore)
+    return differs, channels
+
+def _heatmap_band(band1, differs, channels):
+    # First image dimmed to a third, differing pixels in red, brighter
+    # for larger differences
+    dim = band1.convert('L').point(lambda v: v // 3)
+    magnitude = ImageChops.lighter(ImageChops.lighter(channels[0],
+                                                      channels[1]),
+                                   channels[2])
+    magnitude = ImageChops.darker(magnitude, differs).point(
+        lambda v: 128 + v // 2 if v else 0)
+    red = ImageChops.lighter(dim, magnitude)
+    rest = ImageChops.subtract(dim, differs)
+    return Image.merge('RGB', (red, rest, rest))
+
+def _band_boxes(differs, top, gap):
+    """
+    @return: (left, top, right, bottom) of the runs of differing
+    columns in a band, runs closer than gap are joined
+    @rtype: list
+    """
+    width, height = differs.size
+    # Any differing pixel leaves a non zero column average, for bands
+    # up to 255 rows
+    profile = differs.resize((width, 1), Image.BOX).tobytes()
+    runs = []
+    for match in re.finditer(b'[^\\x00]+', profile):
+        if runs and match.start() - runs[-1][1] <= gap:
+            runs[-1][1] = match.end()
+        else:
+            runs.append([match.start(), match.end()])
+    boxes = []
+    for left, right in runs:
+        bbox = differs.crop((left, 0, right, height)).getbbox()
+        if bbox:
+            boxes.append((left + bbox[0], top + bbox[1],
+                          left + bbox[2], top + bbox[3]))
+    return boxes
+
+def _merge_boxes(merged, boxes, gap):
+    for left, top, right, bottom in boxes:
+        i = 0
+        while i < len(merged):
+            box = merged[i]
+            if box[0] - gap <= right and left <= box[2] + gap and \
+                    box[1] - gap <= bottom and top <= box[3] + gap:
+                left, top = min(left, box[0]), min(top, box[1])
+                right, bottom = max(right, box[2]), max(bottom, box[3])
+                del merged[i]
+                i = 0
+            else:
+                i += 1
+        merged.append((left, top, right, bottom))
+    return merged
+
+def imagediff(imgfile1, imgfile2, tolerance = 0, mask = None,
+              threshold = None, heatmap = False, boxes = False,
+              tile_size = _tile_size):
+    """
+    Compare two images pixel by pixel, see imagecompare
+
+    @param heatmap: Build the heatmap image
+    @type heatmap: boolean
+    @param boxes: Find the differing regions
+    @type boxes: boolean
+
+    @return: Percentage of the compared pixels that differ, the
+    heatmap image or None, the differing regions as (x, y, width,
+    height), at most _max_boxes, or None
+    @rtype: tuple
+    """
+    im1 = _open(imgfile1)
+    im2 = _open(imgfile2)
+    # Compare the common area, as ImageChops.difference does
+    width = min(im1.size[0], im2.size[0])
+    height = min(im1.size[1], im2.size[1])
+    if im1.size != (width, height):
+        im1 = im1.crop((0, 0, width, height))
+    if im2.size != (width, height):
+        im2 = im2.crop((0, 0, width, height))
+
+    luts = [[0] * (t + 1) + [255] * (255 - t) \
+                for t in _channel_tolerance(tolerance)]
+    ignore = _ignore_mask((width, height), mask) if mask else None
+    compared = width * height
+    if ignore is not None:
+        compared -= ignore.histogram()[255]
+    limit = None
+    if threshold is not None and not heatmap and not boxes:
+        limit = compared * threshold / 100.0
+    out = Image.new('RGB', (width, height)) if heatmap else None
+    regions = [] if boxes else None
+
+    tile_size = max(1, tile_size)
+    if boxes:
+        tile_size = min(tile_size, 255)
+    diffcount = 0
+    for top in range(0, height, tile_size):
+        box = (0, top, width, min(top + tile_size, height))
+        band1 = im1.crop(box)
+        differs, channels = _diff_band(band1, im2.crop(box), luts,
+                                       ignore.crop(box) if ignore else None)
+        count = differs.histogram()[255]
+        diffcount += count
+        if out is not None:
+            out.paste(_heatmap_band(band1, differs, channels), box)
+        if regions is not None and count:
+            _merge_boxes(regions, _band_boxes(differs, top, _box_gap),
+                         _box_gap)
+        if limit is not None and diffcount > limit:
+            break
+    if regions is not None:
+        if len(regions) > _max_boxes:
+            regions = [(min(r[0] for r in regions),
+                        min(r[1] for r in regions),
+                        max(r[2] for r in regions),
+                        max(r[3] for r in regions))]
+        regions = [(left, top, right - left, bottom - top) \
+                       for left, top, right, bottom in sorted(
+                regions, key=lambda r: (r[1], r[0]))]
+    percent = diffcount * 100.0 / compared if compared > 0 else 0.0
+    return percent, out, regions
+
+def imagecompare(imgfile1, imgfile2, tolerance = 0, mask = None,
+                 threshold = None, heatmap = None, tile_size = _tile_size):
+    """
+    Compare two images, of the same size, pixel by pixel
+
+    @param imgfile1: Image file name or PIL image
+    @type imgfile1: string
+    @param imgfile2: Image file name or PIL image
+    @type imgfile2: string
+    @param tolerance: Largest channel difference, 0 - 255, ignored
+    when comparing a pixel, or a (red, green, blue) tuple
+    @type tolerance: int
+    @param mask: (x, y, width, height) regions to ignore, eg: a clock
+    or a blinking cursor
+    @type mask: list
+    @param threshold: Percentage of differing pixels after which the
+    comparison stops, the returned percentage is then greater than the
+    threshold, but not the final difference. Not used with heatmap.
+    @type threshold: float
+    @param heatmap: File name, written with the first image dimmed and
+    the differing pixels in red
+    @type heatmap: string
+    @param tile_size: Rows compared at a time
+    @type tile_size: int
+
+    @return: Percentage of the compared pixels that differ, the masked
+    pixels are not counted
+    @rtype: float
+    """
+    percent, out, regions = imagediff(imgfile1, imgfile2, tolerance, mask,
+                                      threshold, bool(heatmap), False,
+                                      tile_size)
+    if out is not None:
+        out.save(heatmap)
+    return percent
@@ -232,6 +232,9 @@ class LdtpClient(xmlrpclib.ServerProxy):
     def setHost(self, host):
         setattr(self, '_ServerProxy__host', host)
 
+# imagecapture file name suffix, by format
+_capture_suffix = {'png' : '.png', 'jpeg' : '.jpg', 'raw' : '.ppm'}
+
 class ooldtp:
     def __init__(self, server='localhost', port=4118):
         self._pollEvents = None
@@ -362,7 +365,8 @@ class ooldtp:
             self._addmethod(getattr(self._client, method), local_name)
 
     def imagecapture(self, window_name = None, out_file = None, x = 0, y = 0,
-                     width = None, height = None):
+                     width = None, height = None, format = 'png',
+                     quality = -1):
         """
         Captures screenshot of the whole desktop or given window
 
@@ -377,12 +381,18 @@ class ooldtp:
         @type width: integer
         @param height: height co-ordinate value
         @type height: integer
+        @param format: png, jpeg, or raw for uncompressed PPM
+        @type format: string
+        @param quality: png compression level, 0 - 9, 0 is the fastest,
+        or jpeg quality, 0 - 100, -1 for the default
+        @type quality: integer
 
         @return: screenshot filename
         @rtype: string
         """
         if not out_file:
-            out_file = tempfile.mktemp('.png', 'ldtp_')
+            out_file = tempfile.mktemp(_capture_suffix.get(format, '.png'),
+                                       'ldtp_')
         else:
             out_file = os.path.expanduser(out_file)
 
@@ -395,7 +405,8 @@ class ooldtp:
             if window_name == None:
                 window_name = ''
         ### Windows compatibility - End
-        data = self._remote_imagecapture(window_name, x, y, width, height)
+        data = self._remote_imagecapture(window_name, x, y, width, height,
+                                         format, quality)
         f = open(out_file, 'wb')
         f.write(b64decode(data))
         f.close()
@@ -423,8 +434,10 @@ class ooldtp:
         return self._remote_doesrowexist(window_name, object_name, row_text, partial_match)
     def getchild(self, window_name, child_name = '', role = '', parent = ''):
         return self._remote_getchild(window_name, child_name, role, parent)
-    def enterstring(self, window_name, object_name = '', data = ''):
-        return self._remote_enterstring(window_name, object_name, data)
+    def enterstring(self, window_name, object_name = '', data = '',
+                    mode = 'keys', verify = False):
+        return self._remote_enterstring(window_name, object_name, data,
+                                        mode, verify)
     def setvalue(self, window_name, object_name, data):
         return self._remote_setvalue(window_name, object_name, float(data))
     def grabfocus(self, window_name, object_name = ''):
@@ -446,6 +459,17 @@ class ooldtp:
     def getcellsize(self, window_name, object_name, row_index, column = 0):
         return self._remote_getcellsize(window_name, object_name, row_index, column)
     def getobjectnameatcoords(self, waitTime = 0):
+        """
+        Get object name at the mouse pointer coordinates
+
+        @param waitTime: Wait time in seconds, before the lookup
+        @type waitTime: double
+
+        @return: window name and object name, or (None, None) if no
+        object. NOTE: the object name is a single name, the list of
+        candidate object names is no longer returned
+        @rtype: (string, string)
+        """
         # FIXME: Yet to implement in Mac, works on Windows/Linux
         return self._remote_getobjectnameatcoords(waitTime)
 
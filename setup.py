@@ -30,7 +30,7 @@ setup(name="ldtp",
       url="http://ldtp.freesktop.org",
       license="GNU Lesser General Public License (LGPL)",
       install_requires=["twisted"],
-      packages=["ldtp", "ldtpd", "ooldtp", "ldtputils", "ldtpme"],
+      packages=["ldtp", "ldtpd", "ldtpd.backends", "ooldtp", "ldtputils", "ldtpme"],
       long_description="Linux Desktop Testing Project is aimed at producing " \
           "high quality cross platform GUI test automation framework and cutting-edge tools that " \
           "can be used to test GNU/Linux/Windows/Mac Desktop and improve it. It uses the " \